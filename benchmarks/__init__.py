@@ -0,0 +1,18 @@
+"""Benchmarks of pycopancore.
+
+- scaling: end-to-end scaling of the bundled models with the number of
+  entities (configuration, initialization, run and saving), run e.g. as
+  ``python -m benchmarks.scaling``.
+- expressions: microbenchmarks of the expression and aggregation engine
+  (private._expressions) on synthetic populations of given size and
+  branching, run e.g. as ``python -m benchmarks.expressions``.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
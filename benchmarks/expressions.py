@@ -0,0 +1,478 @@
+"""Microbenchmarks of the expression and aggregation engine.
+
+Measures the kernels of pycopancore.private._expressions and of Variable
+that the Runner calls while evaluating processes, in isolation from model
+runs:
+
+- _eval of representative expressions (Variables, arithmetic, functions,
+  Piecewise, broadcasting of higher-level values, aggregations, and the
+  expression cache), and the _CompiledExpression of the arithmetic one,
+- _DotConstruct.eval across one and two SetVariable levels, with and
+  without aggregation, and the analysis of its instance structure after
+  the structure changed,
+- the aggregation, broadcast and layout2lens kernels,
+- Variable.fast_set_values and Variable.get_derivatives.
+
+They run on a synthetic population of a given number of Individuals and
+branching: each Cell has branching Individuals and each SocialSystem has
+branching Cells, all in one World. The population's model consists of the
+base component and a synthetic component adding the float Variables
+"value" and "weight" to Individual, Cell and SocialSystem.
+
+Each kernel is called repeatedly (after a warm-up call that also compiles
+numba functions) and the best and median time per call are reported. Each
+population (size and branching) is measured in a fresh python process,
+since entities cannot be removed from a configured model. Results are
+written as JSON; comparing them with those of an earlier run (--baseline)
+lists the kernels that became slower.
+
+Run e.g.::
+
+    python -m benchmarks.expressions --sizes 1000 100000 --branchings 2 10 \\
+        --output expressions.json
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import sympy as sp
+
+from pycopancore import Variable
+from pycopancore.model_components import base
+from pycopancore.private._expressions import _eval, compile_expression, \
+    name2aggregation, broadcast, layout2lens
+from pycopancore.private._structure_version import _StructureVersion
+
+from .scaling import environment
+
+format_version = 1
+"""version of the layout of the JSON results"""
+
+default_sizes = (100, 1000, 10000, 100000)
+"""default numbers of Individuals"""
+
+default_branchings = (2, 10)
+"""default numbers of Individuals per Cell and Cells per SocialSystem"""
+
+
+# synthetic model component:
+
+class _ModelInterface(object):
+    """Interface of the synthetic model component."""
+
+    name = "synthetic population"
+    """a unique name for the model component"""
+    description = "float Variables on Individual, Cell and SocialSystem"
+    """some longer description"""
+    requires = []
+    """list of other model components required for this model component"""
+
+
+class _SocialSystemInterface(object):
+    """Interface of the synthetic SocialSystem mixin."""
+
+    value = Variable("value", "synthetic value", default=1.0)
+    weight = Variable("weight", "synthetic weight", default=1.0)
+
+
+class _CellInterface(object):
+    """Interface of the synthetic Cell mixin."""
+
+    value = Variable("value", "synthetic value", default=1.0)
+    weight = Variable("weight", "synthetic weight", default=1.0)
+
+
+class _IndividualInterface(object):
+    """Interface of the synthetic Individual mixin."""
+
+    value = Variable("value", "synthetic value", default=1.0)
+    weight = Variable("weight", "synthetic weight", default=1.0)
+
+
+class _SocialSystemMixin(_SocialSystemInterface):
+    """Synthetic SocialSystem mixin."""
+
+    processes = []
+
+
+class _CellMixin(_CellInterface):
+    """Synthetic Cell mixin."""
+
+    processes = []
+
+
+class _IndividualMixin(_IndividualInterface):
+    """Synthetic Individual mixin."""
+
+    processes = []
+
+
+class _ModelMixin(_ModelInterface):
+    """Synthetic Model mixin."""
+
+    entity_types = [_SocialSystemMixin, _CellMixin, _IndividualMixin]
+    """list of entity types augmented by this component"""
+    process_taxa = []
+    """list of process taxa augmented by this component"""
+
+
+class World(base.World):
+    """World entity type."""
+
+    pass
+
+
+class SocialSystem(_SocialSystemMixin, base.SocialSystem):
+    """SocialSystem entity type."""
+
+    pass
+
+
+class Cell(_CellMixin, base.Cell):
+    """Cell entity type."""
+
+    pass
+
+
+class Individual(_IndividualMixin, base.Individual):
+    """Individual entity type."""
+
+    pass
+
+
+class Environment(base.Environment):
+    """Environment process taxon."""
+
+    pass
+
+
+class Metabolism(base.Metabolism):
+    """Metabolism process taxon."""
+
+    pass
+
+
+class Culture(base.Culture):
+    """Culture process taxon."""
+
+    pass
+
+
+class Model(_ModelMixin, base.Model):
+    """Model of the synthetic population."""
+
+    name = "synthetic population"
+    """Name of the model"""
+    description = "base component with synthetic float Variables"
+    """Longer description"""
+
+    entity_types = [World, SocialSystem, Cell, Individual]
+    """List of entity types used in the model"""
+    process_taxa = [Environment, Metabolism, Culture]
+    """List of process taxa used in the model"""
+
+
+def population(size, branching, *, seed=0):
+    """Create the synthetic population (in a configured Model) and return
+    the numbers of instances of its entity types.
+
+    Parameters
+    ----------
+    size : int
+        number of Individuals
+    branching : int
+        number of Individuals per Cell and of Cells per SocialSystem (the
+        last ones may have fewer)
+    seed : int, optional
+        random seed of the values and weights
+    """
+    np.random.seed(seed)
+    n_cells = -(-size // branching)
+    n_social_systems = -(-n_cells // branching)
+    world = World(environment=Environment(), metabolism=Metabolism(),
+                  culture=Culture())
+    social_systems = [SocialSystem(world=world)
+                      for s in range(n_social_systems)]
+    cells = [Cell(social_system=social_systems[c // branching])
+             for c in range(n_cells)]
+    individuals = [Individual(cell=cells[i // branching])
+                   for i in range(size)]
+    for entity_type, instances in ((SocialSystem, social_systems),
+                                   (Cell, cells), (Individual, individuals)):
+        for var in (entity_type.value, entity_type.weight):
+            var.set_values(instances, np.random.uniform(size=len(instances)))
+    return {"World": 1, "SocialSystem": n_social_systems, "Cell": n_cells,
+            "Individual": size}
+
+
+# kernels:
+
+def kernels():
+    """Return a list of (name, function) of the kernels to measure on the
+    current population."""
+    value, weight = Individual.value, Individual.weight
+    arithmetic = value * weight + 2 * value ** 2
+    compiled = compile_expression(arithmetic)
+    one_level = Cell.sum.individuals.value
+    two_levels = SocialSystem.sum.cells.individuals.value
+    flat_two_levels = SocialSystem.cells.individuals.value
+    expressions = [
+        ("Variable", value),
+        ("arithmetic", arithmetic),
+        ("functions", sp.log(1 + value) + sp.sqrt(weight)),
+        ("Piecewise", sp.Piecewise((value, weight > .5), (weight, True))),
+        ("broadcast", flat_two_levels * SocialSystem.value),
+        ("aggregation", Cell.value / Cell.social_system.sum.cells.value),
+    ]
+    result = [("_eval " + name, lambda expr=expr: _eval(expr))
+              for name, expr in expressions]
+    result += [
+        ("_eval arithmetic (cached)",
+         lambda: _eval(arithmetic, iteration=0)),
+        ("_CompiledExpression arithmetic", lambda: compiled.eval()),
+    ]
+
+    # _DotConstruct:
+    def reanalysed():
+        _StructureVersion.increase()
+        return flat_two_levels.branchings
+
+    result += [
+        ("_DotConstruct.eval one level", lambda: one_level.eval()),
+        ("_DotConstruct.eval two levels", lambda: two_levels.eval()),
+        ("_DotConstruct.eval one level (no aggregation)",
+         lambda: Cell.individuals.value.eval()),
+        ("_DotConstruct.eval two levels (no aggregation)",
+         lambda: flat_two_levels.eval()),
+        ("_DotConstruct.eval reference",
+         lambda: Individual.cell.social_system.value.eval()),
+        ("_DotConstruct structure analysis", reanalysed),
+    ]
+
+    # aggregation, broadcasting and layouts, on the two-level layout:
+    layout = flat_two_levels.branchings[1:]
+    lens = layout2lens(layout)
+    values = np.random.uniform(size=sum(layout[-1]))
+    group_values = np.random.uniform(size=len(layout[0]))
+    result += [
+        ("aggregation sum",
+         lambda: name2aggregation["sum"](values, lens)),
+        ("aggregation mean",
+         lambda: name2aggregation["mean"](values, lens)),
+        ("broadcast", lambda: broadcast(group_values, layout)),
+        ("layout2lens", lambda: layout2lens(layout)),
+    ]
+
+    # setting values and reading derivatives:
+    new_values = np.random.uniform(size=len(Individual.instances))
+    value.clear_derivatives()
+    result += [
+        ("Variable.fast_set_values",
+         lambda: value.fast_set_values(new_values)),
+        ("Variable.get_derivatives",
+         lambda: value.get_derivatives(Individual.instances)),
+    ]
+    return result
+
+
+def measure(function, *, repeat=5, min_time=0.05):
+    """Return the number of calls per repetition and the best and median
+    time per call in seconds.
+
+    function is called once before (e.g. to compile numba functions),
+    then repeat times as often as needed to take at least min_time
+    seconds."""
+    function()
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 2
+    times = np.array(timer.repeat(repeat, number)) / number
+    return number, float(times.min()), float(np.median(times))
+
+
+def run_population(size, branching, *, columnar=False, seed=0, select=None,
+                   repeat=5, min_time=0.05):
+    """Configure the Model, create a population and measure all kernels
+    (whose names contain select, if given) in this process; return the
+    list of results."""
+    Model(columnar=columnar)
+    entities = population(size, branching, seed=seed)
+    results = []
+    for name, function in kernels():
+        if select is not None and select not in name:
+            continue
+        number, best, median = measure(function, repeat=repeat,
+                                       min_time=min_time)
+        results.append({"kernel": name, "size": size,
+                        "branching": branching, "columnar": columnar,
+                        "entities": entities, "number": number,
+                        "best": best, "median": median})
+    return results
+
+
+def _run_worker(size, branching, *, columnar, seed, select, repeat,
+                min_time, timeout):
+    """Measure one population in a fresh python process and return its
+    results, or raise RuntimeError."""
+    with tempfile.TemporaryDirectory() as directory:
+        result_file = os.path.join(directory, "result.json")
+        command = [sys.executable, "-m", "benchmarks.expressions",
+                   "--worker", result_file, "--sizes", str(size),
+                   "--branchings", str(branching), "--seed", str(seed),
+                   "--repeat", str(repeat), "--min-time", str(min_time)]
+        if columnar:
+            command.append("--columnar")
+        if select is not None:
+            command += ["--select", select]
+        process = subprocess.run(
+            command, cwd=os.path.dirname(os.path.dirname(
+                os.path.abspath(__file__))),
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            timeout=timeout, universal_newlines=True)
+        if process.returncode != 0 or not os.path.exists(result_file):
+            lines = process.stderr.strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else
+                               "exit status %d" % process.returncode)
+        with open(result_file) as f:
+            return json.load(f)
+
+
+def regressions(baseline, current, threshold=1.25):
+    """Return the list of (kernel, size, branching, columnar, baseline
+    seconds, current seconds) of the kernels whose best time per call in
+    current is more than threshold times that in baseline (two results as
+    written by main())."""
+    def key(result):
+        return (result["kernel"], result["size"], result["branching"],
+                result["columnar"])
+    old = {key(result): result["best"] for result in baseline["results"]}
+    found = []
+    for result in current["results"]:
+        t_old = old.get(key(result))
+        if t_old is not None and result["best"] > threshold * t_old:
+            found.append(key(result) + (t_old, result["best"]))
+    return found
+
+
+def _table(results):
+    """Return a human-readable table of the results."""
+    line = "%-46s %8s %9s %12s %12s"
+    lines = [line % ("kernel", "size", "branching", "best [us]",
+                     "median [us]")]
+    for result in results:
+        lines.append(line % (result["kernel"], result["size"],
+                             result["branching"],
+                             "%.2f" % (result["best"] * 1e6),
+                             "%.2f" % (result["median"] * 1e6)))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Microbenchmarks of the expression and aggregation "
+                    "engine.")
+    parser.add_argument("--sizes", nargs="+", type=int,
+                        default=list(default_sizes),
+                        help="numbers of Individuals")
+    parser.add_argument("--branchings", nargs="+", type=int,
+                        default=list(default_branchings),
+                        help="numbers of Individuals per Cell and of Cells "
+                             "per SocialSystem")
+    parser.add_argument("--columnar", action="store_true",
+                        help="configure the model as columnar")
+    parser.add_argument("--select", default=None,
+                        help="only measure kernels whose name contains "
+                             "this string")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of repetitions per kernel")
+    parser.add_argument("--min-time", type=float, default=0.05,
+                        help="minimum seconds per repetition")
+    parser.add_argument("--timeout", type=float, default=3600,
+                        help="maximum seconds per population")
+    parser.add_argument("--output", default="expressions.json",
+                        help="JSON file to write the results to")
+    parser.add_argument("--baseline", default=None,
+                        help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown factor reported as regression")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker is not None:
+        # measure a single population in this process:
+        results = run_population(args.sizes[0], args.branchings[0],
+                                 columnar=args.columnar, seed=args.seed,
+                                 select=args.select, repeat=args.repeat,
+                                 min_time=args.min_time)
+        with open(args.worker, "w") as f:
+            json.dump(results, f)
+        return 0
+
+    results = []
+    failures = []
+    for size in sorted(args.sizes):
+        for branching in sorted(args.branchings):
+            try:
+                population_results = _run_worker(
+                    size, branching, columnar=args.columnar,
+                    seed=args.seed, select=args.select, repeat=args.repeat,
+                    min_time=args.min_time, timeout=args.timeout)
+            except (RuntimeError, subprocess.TimeoutExpired) as e:
+                failures.append({"size": size, "branching": branching,
+                                 "error": str(e)})
+                print("size %d, branching %d failed: %s"
+                      % (size, branching, e), flush=True)
+                continue
+            results += population_results
+            print(_table(population_results), flush=True)
+
+    report = {"format-version": format_version,
+              "created": datetime.datetime.now(
+                  datetime.timezone.utc).isoformat(),
+              "environment": environment(),
+              "settings": {"sizes": sorted(args.sizes),
+                           "branchings": sorted(args.branchings),
+                           "columnar": args.columnar, "seed": args.seed,
+                           "repeat": args.repeat,
+                           "min_time": args.min_time},
+              "results": results,
+              "failures": failures}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(baseline, report, threshold=args.threshold)
+        print()
+        print("%d regressions (slower by more than a factor %s):"
+              % (len(found), args.threshold))
+        for kernel, size, branching, columnar, t_old, t_new in found:
+            print("%-46s %8d %9d %.2f -> %.2f us"
+                  % (kernel, size, branching, t_old * 1e6, t_new * 1e6))
+        return 1 if found else 0
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,597 @@
+"""End-to-end scaling benchmark of the bundled models.
+
+Builds the models exodus, adaptive_voter_model, seven_dwarfs, example1,
+example2 and coccon (full) with a given number of Individuals (the other
+entity types scale with it, see the builders below) and measures the
+wall-clock time of the stages
+
+- "import": importing the model module,
+- "configure": instantiating (and thereby configuring) the Model,
+- "initialize": creating and initializing the entities and process taxa,
+- "run": Runner.run,
+- "save": saving the trajectory (as npz by default),
+
+and the peak resident memory of the process after each stage. Each case
+(model and size) runs in a fresh python process, so that models do not
+interfere and peak memory is measured per case.
+
+The results are written as JSON, together with a description of the
+environment and the complexity exponents of each stage, i.e. the slopes of
+log(time) over log(size) fitted to the successful cases. Comparing the
+results with those of an earlier run (--baseline) lists the stages that
+became slower.
+
+Run e.g.::
+
+    python -m benchmarks.scaling --models seven_dwarfs coccon \\
+        --sizes 10 100 1000 --output scaling.json
+
+Models whose dependencies are missing or that fail are recorded with their
+error; after a failure or timeout, the larger sizes of that model are
+skipped. The default durations of the runs are much shorter than in the
+studies' run scripts so that large sizes remain feasible.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+import numpy as np
+
+format_version = 1
+"""version of the layout of the JSON results"""
+
+stages = ("import", "configure", "initialize", "run", "save")
+"""timed stages of each case"""
+
+default_sizes = (10, 100, 1000, 10000, 100000)
+"""default numbers of Individuals"""
+
+min_fit_size = 100
+"""smallest size used for fitting complexity exponents (smaller cases are
+dominated by constant overheads)"""
+
+
+# builders:
+
+def _random_edges(nodes, degree):
+    """Return about len(nodes) * degree / 2 random edges between nodes
+    (an Erdos-Renyi-like graph of the given expected degree, drawn in time
+    linear in the number of edges)."""
+    n = len(nodes)
+    if n < 2:
+        return []
+    m = n * degree // 2
+    first = np.random.randint(n, size=m).tolist()
+    second = np.random.randint(n, size=m).tolist()
+    return [(nodes[i], nodes[j]) for i, j in zip(first, second) if i != j]
+
+
+def _seven_dwarfs(M, size):
+    """Dwarfs in caves of seven dwarfs each (cf. run_seven_dwarfs.py).
+    Each cave has its own SocialSystem since all dwarfs of a SocialSystem
+    get acquainted with each other."""
+    culture = M.Culture()
+    world = M.World(culture=culture)
+    cells = [M.Cell(social_system=M.SocialSystem(world=world),
+                    eating_stock=100)
+             for c in range(max(1, size // 7))]
+    for i in range(size):
+        M.Individual(cell=cells[i % len(cells)], age=0, beard_length=0,
+                     beard_growth_parameter=0.5, eating_parameter=.1)
+    return {"runner": {"termination_calls": [[M.Culture.check_for_extinction,
+                                              culture]]},
+            "run": {"t_0": 0, "t_1": 10, "dt": .1}}
+
+
+def _adaptive_voter_model(M, size):
+    """Voters in one cell on a random network of expected degree 10 (cf.
+    run_adaptive_voter_model.py)."""
+    culture = M.Culture(rewiring=0.1)
+    world = M.World(culture=culture)
+    social_system = M.SocialSystem(world=world, culture=culture)
+    cell = M.Cell(world=world, social_system=social_system)
+    individuals = [M.Individual(cell=cell,
+                                initial_opinion=int(np.random.rand() < .7))
+                   for i in range(size)]
+    culture.acquaintance_network.add_edges_from(
+        _random_edges(individuals, 10))
+    return {"runner": {}, "run": {"t_0": 0, "t_1": 10, "dt": .1}}
+
+
+def _exodus(M, size):
+    """Farmers and townsmen in one farmland cell and one city per 200
+    Individuals (cf. run_exodus.py)."""
+    n_places = max(1, size // 200)
+    n_farmers = size // 2
+    culture = M.Culture(fully_connected_network=True)
+    metabolism = M.Metabolism(market_frequency=1)
+    world = M.World(culture=culture, metabolism=metabolism, water_price=.1)
+    municipalities = [M.SocialSystem(world=world, municipality_like=True,
+                                     base_mean_income=6130,
+                                     scaling_parameter=1.12,
+                                     migration_cost=0,
+                                     last_one_standing=False,
+                                     continuous_exploration=False)
+                      for m in range(n_places)]
+    counties = [M.SocialSystem(world=world, municipality_like=False,
+                               migration_cost=0, last_one_standing=False,
+                               continuous_exploration=False)
+                for c in range(n_places)]
+    farmland_cells = [M.Cell(world=world, social_system=county,
+                             characteristic='farmland',
+                             land_area=0.0025 * size / n_places,
+                             average_precipitation=0.75)
+                      for county in counties]
+    city_cells = [M.Cell(world=world, social_system=municipality,
+                         characteristic='city', average_precipitation=0)
+                  for municipality in municipalities]
+    for i in range(size):
+        if i < n_farmers:
+            M.Individual(cell=farmland_cells[i % n_places],
+                         profession='farmer', outspokenness=3,
+                         liquidity=np.random.lognormal(np.log(300), .34),
+                         nutrition=1000)
+        else:
+            M.Individual(cell=city_cells[i % n_places],
+                         profession='townsman', outspokenness=3,
+                         liquidity=np.random.lognormal(np.log(700), .34),
+                         nutrition=100)
+    # initial values of the aggregates, as in run_exodus.py:
+    for social_system in M.SocialSystem.instances:
+        social_system.calc_population(0)
+        social_system.calculate_mean_income_or_farmsize(0)
+        social_system.calculate_average_liquidity(0)
+    for individual in M.Individual.instances:
+        individual.calc_farm_size()
+        individual.calc_gross_income()
+        individual.calculate_harvest(0)
+        individual.calculate_utility(0)
+    for social_system in M.SocialSystem.instances:
+        social_system.calculate_average_utility(0)
+        social_system.calculate_gini(0)
+        social_system.calculate_migration_rate(0)
+    world.calc_total_gross_income(0)
+    world.calc_total_harvest(0)
+    world.calc_total_nutrition(0)
+    world.calc_total_liquidity(0)
+    metabolism.do_market_clearing(0)
+    return {"runner": {"termination_calls": [
+                [M.Metabolism.check_for_market_equilibrium, metabolism],
+                [M.World.check_for_exceptions, world]]},
+            "run": {"t_0": 0, "t_1": 20, "dt": .1}}
+
+
+def _copan_global_like(M, size, *, metabolism, culture, social_system):
+    """One World, one SocialSystem per 100 and one Cell per 10
+    Individuals, a random acquaintance network of expected degree 10, and
+    global stocks distributed at random (cf. coccon_tutorial.py).
+    metabolism, culture and social_system are the keyword arguments of the
+    process taxa and SocialSystems."""
+    from pycopancore import master_data_model as D
+    n_socs = max(1, size // 100)
+    n_cells = max(1, size // 10)
+    culture = M.Culture(**culture)
+    world = M.World(environment=M.Environment(),
+                    metabolism=M.Metabolism(**metabolism),
+                    culture=culture,
+                    atmospheric_carbon=830 * D.gigatonnes_carbon,
+                    upper_ocean_carbon=(5500 - 830 - 2480 - 1125)
+                    * D.gigatonnes_carbon)
+    social_systems = [M.SocialSystem(world=world, **social_system)
+                      for s in range(n_socs)]
+    cells = [M.Cell(social_system=social_systems[c % n_socs],
+                    renewable_sector_productivity=2 * np.random.rand()
+                    * M.Cell.renewable_sector_productivity.default)
+             for c in range(n_cells)]
+    individuals = [M.Individual(cell=cells[i % n_cells],
+                                is_environmentally_friendly=bool(
+                                    np.random.rand() < .3))
+                   for i in range(size)]
+    culture.acquaintance_network.add_edges_from(
+        _random_edges(individuals, 10))
+
+    r = np.random.uniform(size=n_cells)
+    M.Cell.land_area.set_values(cells,
+                                1.5e8 * D.square_kilometers * r / sum(r))
+    r += np.random.uniform(size=n_cells)
+    L0 = 2480 * D.gigatonnes_carbon * r / sum(r)
+    M.Cell.terrestrial_carbon.set_values(cells, L0)
+    if hasattr(M.Cell, "mean_past_terrestrial_carbon"):
+        M.Cell.mean_past_terrestrial_carbon.set_values(cells, L0)
+    r = np.exp(np.random.normal(size=n_cells))
+    M.Cell.fossil_carbon.set_values(cells,
+                                    1125 * D.gigatonnes_carbon * r / sum(r))
+    r = np.random.uniform(size=n_socs)
+    P0 = 6e9 * D.people * r / sum(r)
+    M.SocialSystem.population.set_values(social_systems, P0)
+    if hasattr(M.SocialSystem, "migrant_population"):
+        M.SocialSystem.migrant_population.set_values(social_systems,
+                                                     P0 * 250e6 / 6e9)
+    if hasattr(M.SocialSystem, "max_protected_terrestrial_carbon"):
+        for s in social_systems:
+            s.max_protected_terrestrial_carbon = \
+                0.90 * sum(c.terrestrial_carbon for c in s.cells)
+    r = np.random.uniform(size=n_socs)
+    M.SocialSystem.physical_capital.set_values(
+        social_systems, sum(P0) * 1e4 * D.dollars / D.people * r / sum(r))
+    r = np.random.uniform(size=n_socs)
+    M.SocialSystem.renewable_energy_knowledge.set_values(
+        social_systems, 1e12 * D.gigajoules * r / r.mean())
+    return {"runner": {}, "run": {"t_0": 2000, "t_1": 2010, "dt": 1}}
+
+
+def _example1(M, size):
+    """cf. run_example1.py"""
+    return _copan_global_like(
+        M, size,
+        metabolism=dict(renewable_energy_knowledge_spillover_fraction=.1,
+                        basic_emigration_probability_rate=16e-13),
+        culture=dict(awareness_lower_carbon_density=1e-4,
+                     awareness_upper_carbon_density=2e-4,
+                     awareness_update_rate=10,
+                     environmental_friendliness_learning_rate=1,
+                     max_protected_terrestrial_carbon_share=0,
+                     terrestrial_carbon_averaging_time=10),
+        social_system=dict(has_renewable_subsidy=False,
+                           has_emissions_tax=False, has_fossil_ban=False,
+                           time_between_votes=4))
+
+
+def _example2(M, size):
+    """cf. run_example2.py"""
+    return _copan_global_like(
+        M, size,
+        metabolism=dict(renewable_energy_knowledge_spillover_fraction=0),
+        culture=dict(awareness_lower_carbon_density=1e-5,
+                     awareness_upper_carbon_density=4e-5,
+                     awareness_update_rate=1,
+                     environmental_friendliness_learning_rate=1),
+        social_system=dict(has_renewable_subsidy=False,
+                           has_emissions_tax=False, has_fossil_ban=False,
+                           time_between_votes=4))
+
+
+def _coccon(M, size):
+    """cf. coccon_tutorial.py"""
+    return _copan_global_like(
+        M, size,
+        metabolism=dict(renewable_energy_knowledge_spillover_fraction=0,
+                        basic_emigration_probability_rate=0),
+        culture=dict(awareness_lower_carbon_density=1e-4,
+                     awareness_upper_carbon_density=2e-4,
+                     awareness_update_rate=0,
+                     environmental_friendliness_learning_rate=0),
+        social_system=dict(time_between_votes=1e100))
+
+
+models = {
+    "exodus": ("pycopancore.models.exodus", _exodus),
+    "adaptive_voter_model": ("pycopancore.models.adaptive_voter_model",
+                             _adaptive_voter_model),
+    "seven_dwarfs": ("pycopancore.models.seven_dwarfs", _seven_dwarfs),
+    "example1": ("pycopancore.models.example1", _example1),
+    "example2": ("pycopancore.models.example2", _example2),
+    "coccon": ("pycopancore.models.coccon.full", _coccon),
+}
+"""dict mapping model names to their module and builder. A builder creates
+the entities and process taxa of a configured model for a given number of
+Individuals and returns a dict with the keyword arguments of the Runner
+("runner") and of Runner.run ("run")."""
+
+
+# measuring one case:
+
+def _peak_rss():
+    """Return the peak resident memory of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(model_name, size, *, seed=0, duration=None, data_type='npz',
+             timing=False):
+    """Build and run one model in this process and return the measured
+    times (in seconds) and peak memory (in bytes) of each stage.
+
+    Parameters
+    ----------
+    model_name : str
+        a key of models
+    size : int
+        number of Individuals
+    seed : int, optional
+        random seed
+    duration : float, optional
+        time span of the run (default: the builder's)
+    data_type : str, optional
+        format in which the trajectory is saved (see
+        _TrajectoryDictionary.save)
+    timing : bool, optional
+        whether to also report the Runner's times per phase (see
+        _ProcessTimer)
+    """
+    module_name, builder = models[model_name]
+    result = {"model": model_name, "size": size, "status": "ok",
+              "times": {}, "peak_rss": {}}
+
+    def done(stage, start):
+        result["times"][stage] = perf_counter() - start
+        result["peak_rss"][stage] = _peak_rss()
+
+    start = perf_counter()
+    M = importlib.import_module(module_name)
+    from pycopancore import set_seed
+    from pycopancore.runners import Runner
+    done("import", start)
+
+    start = perf_counter()
+    model = M.Model()
+    done("configure", start)
+
+    set_seed(seed)
+    start = perf_counter()
+    spec = builder(M, size)
+    done("initialize", start)
+    result["entities"] = {entity_type.__name__: len(entity_type.instances)
+                          for entity_type in model.entity_types}
+
+    run_kwargs = dict(spec["run"])
+    if duration is not None:
+        run_kwargs["t_1"] = run_kwargs["t_0"] + duration
+    result["run_arguments"] = run_kwargs
+    runner = Runner(model=model, **spec["runner"])
+    start = perf_counter()
+    trajectory = runner.run(timing=timing, **run_kwargs)
+    done("run", start)
+    result["n_times"] = len(trajectory['t'])
+    if timing:
+        result["phases"] = runner.timer.phase_totals()
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = perf_counter()
+        trajectory.save(filename="trajectory", path=directory,
+                        data_type=data_type)
+        done("save", start)
+        result["file_size"] = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, dirs, names in os.walk(directory) for name in names)
+    return result
+
+
+def _run_worker(model_name, size, *, seed, duration, data_type, timing,
+                timeout):
+    """Run one case in a fresh python process and return its result."""
+    with tempfile.TemporaryDirectory() as directory:
+        result_file = os.path.join(directory, "result.json")
+        command = [sys.executable, "-m", "benchmarks.scaling", "--worker",
+                   result_file, "--models", model_name,
+                   "--sizes", str(size), "--seed", str(seed),
+                   "--data-type", data_type]
+        if duration is not None:
+            command += ["--duration", str(duration)]
+        if timing:
+            command.append("--timing")
+        try:
+            process = subprocess.run(
+                command, cwd=os.path.dirname(os.path.dirname(
+                    os.path.abspath(__file__))),
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                timeout=timeout, universal_newlines=True)
+        except subprocess.TimeoutExpired:
+            return {"model": model_name, "size": size, "status": "timeout",
+                    "error": "no result after %s seconds" % timeout}
+        if process.returncode == 0 and os.path.exists(result_file):
+            with open(result_file) as f:
+                return json.load(f)
+        lines = process.stderr.strip().splitlines()
+        return {"model": model_name, "size": size, "status": "failed",
+                "error": lines[-1] if lines else
+                "exit status %d" % process.returncode}
+
+
+# analysis:
+
+def exponents(results):
+    """Return a dict mapping each model to a dict mapping each stage (and
+    "peak_rss") to the slope of log(value) over log(size), fitted to the
+    successful cases of at least min_fit_size Individuals (or None if
+    there are fewer than two)."""
+    fitted = {}
+    for model_name in sorted({result["model"] for result in results}):
+        cases = [result for result in results
+                 if result["model"] == model_name
+                 and result["status"] == "ok"
+                 and result["size"] >= min_fit_size]
+        slopes = fitted[model_name] = {}
+        for stage in stages[1:] + ("peak_rss",):
+            points = [(result["size"],
+                       result["peak_rss"]["save"] if stage == "peak_rss"
+                       else result["times"][stage])
+                      for result in cases]
+            points = [(size, value) for size, value in points if value > 0]
+            if len({size for size, value in points}) < 2:
+                slopes[stage] = None
+                continue
+            sizes, values = np.log(np.array(points, dtype=float)).T
+            slopes[stage] = float(np.polyfit(sizes, values, 1)[0])
+    return fitted
+
+
+def regressions(baseline, current, threshold=1.25, min_seconds=0.01):
+    """Return the list of (model, size, stage, baseline seconds, current
+    seconds) of the stages that took more than threshold times as long in
+    current as in baseline (two results as written by main()), ignoring
+    stages shorter than min_seconds."""
+    old = {(result["model"], result["size"]): result
+           for result in baseline["results"] if result["status"] == "ok"}
+    found = []
+    for result in current["results"]:
+        before = old.get((result["model"], result["size"]))
+        if result["status"] != "ok" or before is None:
+            continue
+        for stage in stages:
+            t_old = before["times"].get(stage)
+            t_new = result["times"].get(stage)
+            if t_old is None or t_new is None or t_new < min_seconds:
+                continue
+            if t_new > threshold * t_old:
+                found.append((result["model"], result["size"], stage,
+                              t_old, t_new))
+    return found
+
+
+def environment():
+    """Return a description of the environment the benchmark runs in."""
+    description = {"python": platform.python_version(),
+                   "implementation": platform.python_implementation(),
+                   "platform": platform.platform(),
+                   "processor": platform.processor(),
+                   "cpu_count": os.cpu_count(),
+                   "packages": {}}
+    for package in ("numpy", "scipy", "sympy", "networkx", "numba"):
+        try:
+            description["packages"][package] = \
+                importlib.import_module(package).__version__
+        except (ImportError, AttributeError):
+            description["packages"][package] = None
+    try:
+        description["commit"] = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        description["commit"] = None
+    return description
+
+
+def _table(results):
+    """Return a human-readable table of the results."""
+    line = "%-22s %8s %9s" + " %11s" * (len(stages) - 1) + " %10s"
+    lines = [line % (("model", "size", "status") + stages[1:]
+                     + ("peak MiB",))]
+    for result in results:
+        if result["status"] == "ok":
+            lines.append(line % ((result["model"], result["size"], "ok")
+                                 + tuple("%.4f" % result["times"][stage]
+                                         for stage in stages[1:])
+                                 + ("%.1f" % (result["peak_rss"]["save"]
+                                              / 2**20),)))
+        else:
+            lines.append("%-22s %8s %9s  %s" % (result["model"],
+                                                result["size"],
+                                                result["status"],
+                                                result.get("error", "")))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="End-to-end scaling benchmark of the bundled models.")
+    parser.add_argument("--models", nargs="+", choices=sorted(models),
+                        default=list(models))
+    parser.add_argument("--sizes", nargs="+", type=int,
+                        default=list(default_sizes),
+                        help="numbers of Individuals")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="time span of each run (default: per model)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-type", default="npz",
+                        choices=["pickle", "json", "hdf5", "npz", "npy"],
+                        help="format in which trajectories are saved")
+    parser.add_argument("--timing", action="store_true",
+                        help="also report the Runner's times per phase")
+    parser.add_argument("--timeout", type=float, default=3600,
+                        help="maximum seconds per case")
+    parser.add_argument("--output", default="scaling.json",
+                        help="JSON file to write the results to")
+    parser.add_argument("--baseline", default=None,
+                        help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown factor reported as regression")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker is not None:
+        # run a single case in this process:
+        result = run_case(args.models[0], args.sizes[0], seed=args.seed,
+                          duration=args.duration, data_type=args.data_type,
+                          timing=args.timing)
+        with open(args.worker, "w") as f:
+            json.dump(result, f)
+        return 0
+
+    results = []
+    for model_name in args.models:
+        failed = None
+        for size in sorted(args.sizes):
+            if failed is not None:
+                results.append({"model": model_name, "size": size,
+                                "status": "skipped",
+                                "error": "size %d %s" % failed})
+                continue
+            result = _run_worker(model_name, size, seed=args.seed,
+                                 duration=args.duration,
+                                 data_type=args.data_type,
+                                 timing=args.timing, timeout=args.timeout)
+            results.append(result)
+            print(_table([result]).splitlines()[-1], flush=True)
+            if result["status"] != "ok":
+                failed = (size, result["status"])
+
+    report = {"format-version": format_version,
+              "created": datetime.datetime.now(
+                  datetime.timezone.utc).isoformat(),
+              "environment": environment(),
+              "settings": {"sizes": sorted(args.sizes),
+                           "duration": args.duration, "seed": args.seed,
+                           "data_type": args.data_type,
+                           "timeout": args.timeout},
+              "stages": list(stages),
+              "results": results,
+              "exponents": exponents(results)}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+
+    print()
+    print(_table(results))
+    print()
+    print("complexity exponents:")
+    for model_name, slopes in report["exponents"].items():
+        print("%-22s " % model_name
+              + "  ".join("%s %s" % (stage, "-" if slope is None
+                                     else "%.2f" % slope)
+                          for stage, slope in slopes.items()))
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(baseline, report, threshold=args.threshold)
+        print()
+        print("%d regressions (slower by more than a factor %s):"
+              % (len(found), args.threshold))
+        for model_name, size, stage, t_old, t_new in found:
+            print("%-22s %8d %-10s %.4f -> %.4f s" % (model_name, size,
+                                                       stage, t_old, t_new))
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
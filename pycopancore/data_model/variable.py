@@ -509,9 +509,21 @@ class Variable(Symbol):
             # TODO: deal with possible interferences between bounds and quantum
             self.set_value(i, v)
 
+    def _get_store(self):
+        """return the _ColumnarStore holding this Variable's values
+        if the model was configured as columnar, otherwise None"""
+        oc = self.owning_class
+        store = oc._columnar_store if oc is not None else None
+        if store is not None and self.codename in store.values:
+            return store
+        return None
+
     def fast_set_values(self, values):
         """fast-track method to set values without checks and conversions"""
         cn = self.codename
+        store = self._get_store()
+        if store is not None and store.write(cn, store.rows(), values):
+            return
         if values.size > 1:
             for i, inst in enumerate(self.owning_class.instances):
                 setattr(inst, cn, values[i])
@@ -577,6 +589,11 @@ class Variable(Symbol):
         -------
 
         """
+        if instances is None:
+            store = self._get_store()
+            if store is not None:
+                store.derivatives[self.codename][store.rows()] = 0
+                return
         instances = self._get_instances(instances)
         for i in instances:
             setattr(i, 'd_' + self.codename, 0)
@@ -595,10 +612,18 @@ class Variable(Symbol):
         -------
 
         """
+        if instances is self.owning_class.instances:
+            store = self._get_store()
+            if store is not None:
+                return store.derivatives[self.codename][store.rows()]
         return [getattr(i, 'd_' + self.codename) for i in instances]
 
     def add_derivatives(self, values):
         """adds summands to referenced attribute values"""
+        store = self._get_store()
+        if store is not None:
+            store.derivatives[self.codename][store.rows()] += values
+            return
         dname = "d_" + self.codename
         for pos, i in enumerate(self.target_instances):
             setattr(i, dname, getattr(i, dname) + values[pos])
@@ -649,6 +674,12 @@ class Variable(Symbol):
             instances = self.owning_class.instances
         if unit is None:
             cn = self.codename
+            if instances is self.owning_class.instances:
+                store = self._get_store()
+                if store is not None:
+                    values = store.read(cn, store.rows())
+                    if values is not None:
+                        return values
             return [getattr(inst, cn) for inst in instances]
         else:
             return [self.get_value(inst, unit=unit) for inst in instances]
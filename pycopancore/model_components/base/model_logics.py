@@ -19,12 +19,16 @@ from .. import abstract
 from ... import Variable, ReferenceVariable, SetVariable, \
                 ODE, Explicit, Step, Event, OrderedSet
 from ...private import _AbstractProcess, unknown, _expressions, \
-    _AbstractEntityMixin, _AbstractProcessTaxonMixin
+    _AbstractEntityMixin, _AbstractProcessTaxonMixin, _ColumnarStore, \
+    _SymbolicJacobian, _NotDifferentiable, _StructureVersion
 import gc
 import inspect
+import logging
 import re
 import numpy as np
-from networkx import DiGraph, write_graphml
+from networkx import DiGraph, find_cycle, write_graphml
+
+logger = logging.getLogger(__name__)
 
 
 # helper function:
@@ -51,6 +55,12 @@ class ModelLogics (object):
 
     _configured = False
     """whether model was configured already"""
+    columnar = False
+    """whether Variable values are stored in per-class numpy arrays"""
+    analytic_jacobian = False
+    """whether all specifications the ODE derivatives depend on were
+    differentiated symbolically, so that the Jacobian can be evaluated
+    analytically"""
 
     components = None
     """ordered set of model components in method resolution order"""
@@ -76,6 +86,12 @@ class ModelLogics (object):
     """ordered set of processes of type ODE"""
     explicit_processes = None
     """ordered set of processes of type Explicit"""
+    RHS_explicit_processes = None
+    """ordered set of processes of type Explicit whose targets the ODE
+    derivatives depend on, directly or indirectly"""
+    output_explicit_processes = None
+    """ordered set of the remaining processes of type Explicit, which need
+    not be applied during ODE integration"""
     step_processes = None
     """ordered set of processes of type Step"""
     event_processes = None
@@ -88,19 +104,34 @@ class ModelLogics (object):
     """dict giving for each explicit target variable the set of vars occurring on RHS of equation"""
     ODE_dependencies = None
     """dict giving for each ODE target variable the set of vars occurring on RHS of equation"""
+    guessed_dependencies = None
+    """set of target variables whose dependencies were only guessed from
+    the source code of some specification method"""
     explicit_evaluation_order = None
     """list of explicit target Variables in planned order of evaluation"""
+    explicit_process_levels = None
+    """list of lists of processes of type Explicit, such that each process
+    only depends on processes of lower levels; explicit_processes is
+    ordered by these levels"""
+    explicit_processes_ordered = False
+    """whether explicit_processes respects all known dependencies among
+    processes of type Explicit, i.e., no dependencies had to be ignored to
+    resolve cycles, so that applying them once gives consistent values"""
 
     def __init__(self,
                  *,
                  reconfigure=False,
+                 columnar=False,
+                 analytic_jacobian=False,
                  **kwargs):
         """Upon initialization of model: configure if not yet configured."""
         if not self.__class__._configured:
-            self.configure(reconfigure=reconfigure)
+            self.configure(reconfigure=reconfigure, columnar=columnar,
+                           analytic_jacobian=analytic_jacobian)
 
     @classmethod
-    def configure(cls, reconfigure=False, **kwargs):
+    def configure(cls, reconfigure=False, columnar=False,
+                  analytic_jacobian=False, **kwargs):
         """Configure the model.
 
         This classmethod configures the model by analysing the model's and all
@@ -114,6 +145,17 @@ class ModelLogics (object):
         reconfigure : bool
             Flag that indicates if the model should be reconfigured even if
             it is already configured
+        columnar : bool
+            Flag that indicates if the values of float-valued Variables (and
+            their derivatives) shall be stored in one numpy array per
+            Variable and entity-type/taxon rather than as attributes of each
+            instance, which allows the runner to read and write whole columns
+            without Python loops (default: False)
+        analytic_jacobian : bool
+            Flag that indicates if symbolic ODE and Explicit specifications
+            shall be differentiated w.r.t. all Variables that change during
+            ODE integration, so that implicit solvers can use the analytic
+            Jacobian instead of finite differences (default: False)
         """
         if cls._configured and not reconfigure:
             raise ConfigureError("This model is already configured. "
@@ -141,10 +183,11 @@ class ModelLogics (object):
 
         cls.explicit_dependencies = {}
         cls.ODE_dependencies = {}
+        cls.guessed_dependencies = set()
 
         # start the extensive log output:
-        print("\nConfiguring model", cls.name, "(", cls, ") ...")
-        print("Analysing model structure...\n")
+        logger.info("Configuring model %s (%s) ...", cls.name, cls)
+        logger.info("Analysing model structure...")
 
         variable_pool = OrderedSet()  # temp. list of all variables found
 
@@ -164,16 +207,16 @@ class ModelLogics (object):
         # iterate through all model components:
         for component in cls.components:
             component_interface = component.__bases__[0]  # the first base class of an impl. cl. is its interface
-            print("Model component ", component_interface.name, "(", component,
-                  ")...")
+            logger.info("Model component %s (%s)...",
+                        component_interface.name, component)
             # iterate through all entity-type and process taxon mixins this
             # model components defines:
             for mixin in component.entity_types + component.process_taxa:
                 mixin_interface = mixin.__bases__[0]  # interface of this mixin
                 if mixin in component.entity_types:
-                    print("    Entity-type ", mixin)
+                    logger.debug("    Entity-type %s", mixin)
                 else:
-                    print("    Process taxon ", mixin)
+                    logger.debug("    Process taxon %s", mixin)
                 # find and register all Variables defined directly in this
                 # mixin's interface:
                 for (k, v) in mixin_interface.__dict__.items():  # k is the attribute's name (here the variable name), v the attribute's value (here the Variable object)
@@ -183,9 +226,9 @@ class ModelLogics (object):
                             # store codename in Variable object for convenience:
                             v.codename = k
                             variable_pool.add(v)
-                            print("        Variable ", v)
+                            logger.debug("        Variable %s", v)
                         else:  # same Var. has been registered in another component or mixin already:
-                            print("        Variable ", v)
+                            logger.debug("        Variable %s", v)
                             # make sure all mixins use the same codename
                             # for this Var.:
                             assert v.codename == k, \
@@ -198,7 +241,7 @@ class ModelLogics (object):
                     assert isinstance(p, _AbstractProcess), \
                         "The 'processes' attribute of an implementation " \
                         "class must only contain process objects."
-                    print("        Process ", p)
+                    logger.debug("        Process %s", p)
                     # other than variables, the same process cannot be named
                     # by more than one mixin:
                     assert p not in cls.processes, \
@@ -208,12 +251,12 @@ class ModelLogics (object):
 
         # now iterate again through all composed entity-types and process taxa,
         # output all found variables and complete the composed class' logics:
-        print("\nVariables:")
+        logger.debug("Variables:")
         for composed_class in cls.entity_types + cls.process_taxa:
             if composed_class in cls.entity_types:
-                print("  Entity-type ", composed_class)
+                logger.debug("  Entity-type %s", composed_class)
             else:
-                print("  Process taxon ", composed_class)
+                logger.debug("  Process taxon %s", composed_class)
             # initialize empty list of instances:
             composed_class.instances = []
             # find all parent classes and register in dict mixin2composite:
@@ -237,7 +280,7 @@ class ModelLogics (object):
                     # local abbreviations for lengthy variable names in
                     # implementation classes. therefore also the following:
                     if v.codename == k:
-                        print("    Variable ", v)
+                        logger.debug("    Variable %s", v)
                         cls.variables.add(v)
                         composed_class.variables.add(v)
                         assert v.owning_class is None  # since it is only set here!
@@ -249,6 +292,20 @@ class ModelLogics (object):
                 inst.complete_values()
                 inst.assert_valid()
             composed_class.__init__ = new__init__
+            # (re)install columnar storage of Variable values:
+            _ColumnarStore.uninstall(composed_class)
+            if columnar:
+                store = _ColumnarStore.install(composed_class,
+                                               composed_class.variables)
+                logger.debug("    (storing %d Variables in columns)",
+                             len(store.codenames))
+            # make assignments to references mark the instance structure
+            # as changed:
+            _StructureVersion.untrack_references(composed_class)
+            _StructureVersion.track_references(
+                composed_class,
+                [v for v in composed_class.variables
+                 if isinstance(v, (ReferenceVariable, SetVariable))])
 
         # replace refs to mixins by refs to corresponding composite class
         # in all Reference/SetVariables where possible.
@@ -260,20 +317,19 @@ class ModelLogics (object):
             if isinstance(v, (ReferenceVariable, SetVariable)):
                 v.type = cls.mixin2composite.get(v.type, v.type)
 
-        print("\nProcesses:")
+        logger.debug("Processes:")
         # iterate again through all composed entity-types and process taxa
         # to output all processes and check process targets:
-        var2process = {}  # dict needed for determining explicit evaluation order
         for composed_class in cls.entity_types + cls.process_taxa:
             if composed_class in cls.entity_types:
-                print("  Entity-type ", composed_class)
+                logger.debug("  Entity-type %s", composed_class)
             else:
-                print("  Process taxon ", composed_class)
+                logger.debug("  Process taxon %s", composed_class)
             parents = OrderedSet(list(inspect.getmro(composed_class)))
             for c in parents:
                 if "processes" in c.__dict__ and c.processes is not None:  # since some implementation classes may not define any processes
                     for p in c.processes:
-                        print("    Process ", p)
+                        logger.debug("    Process %s", p)
                         # all processes found here should have been seen
                         # already above, so we verify this:
                         assert p in cls.processes, \
@@ -311,18 +367,28 @@ class ModelLogics (object):
                                            + str(composed_class)
                                 if isinstance(p.specification, list):
                                     deps = _expressions.get_vars(p.specification[i])
-                                    print("      Derivative of",
-                                          target.target_variable,
-                                          "directly depends on", deps)
+                                    logger.debug("      Derivative of %s directly depends on %s",
+                                                 target.target_variable, deps)
+                                    try:
+                                        cls.ODE_dependencies[target.target_variable].update(deps)
+                                    except KeyError:
+                                        cls.ODE_dependencies[target.target_variable] = deps
+                                elif p.dependencies is not None:
+                                    deps = set(p.dependencies)
+                                    logger.debug("      Derivative of %s directly depends "
+                                                 "on %s (as declared)",
+                                                 target.target_variable, deps)
                                     try:
                                         cls.ODE_dependencies[target.target_variable].update(deps)
                                     except KeyError:
                                         cls.ODE_dependencies[target.target_variable] = deps
                                 else:
                                     deps = guess_deps(p.specification, variable_pool)
-                                    print("      Derivative of",
-                                          target.target_variable,
-                                          "probably directly depends on", deps)
+                                    logger.debug("      Derivative of %s probably directly "
+                                                 "depends on %s",
+                                                 target.target_variable, deps)
+                                    cls.guessed_dependencies.add(
+                                        target.target_variable)
                                     try:
                                         cls.ODE_dependencies[target.target_variable].update(deps)
                                     except KeyError:
@@ -334,9 +400,6 @@ class ModelLogics (object):
                             cls.ODE_targets += p.targets
                             cls.process_targets += p.targets
                         elif isinstance(p, Explicit):
-                            # TODO: determine dependency structure among
-                            # variable to set the right order of execution
-                            # of explicit processes!
                             cls.explicit_processes.add(p)
                             for i, target in enumerate(p.targets):
                                 if isinstance(target, Variable):
@@ -354,18 +417,28 @@ class ModelLogics (object):
                                            "entity-type/taxon:"
                                 if isinstance(p.specification, list):
                                     deps = _expressions.get_vars(p.specification[i])
-                                    print("      Target var.",
-                                          target.target_variable,
-                                          "directly depends on", deps)
+                                    logger.debug("      Target var. %s directly depends on %s",
+                                                 target.target_variable, deps)
+                                    try:
+                                        cls.explicit_dependencies[target.target_variable].update(deps)
+                                    except KeyError:
+                                        cls.explicit_dependencies[target.target_variable] = deps
+                                elif p.dependencies is not None:
+                                    deps = set(p.dependencies)
+                                    logger.debug("      Target var. %s directly depends "
+                                                 "on %s (as declared)",
+                                                 target.target_variable, deps)
                                     try:
                                         cls.explicit_dependencies[target.target_variable].update(deps)
                                     except KeyError:
                                         cls.explicit_dependencies[target.target_variable] = deps
                                 else:
                                     deps = guess_deps(p.specification, variable_pool)
-                                    print("      Target var.",
-                                          target.target_variable,
-                                          "probably directly depends on", deps)
+                                    logger.debug("      Target var. %s probably directly "
+                                                 "depends on %s",
+                                                 target.target_variable, deps)
+                                    cls.guessed_dependencies.add(
+                                        target.target_variable)
                                     try:
                                         cls.explicit_dependencies[target.target_variable].update(deps)
                                     except KeyError:
@@ -374,7 +447,6 @@ class ModelLogics (object):
 #                                          target.target_variable,
 #                                          "has unknown dependencies")
 #                                    cls.explicit_dependencies[target.target_variable] = unknown
-                                var2process[target.target_variable] = p
                             cls.explicit_targets += p.targets
                             cls.process_targets += p.targets
                         elif isinstance(p, Step):
@@ -412,7 +484,8 @@ class ModelLogics (object):
                         else:
                             raise Exception("unsupported process type")
 
-        print("\nTargets affected by some process:", cls.process_targets)
+        logger.debug("Targets affected by some process: %s",
+                     cls.process_targets)
 
         # analyse dependency structure between variables to determine
         # correct order of process evaluation:
@@ -439,59 +512,180 @@ class ModelLogics (object):
                 for source in deps:
                     cls.ODE_digraph.add_edge(source, target)
 
-        # determine explicit evaluation order:
-        G = DiGraph()
-        G = DiGraph(cls.explicit_digraph)
-        G.remove_node(unknown)
+        # determine explicit evaluation order. An Explicit process depends
+        # on another one if some of its target variables directly depends
+        # on some of the other's target variables. Each process is put on
+        # the lowest level above all processes it depends on, so that
+        # processes on the same level are mutually independent.
+        # Dependencies of processes specified by methods without declared
+        # dependencies are only guessed, so to resolve a cycle, one guessed
+        # dependency on it is ignored at a time, while cycles among
+        # processes with known dependencies are an error:
+        producers = {}
+        for p in cls.explicit_processes:
+            for target in p.targets:
+                producers.setdefault(target.target_variable, set()).add(p)
+        prerequisites = {}
+        for p in cls.explicit_processes:
+            prerequisites[p] = set()
+            for target in p.targets:
+                deps = cls.explicit_dependencies.get(target.target_variable,
+                                                     set())
+                if deps is unknown:
+                    prerequisites[p].update(cls.explicit_processes)
+                else:
+                    for source in deps:
+                        prerequisites[p].update(producers.get(source, ()))
+            # a process' targets may depend on each other (or a guessed
+            # dependency may be the target itself), which is no cycle:
+            prerequisites[p].discard(p)
+        guessing = set(p for p in cls.explicit_processes
+                       if not isinstance(p.specification, list)
+                       and p.dependencies is None)
+        cls.explicit_process_levels = []
+        cls.explicit_processes_ordered = True
+        done = set()
+        while len(done) < len(cls.explicit_processes):
+            level = [p for p in cls.explicit_processes
+                     if p not in done and prerequisites[p] <= done]
+            if not level:
+                G = DiGraph()
+                for p, sources in prerequisites.items():
+                    if p not in done:
+                        G.add_edges_from((q, p) for q in sources
+                                         if q not in done)
+                edges = find_cycle(G)
+                description = " -> ".join(str(q) for q, p in edges) \
+                    + " -> " + str(edges[0][0])
+                guessed = [(q, p) for q, p in edges if p in guessing]
+                if not guessed:
+                    raise ConfigureError(
+                        "Explicit processes have cyclic dependencies: "
+                        + description)
+                q, p = guessed[0]
+                prerequisites[p].discard(q)
+                cls.explicit_processes_ordered = False
+                logger.warning("Ignoring the guessed dependency of %s on %s "
+                               "to resolve the cycle %s", p, q, description)
+                continue
+            cls.explicit_process_levels.append(level)
+            done.update(level)
+        cls.explicit_processes = OrderedSet(
+            p for level in cls.explicit_process_levels for p in level)
         cls.explicit_evaluation_order = []
-        while len(list(G.nodes())) > 0:
-            # find a "nice" node x which depends on no other remaining nice
-            # nodes and depends on the smallest set Y no. of remaining "not
-            # nice" nodes:
-            candidates = 0
-            bestcount = np.inf
-            bestvar = None
-            bestsources = None
-            for target in list(G.nodes()):
-                if target.explicit_dependencies not in (None, unknown):  # target is nice
-                    sources = G.predecessors(target)
-                    if any([isinstance(source.explicit_dependencies, set)
-                            for source in sources]):
-                        continue
-                    badsources = [source for source in sources
-                                  if source.explicit_dependencies is unknown]
-                    count = len(badsources)
-                    candidates += 1
-                    if count < bestcount:
-                        bestcount = count
-                        bestvar = target
-                        bestsources = badsources
-            if candidates == 0:
-                break
-            assert bestvar is not None, \
-                "model is logically inconsistent (cyclic explicit dependencies)"
-            # add first all y from Y and then x to the evaluation stack and
-            # remove these nodes from the graph:
-            for source in bestsources:
-                p = var2process[source]
-                for tgt in p.targets:
-                    cls.explicit_evaluation_order.append(tgt.target_variable)
-                    G.remove_node(tgt.target_variable)
-            cls.explicit_evaluation_order.append(bestvar)
-            G.remove_node(bestvar)
-        print("\nOrder of evaluation of variables set by explicit equations:")
-        for target in cls.explicit_evaluation_order:
-            print("  ",target)
-
-        # TODO:
-        # - during ODE evaluation, only evaluate those from the evaluation
-        #   stack which at least one differential d_x depends on either
-        #   directly or indirectly, assuming that a "not nice" differential
-        #   depends on all variables
-
+        for p in cls.explicit_processes:
+            for target in p.targets:
+                if target.target_variable \
+                        not in cls.explicit_evaluation_order:
+                    cls.explicit_evaluation_order.append(
+                        target.target_variable)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Order of evaluation of explicit processes:")
+            for i, level in enumerate(cls.explicit_process_levels):
+                logger.debug("  Level %d: %s",
+                             i, ", ".join(str(p) for p in level))
+            logger.debug("Order of evaluation of variables set by explicit "
+                         "equations:")
+            for target in cls.explicit_evaluation_order:
+                logger.debug("  %s", target)
+
+        # compile symbolic specifications into flat instruction sequences:
+        for p in list(cls.ODE_processes) + list(cls.explicit_processes):
+            if isinstance(p.specification, list):
+                p.compiled_specification = \
+                    [_expressions.compile_expression(expr)
+                     for expr in p.specification]
+            else:
+                p.compiled_specification = None
+
+        # differentiate symbolic specifications:
+        analytic_jacobian = analytic_jacobian and cls._differentiate()
+
+        # during ODE integration, only those explicit processes need to be
+        # applied whose targets at least one derivative depends on either
+        # directly or indirectly, assuming that a "not nice" derivative
+        # depends on all variables, and so does one computed by a
+        # specification method without declared dependencies (since
+        # guessed dependencies may be incomplete):
+        # (the search follows the edges of ODE_digraph and explicit_digraph
+        # backwards, as given by the dependency dicts they were built from)
+        if any(deps is unknown or target in cls.guessed_dependencies
+               for target, deps in cls.ODE_dependencies.items()):
+            needed = set(cls.explicit_dependencies.keys())
+        else:
+            needed = set()
+            stack = [source for deps in cls.ODE_dependencies.values()
+                     for source in deps]
+            while stack:
+                var = stack.pop()
+                if var in needed:
+                    continue
+                needed.add(var)
+                deps = cls.explicit_dependencies.get(var, ())
+                if deps is unknown or var in cls.guessed_dependencies:
+                    needed = set(cls.explicit_dependencies.keys())
+                    break
+                stack += deps
+        cls.RHS_explicit_processes = OrderedSet()
+        cls.output_explicit_processes = OrderedSet()
+        for p in cls.explicit_processes:
+            if any(target.target_variable in needed for target in p.targets):
+                cls.RHS_explicit_processes.add(p)
+            else:
+                cls.output_explicit_processes.add(p)
+        if cls.output_explicit_processes \
+                and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Explicit processes not needed during ODE "
+                         "integration:")
+            for p in cls.output_explicit_processes:
+                logger.debug("  %s", p)
+
+        cls.columnar = columnar
+        cls.analytic_jacobian = analytic_jacobian
         cls._configured = True
 
-        print("\n(End of model configuration)")
+        logger.info("(End of model configuration)")
+
+    @classmethod
+    def _differentiate(cls):
+        """Differentiate all symbolic ODE and Explicit specifications
+        and return whether all those the ODE derivatives depend on could
+        be differentiated."""
+        logger.info("Differentiating specifications symbolically...")
+        # Variables that may change during ODE integration:
+        variables = set([target.target_variable
+                         for target in cls.ODE_targets
+                         + cls.explicit_targets])
+        setters = {}
+        for p in list(cls.ODE_processes) + list(cls.explicit_processes):
+            p.jacobian_specification = None
+            if isinstance(p.specification, list):
+                try:
+                    p.jacobian_specification = \
+                        [_SymbolicJacobian(expr, variables)
+                         for expr in p.specification]
+                except _NotDifferentiable as e:
+                    logger.info("  %s cannot be differentiated: %s", p, e)
+            if p in cls.explicit_processes:
+                for target in p.targets:
+                    setters.setdefault(target.target_variable, []).append(p)
+        # check all processes the ODE derivatives depend on:
+        stack = list(cls.ODE_processes)
+        seen = set(stack)
+        while stack:
+            p = stack.pop()
+            if p.jacobian_specification is None:
+                logger.info("  (no analytic Jacobian since %s has no "
+                            "differentiable specification)", p)
+                return False
+            for expr in p.specification:
+                for var in _expressions.get_vars(expr):
+                    for q in setters.get(var, []):
+                        if q not in seen:
+                            seen.add(q)
+                            stack.append(q)
+        logger.info("  (using analytic Jacobian)")
+        return True
 
     def convert_to_standard_units(self):
         """Replace all variable values of type DimensionalQuantity to float.
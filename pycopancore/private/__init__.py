@@ -14,5 +14,16 @@ from ._abstract_process import _AbstractProcess
 from ._abstract_process_taxon_mixin import _AbstractProcessTaxonMixin
 from ._abstract_entity_mixin import _AbstractEntityMixin
 from ._abstract_runner import _AbstractRunner
-from ._expressions import _DotConstruct, eval, unknown, unset
+from ._expressions import _DotConstruct, eval, unknown, unset, \
+    get_instance_dependencies, _broadcast_index
 from ._trajectory_dictionary import _TrajectoryDictionary
+from ._columnar_store import _ColumnarStore
+from ._discontinuity_schedule import _DiscontinuitySchedule
+from ._symbolic_jacobian import _SymbolicJacobian, _NotDifferentiable
+from ._trajectory_recorder import _TrajectoryRecorder
+from ._structure_version import _StructureVersion
+from ._checkpoint import _Checkpoint
+from ._hdf5_trajectory import _HDF5TrajectoryWriter, _HDF5TrajectoryReader
+from ._array_trajectory import _ArrayTrajectoryFile, _ArrayTrajectoryReader
+from ._network_trajectory import _NetworkState
+from ._process_timer import _ProcessTimer
@@ -56,6 +56,7 @@ class _AbstractEntityMixin(_Mixin):
             self.__class__.instances.append(self)
         except AttributeError:
             self.__class__.instances = [self]
+        self.__class__._instances_changed()
 
     def deactivate(self):
         """Deactivate entity.
@@ -68,6 +69,7 @@ class _AbstractEntityMixin(_Mixin):
             self.__class__.idle_entities.append(self)
         except AttributeError:
             self.__class__.idle_entities = [self]
+        self.__class__._instances_changed()
 
     def reactivate(self):
         """Reactivate entity.
@@ -78,6 +80,7 @@ class _AbstractEntityMixin(_Mixin):
         assert self in self.__class__.idle_entities, 'Not deactivated'
         self.__class__.idle_entities.remove(self)
         self.__class__.instances.append(self)
+        self.__class__._instances_changed()
 
     def delete(self):
         """Delete entity from all lists."""
@@ -89,6 +92,10 @@ class _AbstractEntityMixin(_Mixin):
         if (self.__class__.instances
                 and self in self.__class__.instances):
             self.__class__.instances.remove(self)
+        self.__class__._instances_changed()
+        # free this instance's row in a columnar store, if any:
+        if self.__class__._columnar_store is not None:
+            self.__class__._columnar_store.release(self)
         # Now delete for good:
         del(self)
 
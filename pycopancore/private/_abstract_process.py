@@ -38,6 +38,18 @@ class _AbstractProcess(object):
 
     owning_class = None
     """the class (entity-type or process taxon) owning the process"""
+    dependencies = None
+    """list of Variables the specification method reads, if declared by
+    the process (otherwise they are guessed from the method's source
+    code)"""
+    compiled_specification = None
+    """list of _CompiledExpressions, one for each symbolic expression in
+    the specification, or None if the specification is a method
+    (set by ModelLogics.configure)"""
+    jacobian_specification = None
+    """list of _SymbolicJacobians, one for each symbolic expression in the
+    specification, or None if it cannot be differentiated symbolically
+    (set by ModelLogics.configure if an analytic Jacobian is requested)"""
 
     def __init__(self, name=""):
         """Initialize an _AbstractProcess instance."""
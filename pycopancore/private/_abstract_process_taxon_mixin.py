@@ -33,6 +33,7 @@ class _AbstractProcessTaxonMixin(_Mixin):
 #            print('This Process Taxon is already instantiated!')
 #        else:
         self.__class__.instances = [self]
+        self.__class__._instances_changed()
 
     def delete(self):
         """Delete this Process Taxon from lists."""
@@ -44,6 +45,10 @@ class _AbstractProcessTaxonMixin(_Mixin):
         # fresh again...
         if (self.__class__.instances == []):
             self.__class__.instances = None
+        self.__class__._instances_changed()
+        # free this instance's row in a columnar store, if any:
+        if self.__class__._columnar_store is not None:
+            self.__class__._columnar_store.release(self)
         # Delete for good:
         print(f'Process taxon {self} deleted')
         del(self)
@@ -0,0 +1,331 @@
+"""_ArrayTrajectoryFile and _ArrayTrajectoryReader classes.
+
+Storage of model trajectories as numpy arrays, either in one .npz file or
+in a directory of .npy files (one per array, so that they can be
+memory-mapped when reading). Whether the values of a Variable can be stored
+as numbers is detected once for the whole Variable, from the datatype of its
+recorded values and of the Variable. Numeric Variables are stored as
+
+- "<Variable>.values": typed values (time points x instances), with nan
+  for floats where they are not valid,
+- "<Variable>.valid": boolean mask (time points x instances) telling which
+  values are valid,
+- "<Variable>.uids": UIDs of the instances (-1 for process taxa and for
+  instances given by name),
+
+where <Variable> is e.g. "World.atmospheric_carbon", plus the array "t" of
+time points. The kinds of Variables are stored as in an HDF5 file (see
+_HDF5TrajectoryWriter), except that sets are not numeric. All other
+Variables (e.g. networks or sets) are converted as for saving as a pickle
+file (see _TrajectoryDictionary.save) and stored as one pickled dict.
+
+A metadata header (a JSON string) describes the file version, the number of
+time points and, for each numeric Variable, its entity type, codename, kind
+and the string representations of its instances, and lists the other
+Variables.
+
+_ArrayTrajectoryReader reads such files lazily: it only reads the header
+and the arrays of UIDs when opened, and memory-maps the .npy files, so that
+only the requested time points and instances of a Variable are read from
+disk.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import json
+import os
+import pickle
+
+import numpy as np
+
+from ._hdf5_trajectory import _HDF5TrajectoryWriter, _kind
+from .. import data_model as D
+
+file_version = 1
+"""version of the file layout"""
+
+
+def _names(key):
+    """Return the names of the entity type and of the Variable given by a
+    key of a _TrajectoryDictionary (a Variable or its name)."""
+    if isinstance(key, D.Variable) and key.owning_class is not None:
+        return key.owning_class.__name__, key.codename
+    entity_type, _, codename = str(key).partition('.')
+    return entity_type, codename
+
+
+class _ArrayTrajectoryFile(object):
+    """Writing and reading of trajectories as numpy arrays."""
+
+    @staticmethod
+    def _typed(key, trajectory):
+        """Return the kind and the arrays of values and valid entries of a
+        Variable's trajectory, or None if its values are not numeric."""
+        values = trajectory.values(copy=False)
+        valid = trajectory.mask(copy=False)
+        if values.dtype != object:
+            return "float", values, valid
+        kind = _kind(key) if isinstance(key, D.Variable) else None
+        if kind is None or kind == "set":
+            return None
+        try:
+            return kind, _HDF5TrajectoryWriter._convert(key, kind, values,
+                                                        valid), valid
+        except (TypeError, AttributeError):
+            return None
+
+    @classmethod
+    def _arrays(cls, trajectory):
+        """Return the dict of arrays to store for a _TrajectoryDictionary,
+        including the metadata header and the pickled other Variables."""
+        arrays = {"t": trajectory.times(copy=False)}
+        metadata = {"file-version": file_version,
+                    "n_times": len(arrays["t"]),
+                    "variables": {},
+                    "other_variables": []}
+        others = []
+        for key, item in trajectory.items():
+            if key == 't':
+                continue
+            name = str(key)
+            variable_trajectory = trajectory.trajectory(key)
+            typed = cls._typed(key, variable_trajectory) \
+                if len(item) > 0 else None
+            if typed is None:
+                others.append(key)
+                metadata["other_variables"].append(name)
+                continue
+            kind, values, valid = typed
+            entity_type, codename = _names(key)
+            metadata["variables"][name] = {
+                "entity_type": entity_type,
+                "codename": codename,
+                "kind": kind,
+                "instances": [str(inst)
+                              for inst in variable_trajectory.instances]}
+            arrays[name + ".values"] = values
+            arrays[name + ".valid"] = valid
+            arrays[name + ".uids"] = variable_trajectory.uids
+        arrays["metadata"] = np.array(json.dumps(metadata))
+        if others:
+            arrays["other_variables"] = np.frombuffer(
+                pickle.dumps(trajectory._to_plain_dict(others),
+                             pickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+        return arrays
+
+    @classmethod
+    def save(cls, trajectory, path, data_type='npz'):
+        """Write a _TrajectoryDictionary to path, a .npz file if data_type
+        is 'npz' or a directory of .npy files if it is 'npy'."""
+        arrays = cls._arrays(trajectory)
+        if data_type == 'npz':
+            with open(path + ".tmp", "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(path + ".tmp", path)
+        else:
+            os.makedirs(path, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(os.path.join(path, name + ".npy"), array)
+
+    @staticmethod
+    def load(path):
+        """Read a trajectory written by save() (from a .npz file or a
+        directory of .npy files) and return a dict with key 't' (list of
+        time points) and, for each Variable name, a dict mapping the
+        instances' string representations to lists of values (None where
+        not valid)."""
+        with _ArrayTrajectoryReader(path) as reader:
+            result = {"t": reader.times.tolist()}
+            for name in reader.variables:
+                columns = reader.values(name).T.tolist()
+                masks = reader.mask(name).T.tolist()
+                result[name] = {
+                    inst: [value if ok else None
+                           for value, ok in zip(column, mask)]
+                    for inst, column, mask in zip(reader.instances(name),
+                                                  columns, masks)}
+            for name in reader.other_variables:
+                result[name] = reader.other(name)
+            return result
+
+
+class _ArrayTrajectoryReader(object):
+    """Lazy reader of trajectories written by _ArrayTrajectoryFile.
+
+    The arrays of a directory of .npy files are memory-mapped, those of a
+    .npz file are read when they are first accessed.
+    """
+
+    metadata = None
+    """the metadata header"""
+
+    def __init__(self, path):
+        """Open a trajectory written by _ArrayTrajectoryFile.save().
+
+        Parameters
+        ----------
+        path : str
+            name of the .npz file or of the directory of .npy files
+        """
+        self.path = path
+        if os.path.isdir(path):
+            self._npz = None
+        else:
+            self._npz = np.load(path)
+        self._arrays = {}
+        self._others = None
+        self.metadata = json.loads(str(self._array("metadata")))
+        if self.metadata.get("file-version") != file_version:
+            raise ValueError("unsupported file version "
+                             + str(self.metadata.get("file-version")))
+        # index of the instances' columns by UID and by name:
+        self._columns_by_uid = {}
+        self._columns_by_name = {}
+        for name, meta in self.metadata["variables"].items():
+            self._columns_by_uid[name] = {
+                uid: j for j, uid in enumerate(self.uids(name).tolist())
+                if uid >= 0}
+            self._columns_by_name[name] = {
+                inst: j for j, inst in enumerate(meta["instances"])}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Close the file and release the memory-mapped arrays."""
+        self._arrays = {}
+        if self._npz is not None:
+            self._npz.close()
+
+    def _array(self, key):
+        """Return the stored array key, memory-mapped if possible."""
+        try:
+            return self._arrays[key]
+        except KeyError:
+            pass
+        if self._npz is not None:
+            array = self._npz[key]
+        else:
+            array = np.load(os.path.join(self.path, key + ".npy"),
+                            mmap_mode='r')
+        self._arrays[key] = array
+        return array
+
+    # index:
+
+    @property
+    def variables(self):
+        """list of the names of the Variables stored as arrays"""
+        return list(self.metadata["variables"])
+
+    @property
+    def other_variables(self):
+        """list of the names of the other Variables, see other()"""
+        return list(self.metadata["other_variables"])
+
+    @property
+    def entity_types(self):
+        """dict mapping the names of entity types and process taxa to the
+        names of their Variables stored as arrays"""
+        entity_types = {}
+        for name, meta in self.metadata["variables"].items():
+            entity_types.setdefault(meta["entity_type"], []).append(name)
+        return entity_types
+
+    @property
+    def n_times(self):
+        """number of time points"""
+        return self.metadata["n_times"]
+
+    @property
+    def times(self):
+        """(memory-mapped) array of time points"""
+        return self._array("t")
+
+    def time_slice(self, t_0=None, t_1=None):
+        """Return the slice of the indices of the time points from t_0 to
+        t_1 (inclusive), for use as times argument of values()."""
+        times = self.times
+        start = 0 if t_0 is None \
+            else int(np.searchsorted(times, t_0, side='left'))
+        stop = len(times) if t_1 is None \
+            else int(np.searchsorted(times, t_1, side='right'))
+        return slice(start, stop)
+
+    def kind(self, name):
+        """Return the kind of a Variable's values (see
+        _HDF5TrajectoryWriter)."""
+        return self.metadata["variables"][name]["kind"]
+
+    def uids(self, name):
+        """Return the array of UIDs of the instances of a Variable (-1 for
+        process taxa and instances given by name)."""
+        return np.asarray(self._array(name + ".uids"))
+
+    def instances(self, name):
+        """Return the list of string representations of the instances of a
+        Variable."""
+        return list(self.metadata["variables"][name]["instances"])
+
+    def _columns(self, name, uids, instances):
+        if uids is not None:
+            columns = self._columns_by_uid[name]
+            return [columns[uid] for uid in uids]
+        if instances is not None:
+            columns = self._columns_by_name[name]
+            return [columns[str(inst)] for inst in instances]
+        return slice(None)
+
+    # data:
+
+    def values(self, name, times=slice(None), uids=None, instances=None):
+        """Return the values of a Variable, reading only the requested
+        part from disk.
+
+        Parameters
+        ----------
+        name : str
+            name of the Variable, as in variables
+        times : slice or array, optional
+            time point indices to read (default: all, see time_slice())
+        uids : list, optional
+            UIDs of the instances to read
+        instances : list, optional
+            instances (or their string representations) to read if uids
+            is not given (default: all)
+
+        Returns
+        -------
+        array
+            values (time points x instances), with fill values (nan for
+            floats) where they are not valid, see mask()
+        """
+        data = self._array(name + ".values")
+        return np.array(data[times][:, self._columns(name, uids,
+                                                       instances)])
+
+    def mask(self, name, times=slice(None), uids=None, instances=None):
+        """Return the boolean array (time points x instances) telling which
+        values of a Variable are valid, see values()."""
+        data = self._array(name + ".valid")
+        return np.array(data[times][:, self._columns(name, uids,
+                                                       instances)])
+
+    def other(self, name):
+        """Return the values of one of the other Variables as a dict
+        mapping the instances' string representations to lists of values
+        (see _TrajectoryDictionary.save)."""
+        if self._others is None:
+            self._others = pickle.loads(
+                np.asarray(self._array("other_variables")).tobytes())
+        return self._others[name]
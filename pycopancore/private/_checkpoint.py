@@ -0,0 +1,160 @@
+"""_Checkpoint class.
+
+Checkpoints of a model run, written by the Runner between two intervals of
+ODE integration so that the run can later be resumed exactly where it was
+interrupted, possibly in another process. A checkpoint is a pickle file
+containing
+
+- the instances (active and inactive) of all composed entity types and
+  process taxa of the model, including all their attributes (hence their
+  references, networks etc.) and the contents of their columnar stores,
+- the counter of entity UIDs,
+- the states of the random number generators of python's random module,
+  numpy.random and numba,
+- the runner's state: its run arguments, the current time, the
+  _DiscontinuitySchedule and the _TrajectoryRecorder holding the
+  trajectory so far.
+
+Composed classes, Variables and processes are not pickled but referred to
+by their position in the model's lists (composed classes cannot be pickled
+by name since _MixinType hides their __qualname__), so a checkpoint can only
+be loaded by the same (configured) model.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import os
+import pickle
+import random
+
+import numpy as np
+from numba import _helperlib
+
+from ._abstract_entity_mixin import _AbstractEntityMixin
+
+
+class _CheckpointPickler(pickle.Pickler):
+    """Pickler referring to the model's composed classes, Variables and
+    processes by position."""
+
+    def __init__(self, file, ids):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._ids = ids
+
+    def persistent_id(self, obj):
+        return self._ids.get(id(obj))
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    """Unpickler resolving the references written by _CheckpointPickler."""
+
+    def __init__(self, file, objects):
+        super().__init__(file)
+        self._objects = objects
+
+    def persistent_load(self, pid):
+        return self._objects[pid]
+
+
+class _Checkpoint(object):
+    """Writing and reading of checkpoints of a model run."""
+
+    version = 1
+    """format version of checkpoint files"""
+
+    @staticmethod
+    def _model_objects(model):
+        """Return a dict mapping persistent ids to the model's composed
+        classes, Variables and processes."""
+        objects = {}
+        for i, composed_class in enumerate(model.entity_types
+                                           + model.process_taxa):
+            objects[("class", i)] = composed_class
+        for i, var in enumerate(model.variables):
+            objects[("variable", i)] = var
+        for i, process in enumerate(model.processes):
+            objects[("process", i)] = process
+        return objects
+
+    @classmethod
+    def save(cls, path, model, runner_state):
+        """Write a checkpoint of the model's state and the given runner
+        state (a picklable dict) atomically to path."""
+        classes = {}
+        for composed_class in model.entity_types + model.process_taxa:
+            store = composed_class.__dict__.get("_columnar_store")
+            columns = None
+            if store is not None:
+                columns = {key: getattr(store, key)
+                           for key in ("values", "derivatives", "is_set",
+                                       "boxed", "n_rows", "free_rows",
+                                       "capacity")}
+            classes[composed_class] = {
+                "instances": composed_class.instances,
+                "idle_entities": getattr(composed_class, "idle_entities",
+                                         None),
+                "columns": columns}
+        state = {
+            "version": cls.version,
+            "classes": classes,
+            "next_uid": _AbstractEntityMixin.NEXTUID,
+            "random": random.getstate(),
+            "numpy_random": np.random.get_state(),
+            "numba_random": (
+                _helperlib.rnd_get_state(_helperlib.rnd_get_py_state_ptr()),
+                _helperlib.rnd_get_state(_helperlib.rnd_get_np_state_ptr())),
+            "runner": runner_state}
+        ids = {id(obj): pid
+               for pid, obj in cls._model_objects(model).items()}
+        with open(path + ".tmp", "wb") as f:
+            _CheckpointPickler(f, ids).dump(state)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path, model):
+        """Read a checkpoint, restore the model's state from it and return
+        the runner state.
+
+        The states of the random number generators are not restored yet,
+        see restore_random_state().
+        """
+        with open(path, "rb") as f:
+            state = _CheckpointUnpickler(f, cls._model_objects(model)).load()
+        if state.get("version") != cls.version:
+            raise ValueError("unsupported checkpoint version "
+                             + str(state.get("version")))
+        for composed_class, class_state in state["classes"].items():
+            composed_class.instances = class_state["instances"]
+            composed_class.idle_entities = class_state["idle_entities"]
+            if class_state["columns"] is not None:
+                store = composed_class._columnar_store
+                store.free_rows = []
+                for key, value in class_state["columns"].items():
+                    setattr(store, key, value)
+                store._rows_list = None
+            composed_class._instances_changed()
+        _AbstractEntityMixin.NEXTUID = state["next_uid"]
+        runner_state = state["runner"]
+        runner_state["random_state"] = (state["random"],
+                                        state["numpy_random"],
+                                        state["numba_random"])
+        return runner_state
+
+    @staticmethod
+    def restore_random_state(random_state):
+        """Restore the random number generators' states returned by
+        load() as runner_state["random_state"]."""
+        py_state, np_state, (numba_py_state, numba_np_state) = random_state
+        random.setstate(py_state)
+        np.random.set_state(np_state)
+        _helperlib.rnd_set_state(_helperlib.rnd_get_py_state_ptr(),
+                                 numba_py_state)
+        _helperlib.rnd_set_state(_helperlib.rnd_get_np_state_ptr(),
+                                 numba_np_state)
@@ -0,0 +1,290 @@
+"""_ColumnarStore class.
+
+Optional structure-of-arrays storage of Variable values. If a model is
+configured with columnar=True, each composed entity type and process taxon
+owns one _ColumnarStore that keeps the values of its float-valued Variables
+and their derivatives in contiguous numpy arrays, one row per instance.
+The instances' attributes then become thin views onto their row, so that
+Variables and _DotConstructs can read and write whole columns at once.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import numpy as np
+
+
+class _ColumnarStore(object):
+    """Columnar storage of the float-valued Variables of one composed class.
+
+    Values that are not floats (e.g. ints, DimensionalQuantities or None)
+    are kept "boxed" in a per-column dict so that reading them returns
+    exactly what was stored. Columns containing boxed values are not
+    accessed as arrays but via the per-instance fallback paths.
+    """
+
+    owning_class = None
+    """the composed entity type or process taxon owning the store"""
+    codenames = None
+    """list of codenames of the Variables stored in columns"""
+    values = None
+    """dict codename -> array of values (one row per instance)"""
+    derivatives = None
+    """dict codename -> array of derivatives (one row per instance)"""
+    is_set = None
+    """dict codename -> boolean array marking rows that have a value"""
+    boxed = None
+    """dict codename -> dict row -> non-float value"""
+    n_rows = None
+    """number of rows allocated so far"""
+    free_rows = None
+    """list of rows released by deleted instances, reused before new rows
+    are allocated"""
+
+    def __init__(self, owning_class, variables, capacity=16):
+        """Instantiate a _ColumnarStore.
+
+        Parameters
+        ----------
+        owning_class : class
+            composed entity type or process taxon
+        variables : list
+            Variables to be stored in columns
+        capacity : int, optional
+            initial number of rows to allocate
+        """
+        self.owning_class = owning_class
+        self.variables = list(variables)
+        self.codenames = [v.codename for v in self.variables]
+        self.capacity = capacity
+        self.n_rows = 0
+        self.free_rows = []
+        self.values = {cn: np.zeros(capacity) for cn in self.codenames}
+        self.derivatives = {cn: np.zeros(capacity) for cn in self.codenames}
+        self.is_set = {cn: np.zeros(capacity, dtype=bool)
+                       for cn in self.codenames}
+        self.boxed = {cn: {} for cn in self.codenames}
+        self._rows_list = None
+        self._rows_version = None
+        self._rows = None
+
+    # installation in composed classes:
+
+    @staticmethod
+    def is_eligible(composed_class, var):
+        """Return whether var can be stored in a column of composed_class.
+
+        This is the case for plain float-valued Variables which are not
+        overridden by properties or other attributes in the composed class'
+        method resolution order.
+        """
+        # avoid a circular import:
+        from ..data_model import Variable
+        if type(var) is not Variable or var.datatype is not float \
+                or var.array_shape is not None:
+            return False
+        for name in (var.codename, "d_" + var.codename):
+            for c in composed_class.__mro__:
+                if name in c.__dict__:
+                    if c.__dict__[name] is not var:
+                        return False
+                    break
+        return True
+
+    @classmethod
+    def install(cls, composed_class, variables):
+        """Create a store for composed_class and install column views
+        for all eligible variables as class attributes.
+
+        Returns
+        -------
+        _ColumnarStore
+            the new store
+        """
+        variables = [v for v in variables
+                     if cls.is_eligible(composed_class, v)]
+        store = cls(composed_class, variables)
+        for v in variables:
+            setattr(composed_class, v.codename,
+                    _ColumnarAttribute(store, v))
+            setattr(composed_class, "d_" + v.codename,
+                    _ColumnarDerivative(store, v))
+        composed_class._columnar_store = store
+        return store
+
+    @staticmethod
+    def uninstall(composed_class):
+        """Remove the column views and the store from composed_class."""
+        store = composed_class.__dict__.get("_columnar_store")
+        if store is None:
+            return
+        for cn in store.codenames:
+            if cn in composed_class.__dict__:
+                delattr(composed_class, cn)
+            if "d_" + cn in composed_class.__dict__:
+                delattr(composed_class, "d_" + cn)
+        del composed_class._columnar_store
+
+    # row management:
+
+    def _grow(self):
+        """Double the number of allocated rows."""
+        newcap = 2 * self.capacity
+        for d in (self.values, self.derivatives, self.is_set):
+            for cn, arr in d.items():
+                newarr = np.zeros(newcap, dtype=arr.dtype)
+                newarr[:self.capacity] = arr
+                d[cn] = newarr
+        self.capacity = newcap
+
+    def row_of(self, inst):
+        """Return the row of inst (an instance of the owning class),
+        allocating a new one if necessary."""
+        try:
+            return inst.__dict__["_columnar_row"]
+        except KeyError:
+            if self.free_rows:
+                row = self.free_rows.pop()
+            else:
+                if self.n_rows == self.capacity:
+                    self._grow()
+                row = self.n_rows
+                self.n_rows += 1
+            inst.__dict__["_columnar_row"] = row
+            return row
+
+    def release(self, inst):
+        """Clear the row of a deleted instance and make it available for
+        new instances.
+
+        Deactivated instances keep their rows since they may be
+        reactivated.
+        """
+        row = inst.__dict__.pop("_columnar_row", None)
+        if row is None:
+            return
+        for cn in self.codenames:
+            self.values[cn][row] = 0
+            self.derivatives[cn][row] = 0
+            self.is_set[cn][row] = False
+            self.boxed[cn].pop(row, None)
+        self.free_rows.append(row)
+
+    def rows_of(self, instances):
+        """Return an index array of the rows of the given instances, or None
+        if some of them are not instances of the owning class (so that
+        their values are not in this store)."""
+        oc = self.owning_class
+        for inst in instances:
+            if inst.__class__ is not oc:
+                return None
+        return np.fromiter((self.row_of(i) for i in instances),
+                           dtype=np.intp, count=len(instances))
+
+    def rows(self, instances=None):
+        """Return an index array of the rows of the given instances,
+        cached for the owning class' list of (active) instances."""
+        oc = self.owning_class
+        if instances is None:
+            instances = oc.instances
+        if instances is not oc.instances:
+            return self.rows_of(instances)
+        version = oc._instances_version
+        if instances is not self._rows_list \
+                or version != self._rows_version:
+            self._rows = self.rows_of(instances)
+            self._rows_list = instances
+            self._rows_version = version
+        return self._rows
+
+    # whole-column access:
+
+    def read(self, codename, rows):
+        """Return the values at rows as an array,
+        or None if some of them are unset or not floats."""
+        if self.boxed[codename] or not self.is_set[codename][rows].all():
+            return None
+        return self.values[codename][rows]
+
+    def write(self, codename, rows, values):
+        """Store float values at rows and return True,
+        or return False if values are not floats."""
+        values = np.asanyarray(values)
+        if values.dtype.kind != "f":
+            return False
+        self.values[codename][rows] = values
+        self.is_set[codename][rows] = True
+        boxed = self.boxed[codename]
+        if boxed:
+            for row in np.atleast_1d(rows):
+                boxed.pop(row, None)
+        return True
+
+
+class _ColumnarAttribute(object):
+    """Data descriptor viewing an instance's row of a value column."""
+
+    def __init__(self, store, variable):
+        self.store = store
+        self.variable = variable
+        self.codename = variable.codename
+
+    def __get__(self, inst, owner):
+        if inst is None:
+            # accessed at class level, so behave like the Variable itself:
+            return self.variable
+        cn = self.codename
+        store = self.store
+        try:
+            row = inst.__dict__["_columnar_row"]
+        except KeyError:
+            raise AttributeError(cn)
+        boxed = store.boxed[cn]
+        if boxed and row in boxed:
+            return boxed[row]
+        if not store.is_set[cn][row]:
+            raise AttributeError(cn)
+        return store.values[cn][row]
+
+    def __set__(self, inst, value):
+        cn = self.codename
+        store = self.store
+        row = store.row_of(inst)
+        if isinstance(value, float):
+            store.values[cn][row] = value
+            boxed = store.boxed[cn]
+            if boxed:
+                boxed.pop(row, None)
+        else:
+            store.boxed[cn][row] = value
+        store.is_set[cn][row] = True
+
+    def __delete__(self, inst):
+        row = self.store.row_of(inst)
+        self.store.boxed[self.codename].pop(row, None)
+        self.store.is_set[self.codename][row] = False
+
+
+class _ColumnarDerivative(object):
+    """Data descriptor viewing an instance's row of a derivative column."""
+
+    def __init__(self, store, variable):
+        self.store = store
+        self.variable = variable
+        self.codename = variable.codename
+
+    def __get__(self, inst, owner):
+        if inst is None:
+            return self
+        return self.store.derivatives[self.codename][
+            self.store.row_of(inst)]
+
+    def __set__(self, inst, value):
+        self.store.derivatives[self.codename][
+            self.store.row_of(inst)] = value
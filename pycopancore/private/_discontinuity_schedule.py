@@ -0,0 +1,140 @@
+"""_DiscontinuitySchedule class.
+
+Priority queue of the future occurrences of Steps and Events, used by the
+runner to find the next discontinuity in time. It is a binary heap of
+entries (time, counter, process, instance), where the counter keeps
+co-occurring entries in the order they were scheduled. Cancelled entries
+and those of deactivated entities are removed lazily when they reach the
+top of the heap.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+from heapq import heappush, heappop
+from itertools import count
+
+from ._abstract_entity_mixin import _AbstractEntityMixin
+
+
+class _DiscontinuitySchedule(object):
+    """Schedule of (process, instance) pairs by time of next occurrence.
+
+    Scheduling, cancelling and finding the next time each take
+    O(log N) (amortized) for N pending entries.
+    """
+
+    def __init__(self):
+        """Instantiate an empty _DiscontinuitySchedule."""
+        self._heap = []
+        self._counter = count()
+        # dict (process, instance) -> list of pending entries:
+        self._entries = {}
+        self._n_live = 0
+
+    def __getstate__(self):
+        # store the counter's next value rather than the counter:
+        state = dict(self.__dict__)
+        state["_counter"] = next(self._counter)
+        self._counter = count(state["_counter"])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._counter = count(state["_counter"])
+
+    def __len__(self):
+        """Return the number of pending (not cancelled) entries."""
+        return self._n_live
+
+    def schedule(self, time, process, inst):
+        """Register an occurrence of process at inst at the given time.
+
+        Parameters
+        ----------
+        time : float
+            time of occurrence
+        process : Step or Event
+        inst : entity or process taxon
+        """
+        # entries are lists so that they can be invalidated in place:
+        entry = [time, next(self._counter), process, inst]
+        heappush(self._heap, entry)
+        try:
+            self._entries[(process, inst)].append(entry)
+        except KeyError:
+            self._entries[(process, inst)] = [entry]
+        self._n_live += 1
+
+    def cancel(self, process, inst):
+        """Cancel all pending occurrences of process at inst.
+
+        Returns
+        -------
+        bool
+            whether there was some pending occurrence
+        """
+        entries = self._entries.pop((process, inst), None)
+        if not entries:
+            return False
+        for entry in entries:
+            # mark as removed, the entry will be dropped from the heap later:
+            entry[2] = None
+            self._n_live -= 1
+        return True
+
+    def reschedule(self, time, process, inst):
+        """Replace all pending occurrences of process at inst by a single
+        one at the given time."""
+        self.cancel(process, inst)
+        self.schedule(time, process, inst)
+
+    def next_time(self):
+        """Return the time of the next pending occurrence, or None.
+
+        Entries of entities that are no longer active are dropped.
+        """
+        heap = self._heap
+        while heap:
+            entry = heap[0]
+            if entry[2] is not None:
+                inst = entry[3]
+                if not isinstance(inst, _AbstractEntityMixin) \
+                        or inst.is_active:
+                    return entry[0]
+                self._forget(entry)
+            heappop(heap)
+        return None
+
+    def pop(self, time):
+        """Remove and return all pending occurrences at the given time.
+
+        Returns
+        -------
+        list
+            list of tuples (process, instance) in the order they were
+            scheduled
+        """
+        heap = self._heap
+        result = []
+        while heap and heap[0][0] <= time:
+            entry = heappop(heap)
+            if entry[2] is not None:
+                self._forget(entry)
+                result.append((entry[2], entry[3]))
+        return result
+
+    def _forget(self, entry):
+        """Unregister a live entry that is leaving the heap."""
+        key = (entry[2], entry[3])
+        entries = self._entries[key]
+        entries.remove(entry)
+        if not entries:
+            del self._entries[key]
+        self._n_live -= 1
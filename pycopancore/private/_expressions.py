@@ -21,6 +21,7 @@ import scipy.special
 
 from .. import data_model as D
 from .. import private
+from ._structure_version import _StructureVersion
 
 from numba import njit
 
@@ -225,6 +226,9 @@ class _DotConstruct(sp.AtomicExpr):
             self._target_instances = unknown
             self._branchings = unknown
             self._cardinalities = unknown
+            self._target_rows = None
+            self._target_rows_of = None
+            self._structure_version = None
 
 #            print("_DotConstruct.__init__ of",self,"performed")
         else:
@@ -376,7 +380,7 @@ class _DotConstruct(sp.AtomicExpr):
         """return the list of instances owning the referenced attributes,
         may contain instances more than once due to broadcasting"""
         assert self._can_be_target, "cannot serve as target"
-        if self._target_instances is unknown:
+        if self._structure_version != _StructureVersion.value:
             self._analyse_instances()
         return self._target_instances
 
@@ -384,7 +388,7 @@ class _DotConstruct(sp.AtomicExpr):
     def branchings(self):
         """return the list of branching lens at SetReferences,
         to be used in aggregation and broadcasting"""
-        if self._target_instances is unknown:
+        if self._structure_version != _StructureVersion.value:
             self._analyse_instances()
         return self._branchings
 
@@ -392,7 +396,7 @@ class _DotConstruct(sp.AtomicExpr):
     def cardinalities(self):
         """return the list of level cardinalities at SetReferences,
         to be used in aggregation and broadcasting"""
-        if self._target_instances is unknown:
+        if self._structure_version != _StructureVersion.value:
             self._analyse_instances()
         return self._cardinalities
 
@@ -429,6 +433,17 @@ class _DotConstruct(sp.AtomicExpr):
         self._target_instances = items
         self._branchings = branchings
         self._cardinalities = cardinalities
+        self._structure_version = _StructureVersion.value
+
+    def _get_target_rows(self, store):
+        """return the rows of the target instances in the target class'
+        _ColumnarStore (or None if they are not all of that class), cached
+        as long as the target instances are"""
+        instances = self.target_instances
+        if self._target_rows_of is not instances:
+            self._target_rows = store.rows_of(instances)
+            self._target_rows_of = instances
+        return self._target_rows
 
     # TODO add a method that differentiates symbolically w.r.t. some variable?
 
@@ -444,13 +459,24 @@ class _DotConstruct(sp.AtomicExpr):
             raise Exception
         if isinstance(self._start, D.Variable):
             items = [getattr(i, self._start.codename) for i in items]
+        last = len(self._attribute_sequence) - 1
         for pos, name in enumerate(self._attribute_sequence):
             if len(items) > 0 and hasattr(items[0], "__iter__"):
-                items = [getattr(i, name)
+                items = [i
                          for instance_set in items
                          for i in instance_set]
-            else:
-                items = [getattr(i, name) for i in items]
+            if pos == last and len(items) > 0:
+                # try reading the whole column at once:
+                store = getattr(items[0], "_columnar_store", None)
+                if store is not None and name in store.values:
+                    # None if items are not all of the same class:
+                    rows = store.rows_of(items)
+                    values = (None if rows is None
+                              else store.read(name, rows))
+                    if values is not None:
+                        items = values
+                        break
+            items = [getattr(i, name) for i in items]
         if self._aggregation:
             assert self._argument is not None, "aggregation without argument"
             # make sure items is list of instances not list of sets:
@@ -497,6 +523,13 @@ class _DotConstruct(sp.AtomicExpr):
         assert self._can_be_target, "cannot serve as target"
         # broadcast values if necessary:
         values = self._broadcast(values)
+        store = self.target_variable._get_store()
+        rows = None if store is None else self._get_target_rows(store)
+        if rows is not None:
+            # several target instances may coincide, hence use add.at:
+            np.add.at(store.derivatives[self._attribute_sequence[-1]],
+                      rows, values)
+            return
         dname = "d_" + self._attribute_sequence[-1]
         for pos, i in enumerate(self.target_instances):
             setattr(i, dname, getattr(i, dname) + values[pos])
@@ -507,6 +540,10 @@ class _DotConstruct(sp.AtomicExpr):
         # broadcast values if necessary:
         values = self._broadcast(values)
         name = self._attribute_sequence[-1]
+        store = self.target_variable._get_store()
+        rows = None if store is None else self._get_target_rows(store)
+        if rows is not None and store.write(name, rows, values):
+            return
         for pos, i in enumerate(self.target_instances):
             setattr(i, name, values[pos])
 
@@ -537,7 +574,7 @@ func2numpy = {
     sp.erfcinv: scipy.special.erfcinv,
     sp.exp: np.exp,
     sp.floor: np.floor,
-    sp.Heaviside: lambda x: 1 - (x < 0).astype(int),
+    sp.Heaviside: lambda x, *H0: 1 - (x < 0).astype(int),  # (ignoring H0)
     sp.log: np.log,
     sp.sin: np.sin,
     sp.sinh: np.sin,
@@ -569,6 +606,56 @@ _cached_iteration = None
 
 have_warned = False
 
+
+def _piecewise(piecevals, condvals):
+    """combine broadcast piece and condition values of a Piecewise"""
+    assert np.all(condvals[1]), "Piecewise only works with args of the form (iftrue, cond), (iffalse, True) yet!"
+    truthvals = condvals[0]
+    trues = list(np.where(truthvals == True)[0])  # "==" is correct here, since it may be a sympy.True!! Do not replace "==" by "is"!!
+    # copy since piecevals[1] may be a cached value:
+    vals = np.array(piecevals[1])
+    vals[trues] = piecevals[0][trues]
+    return vals
+
+
+def _ite(argvals):
+    """combine broadcast argument values of an ITE"""
+    truthvals = argvals[0]
+    trues = list(np.where(truthvals == True)[0])  # "==" is correct here, since it may be a sympy.True!! Do not replace "==" by "is"!!
+    # copy since argvals[2] may be a cached value:
+    vals = np.array(argvals[2])
+    vals[trues] = argvals[1][trues]
+    return vals
+
+
+def _pow(argvals, args):
+    """compute broadcast base values to the power of exponent values,
+    replacing invalid results by zero"""
+    base = argvals[0]
+    exponent = argvals[1]
+    # FIXME: do the following much better!
+#    EPS = 1e-10
+#    LARGE = 1e50
+#    base[np.where(np.isnan(base))] = 0
+#    # try to avoid overflows due to (small abs)**(negative):
+#    base[np.where(np.logical_and(np.abs(base) < EPS, exponent < 0))] = EPS
+#    # try to avoid overflows due to (large abs)**(positive):
+#    base[np.where(np.logical_and(
+#         np.abs(base) > LARGE, exponent > 0))] = LARGE
+#    # try to avoid invalid values due to (negative)**(non-integer):
+#    base[np.where(np.logical_and(base < 0, exponent % 1 != 0))] = EPS
+    vals = base ** exponent
+    isn = np.isnan(vals.astype("float"))
+    if np.any(isn):
+        wh = np.where(isn)[0]
+        global have_warned
+        if not have_warned:
+            have_warned = True
+            print("Warning: invalid value encountered in power\nbase:",
+                  args[0], "=", base[wh], "\nexponent:", args[1], "=", exponent[wh])
+        vals[wh] = 0  # TODO: is this a good idea?
+    return vals
+
 # TODO: use a separate cache for expressions that do not change during ode
 # integration and devaluate it only between integration intervals.
 # TODO: also use sympy to simplify and maybe even solve systems of equations
@@ -648,17 +735,10 @@ def _eval(expr, iteration=None):
                 length = condvals[i].size
                 pos = 0 if length == 1 else cardinalities.index(length)
                 condvals[i] = broadcast(condvals[i], branchings[pos:])
-        assert np.all(condvals[1]), "Piecewise only works with args of the form (iftrue, cond), (iffalse, True) yet!"
-        truthvals = condvals[0]
-        trues = list(np.where(truthvals == True)[0])  # "==" is correct here, since it may be a sympy.True!! Do not replace "==" by "is"!!
-        vals = piecevals[1]
-        vals[trues] = piecevals[0][trues]
+        vals = _piecewise(piecevals, condvals)
     # ternary operators:
     elif t == sp.ITE:
-        truthvals = argvals[0]
-        trues = list(np.where(truthvals == True)[0])  # "==" is correct here, since it may be a sympy.True!! Do not replace "==" by "is"!!
-        vals = argvals[2]
-        vals[trues] = argvals[1][trues]
+        vals = _ite(argvals)
     # n-ary operators:
     elif t in nary2numpy:
         vals = nary2numpy[t](argvals, axis=0)
@@ -670,35 +750,7 @@ def _eval(expr, iteration=None):
     elif t == sp.Nor:
         vals = np.logical_not(np.logical_or(argvals, axis=0))
     elif t == sp.Pow:
-        base = argvals[0]
-        exponent = argvals[1]
-        # FIXME: do the following much better!
-#        EPS = 1e-10
-#        LARGE = 1e50
-#        base[np.where(np.isnan(base))] = 0
-#        # try to avoid overflows due to (small abs)**(negative):
-#        base[np.where(np.logical_and(np.abs(base) < EPS, exponent < 0))] = EPS
-#        # try to avoid overflows due to (large abs)**(positive):
-#        base[np.where(np.logical_and(
-#             np.abs(base) > LARGE, exponent > 0))] = LARGE
-#        # try to avoid invalid values due to (negative)**(non-integer):
-#        base[np.where(np.logical_and(base < 0, exponent % 1 != 0))] = EPS
-#        print(base[:10],exponent[:10])
-        try:
-            pass
-#            base[np.where((base == 0)*(exponent < 0))] = 1e-10
-        except:
-            print("oops! couldn't set values")
-        vals = base ** exponent
-        isn = np.isnan(vals.astype("float"))
-        if np.any(isn):
-            wh = np.where(isn)[0]
-            global have_warned
-            if not have_warned:
-                have_warned = True
-                print("Warning: invalid value encountered in power\nbase:",
-                      args[0], "=", base[wh], "\nexponent:", args[1], "=", exponent[wh])
-            vals[wh] = 0  # TODO: is this a good idea?
+        vals = _pow(argvals, args)
     # TODO: other types of expressions, including function evaluations!
     # other functions/unary operators:
     elif tt == sp.FunctionClass:
@@ -730,6 +782,313 @@ def eval(expr, iteration=None):
     return vals
 
 
+# compiled expressions:
+
+_LOAD, _CONST, _APPLY, _PIECEWISE = range(4)
+"""instruction kinds of a _CompiledExpression"""
+
+
+class _NotCompilable(Exception):
+    """raised when an expression contains a construct _eval cannot handle"""
+    pass
+
+
+def _numpy_op(expr):
+    """return a function computing the values of a non-atomic expression
+    from the list of its broadcast argument values, dispatching in the same
+    way as _eval"""
+    t = type(expr)
+    if t == sp.Not:
+        return np.logical_not
+    if t in binary2numpy:
+        func = binary2numpy[t]
+        return lambda argvals: func(argvals[0], argvals[1])
+    if t == sp.ITE:
+        return _ite
+    if t in nary2numpy:
+        func = nary2numpy[t]
+        return lambda argvals: func(argvals, axis=0)
+    if t == sp.Equivalent:
+        return lambda argvals: np.logical_not(np.logical_xor(argvals, axis=0))
+    if t == sp.Nand:
+        return lambda argvals: np.logical_not(np.logical_and(argvals, axis=0))
+    if t == sp.Nor:
+        return lambda argvals: np.logical_not(np.logical_or(argvals, axis=0))
+    if t == sp.Pow:
+        args = expr.args
+        return lambda argvals: _pow(argvals, args)
+    if type(t) == sp.FunctionClass and t in func2numpy:
+        func = func2numpy[t]
+        return lambda argvals: func(*argvals)
+    raise _NotCompilable(expr)
+
+
+class _CompiledExpression(object):
+    """A symbolic expression compiled into a flat instruction sequence.
+
+    Compilation walks the sympy tree once, merges common subexpressions and
+    resolves each node's numpy operation, so that evaluation is a single
+    loop over the instructions in postorder without recursion or type
+    dispatch. Broadcasting index arrays are cached per instruction as long
+    as the layout (branchings) of the involved arguments does not change.
+    Results are identical to those of eval(), including the use of the
+    expression cache for the given iteration.
+    """
+
+    expr = None
+    """the original symbolic expression"""
+    instructions = None
+    """list of tuples (kind, node, op, argument slots) in evaluation order,
+    or None if the expression could not be compiled"""
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.instructions = []
+        self._layouts = {}
+        self._variable_layouts = {}
+        try:
+            self._compile(expr, {})
+        except _NotCompilable:
+            # evaluate via the tree-walking _eval instead:
+            self.instructions = None
+
+    def _compile(self, expr, slots):
+        """append instructions for expr and its subexpressions,
+        return its slot"""
+        try:
+            return slots[expr]
+        except KeyError:
+            pass
+        except TypeError:  # unhashable
+            raise _NotCompilable(expr)
+        t = type(expr)
+        if t in (D.Variable, _DotConstruct):
+            instruction = (_LOAD, expr, None, ())
+        elif (isinstance(expr, sp.Basic) or type(t) == sp.FunctionClass) \
+                and len(expr.args) > 0 and t != sp.Piecewise:
+            args = tuple(self._compile(arg, slots) for arg in expr.args)
+            instruction = (_APPLY, expr, _numpy_op(expr), args)
+        elif t == sp.Piecewise:
+            args = tuple((self._compile(arg[0], slots),
+                          self._compile(arg[1], slots))
+                         for arg in expr.args)
+            instruction = (_PIECEWISE, expr, None, args)
+        else:
+            # simple scalar for broadcasting, converted as in _eval:
+            if expr is True or expr == sp.true:
+                value = True
+            elif expr is False or expr == sp.false:
+                value = False
+            else:
+                try:
+                    value = float(expr)
+                except (TypeError, ValueError):
+                    raise _NotCompilable(expr)
+            instruction = (_CONST, expr, value, ())
+        self.instructions.append(instruction)
+        slot = slots[expr] = len(self.instructions) - 1
+        return slot
+
+    def _load(self, var):
+        """evaluate a Variable or _DotConstruct, reusing layout lists of
+        Variables while their number of instances is unchanged"""
+        vals = np.array(var.eval())
+        if type(var) is _DotConstruct:
+            return vals, var.cardinalities, var.branchings
+        n = len(var.owning_class.instances)
+        layout = self._variable_layouts.get(var)
+        if layout is None or layout[0] != n:
+            layout = self._variable_layouts[var] = (n, [1, n], [[n]])
+        return vals, layout[1], layout[2]
+
+    def _broadcast_arg(self, key, vals, cardinalities, branchings):
+        """broadcast vals to the level of the longest argument as in _eval,
+        using a cached index array"""
+        length = vals.size
+        pos = 0 if length == 1 else cardinalities.index(length)
+        if pos >= len(branchings):
+            return vals
+        cached = self._layouts.get(key)
+        if cached is not None and cached[0] is branchings \
+                and cached[1] == pos and cached[2] == length:
+            index = cached[3]
+        else:
+            index = np.arange(length)
+            for lens in branchings[pos:]:
+                index = np.repeat(index, lens)
+            self._layouts[key] = (branchings, pos, length, index)
+        return np.asarray(vals[index], dtype=float)
+
+    def _broadcast_all(self, k, results):
+        """broadcast the values of several argument results to the level of
+        the longest one, return values, cardinalities, branchings"""
+        longest = 0
+        for i, res in enumerate(results):
+            if len(res[1]) > len(results[longest][1]):
+                longest = i
+        cardinalities = results[longest][1]
+        branchings = results[longest][2]
+        argvals = [res[0] for res in results]
+        for i in range(len(argvals)):
+            if i != longest:
+                argvals[i] = self._broadcast_arg((k, i), argvals[i],
+                                                 cardinalities, branchings)
+        return argvals, cardinalities, branchings
+
+    def evaluate(self, iteration=None):
+        """return values, cardinalities, and branchings as _eval does"""
+        if self.instructions is None:
+            return _eval(self.expr, iteration=iteration)
+        global _cached_iteration, _cached_values
+        cache = None
+        if iteration is not None:
+            if _cached_iteration != iteration:
+                # clear cache:
+                _cached_values = {}
+                _cached_iteration = iteration
+            cache = _cached_values
+        results = [None] * len(self.instructions)
+        for k, (kind, node, op, args) in enumerate(self.instructions):
+            if cache is not None:
+                res = cache.get(node)
+                if res is not None:
+                    results[k] = res
+                    continue
+            if kind == _LOAD:
+                res = self._load(node)
+            elif kind == _CONST:
+                res = (np.array([op]), [1], [])
+            elif kind == _APPLY:
+                argvals, cardinalities, branchings = self._broadcast_all(
+                    k, [results[a] for a in args])
+                res = (op(argvals), cardinalities, branchings)
+            else:
+                piecevals, piececards, piecebrs = self._broadcast_all(
+                    (k, 0), [results[a[0]] for a in args])
+                condvals, cardinalities, branchings = self._broadcast_all(
+                    (k, 1), [results[a[1]] for a in args])
+                res = (_piecewise(piecevals, condvals),
+                       cardinalities, branchings)
+            results[k] = res
+            if cache is not None:
+                cache[node] = res
+        return results[-1]
+
+    def eval(self, iteration=None):
+        """return values as eval(self.expr, iteration) does"""
+        return self.evaluate(iteration)[0]
+
+
+def compile_expression(expr):
+    """compile a symbolic expression into a _CompiledExpression"""
+    return _CompiledExpression(expr)
+
+
+# instance-level dependencies:
+
+def _broadcast_index(length, cardinalities, branchings):
+    """return the index array that broadcasts a list of the given length
+    to the level given by cardinalities and branchings in the same way as
+    broadcast() does, or None if no broadcasting is needed"""
+    pos = 0 if length == 1 else cardinalities.index(length)
+    if pos >= len(branchings):
+        return None
+    index = np.arange(length)
+    for lens in branchings[pos:]:
+        index = np.repeat(index, lens)
+    return index
+
+
+def _broadcast_sets(sets, cardinalities, branchings):
+    """broadcast a list of sets to the level given by cardinalities and
+    branchings in the same way as broadcast() does with values"""
+    index = _broadcast_index(len(sets), cardinalities, branchings)
+    if index is None:
+        return sets
+    return [sets[i] for i in index]
+
+
+def _aggregation_lens(expr, cardinalities, branchings):
+    """return the lengths of the consecutive groups of argument values
+    that the aggregating _DotConstruct expr aggregates over, given the
+    argument's cardinalities and branchings"""
+    items = expr.owning_class.instances
+    if isinstance(expr._start, D.Variable):
+        items = [getattr(i, expr._start.codename) for i in items]
+    for name in expr._attribute_sequence:
+        if len(items) > 0 and hasattr(items[0], "__iter__"):
+            items = [i for instance_set in items for i in instance_set]
+        items = [getattr(i, name) for i in items]
+    if len(items) > 0 and hasattr(items[0], "__iter__"):
+        items = [i for instance_set in items for i in instance_set]
+    try:
+        aggregation_level = cardinalities.index(len(items))
+    except ValueError:
+        aggregation_level = len(cardinalities) - 1
+    layout = branchings[aggregation_level:] \
+        if aggregation_level < len(cardinalities) - 1 \
+        else [[1 for i in items]]
+    return layout2lens(layout)
+
+
+def _eval_dependencies(expr):
+    """return the list of sets of (Variable, instance) pairs that the values
+    returned by _eval(expr) depend on, together with their cardinalities and
+    branchings"""
+    t = type(expr)
+    if t == D.Variable:
+        return ([{(expr, i)} for i in expr.owning_class.instances],
+                expr.cardinalities, expr.branchings)
+    elif t == _DotConstruct:
+        if expr._aggregation:
+            # group the argument's dependencies in the same way as
+            # _DotConstruct.eval groups the argument's values:
+            argdeps, cardinalities, branchings = \
+                _eval_dependencies(expr._argument)
+            deps = []
+            offset = 0
+            for le in _aggregation_lens(expr, cardinalities, branchings):
+                deps.append(set().union(*argdeps[offset:offset + le]))
+                offset += le
+        else:
+            items = expr.owning_class.instances
+            if isinstance(expr._start, D.Variable):
+                items = [getattr(i, expr._start.codename) for i in items]
+            for name in expr._attribute_sequence[:-1]:
+                if len(items) > 0 and hasattr(items[0], "__iter__"):
+                    items = [i for instance_set in items for i in instance_set]
+                items = [getattr(i, name) for i in items]
+            if len(items) > 0 and hasattr(items[0], "__iter__"):
+                items = [i for instance_set in items for i in instance_set]
+            name = expr._attribute_sequence[-1]
+            deps = [{(getattr(i.__class__, name), i)} for i in items]
+        return deps, expr.cardinalities, expr.branchings
+    elif t == sp.Piecewise:
+        args = [a for pair in expr.args for a in pair]
+    elif (isinstance(expr, sp.Basic) or type(t) == sp.FunctionClass) \
+            and len(expr.args) > 0:
+        args = expr.args
+    else:
+        # a constant:
+        return [set()], [1], []
+    results = [_eval_dependencies(arg) for arg in args]
+    longest = np.argmax([len(res[1]) for res in results])
+    cardinalities = results[longest][1]
+    branchings = results[longest][2]
+    argdeps = [res[0] if i == longest
+               else _broadcast_sets(res[0], cardinalities, branchings)
+               for i, res in enumerate(results)]
+    deps = [set().union(*elementdeps) for elementdeps in zip(*argdeps)]
+    return deps, cardinalities, branchings
+
+
+def get_instance_dependencies(expr):
+    """return a list of sets of (Variable, instance) pairs, one for each
+    value returned by eval(expr), containing the attributes this value
+    directly depends on"""
+    return _eval_dependencies(expr)[0]
+
+
 def get_vars(expr):
     """find all variables occurring in Expression"""
     if isinstance(expr, (D.Variable, _DotConstruct)):
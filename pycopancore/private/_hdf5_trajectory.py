@@ -0,0 +1,375 @@
+"""_HDF5TrajectoryWriter and _HDF5TrajectoryReader classes.
+
+Storage of model trajectories in HDF5 files (using the optional dependency
+h5py). The file contains
+
+- a dataset "t" of time points, and
+- for each Variable a group "variables/<Variable>" (e.g.
+  "variables/World.atmospheric_carbon") with the datasets
+
+  - "values": typed values (time points x instances), chunked and
+    compressed,
+  - "valid": boolean mask (time points x instances) telling which values
+    are valid (i.e., not while an entity was inactive or before it was
+    created),
+  - "uids": UIDs of the instances (-1 for process taxa),
+  - "instances": string representations of the instances,
+
+  and the attributes "entity_type", "codename" and "kind".
+
+The kind of a Variable determines how its values are stored: "float",
+"int" and "bool" as the corresponding numbers, "reference" as the UID of
+the referenced entity (-1 for None or process taxa), and "set" as a
+variable-length array of UIDs. Variables of other datatypes (e.g. networks
+or lists) are not stored.
+
+Values are appended incrementally from a _TrajectoryRecorder, so that the
+trajectory can be written while the model runs and the recorder may
+discard the time points already written.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import logging
+import numbers
+
+import numpy as np
+
+from .. import data_model as D
+
+logger = logging.getLogger(__name__)
+
+file_version = 1
+"""version of the file layout"""
+
+_fill_values = {"float": np.nan, "int": 0, "bool": False, "reference": -1}
+
+
+def _import_h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError("saving trajectories as HDF5 requires h5py")
+    return h5py
+
+
+def _kind(var):
+    """Return how the values of var are stored, or None if they cannot."""
+    if isinstance(var, D.SetVariable):
+        return "set"
+    if isinstance(var, D.ReferenceVariable):
+        return "reference"
+    datatype = var.datatype
+    if not isinstance(datatype, type):
+        return None
+    if issubclass(datatype, (bool, np.bool_)):
+        return "bool"
+    if issubclass(datatype, (numbers.Integral, np.integer)):
+        return "int"
+    if issubclass(datatype, (numbers.Real, np.floating)):
+        return "float"
+    return None
+
+
+def _uid(inst):
+    return -1 if inst is None else getattr(inst, "_uid", -1)
+
+
+_is_not_none = np.vectorize(lambda value: value is not None, otypes=[bool])
+
+
+class _HDF5TrajectoryWriter(object):
+    """Writer appending the time points of a _TrajectoryRecorder to an
+    HDF5 file."""
+
+    n_written = None
+    """number of time points written"""
+
+    def __init__(self, filename, recorder, *, state=None, chunk_rows=256,
+                 compression="gzip"):
+        """Create an HDF5 file or continue writing to it.
+
+        Parameters
+        ----------
+        filename : str
+            name of the file
+        recorder : _TrajectoryRecorder
+            the recorder whose time points are written
+        state : dict, optional
+            state() of a writer that wrote to the file before. If given,
+            the file is truncated to that state and writing continues
+        chunk_rows : int, optional
+            number of time points per chunk
+        compression : str, optional
+            compression filter of the datasets
+        """
+        h5py = _import_h5py()
+        self.recorder = recorder
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+        self._datasets = {}
+        self._skipped = set()
+        if state is None:
+            self.file = h5py.File(filename, "w")
+            self.file.attrs["file-version"] = file_version
+            self.file.create_dataset("t", shape=(0,), maxshape=(None,),
+                                     dtype=float, chunks=(chunk_rows,))
+            self.file.create_group("variables")
+            self.n_written = 0
+        else:
+            self.file = h5py.File(filename, "r+")
+            self.n_written = state["n_written"]
+            self.file["t"].resize((self.n_written,))
+            for name, n_columns in state["columns"].items():
+                group = self.file["variables"][name]
+                for key in ("values", "valid"):
+                    group[key].resize((self.n_written, n_columns))
+                for key in ("uids", "instances"):
+                    group[key].resize((n_columns,))
+                self._datasets[name] = group
+            for name in list(self.file["variables"]):
+                if name not in state["columns"]:
+                    del self.file["variables"][name]
+
+    def state(self):
+        """Return what is needed to continue writing after the recorder
+        was restored from a checkpoint."""
+        return {"n_written": self.n_written,
+                "columns": {name: group["uids"].shape[0]
+                            for name, group in self._datasets.items()}}
+
+    @property
+    def n_pending(self):
+        """number of the recorder's time points not yet written"""
+        return self.recorder.n_times + self.recorder.n_discarded \
+            - self.n_written
+
+    def write(self, final=False):
+        """Append the recorder's time points that were not written yet.
+
+        Unless final is True, the last time point is not written if the
+        recorder reduces the resolution, since it might still be replaced.
+        """
+        recorder = self.recorder
+        end = recorder.n_times
+        if not final and recorder.min_spacing is not None:
+            end -= 1
+        start = self.n_written - recorder.n_discarded
+        if end <= start:
+            return
+        n = self.n_written + end - start
+        self.file["t"].resize((n,))
+        self.file["t"][self.n_written:n] = recorder._times[start:end]
+        for var, trajectory in recorder.variables.items():
+            if trajectory.instances:
+                self._write_variable(var, trajectory, start, end)
+        self.n_written = n
+        self.file.flush()
+
+    def _group(self, var, kind):
+        """Return the group of var, creating it if necessary."""
+        name = str(var)
+        try:
+            return self._datasets[name]
+        except KeyError:
+            pass
+        h5py = _import_h5py()
+        group = self.file["variables"].create_group(name)
+        group.attrs["entity_type"] = var.owning_class.__name__
+        group.attrs["codename"] = var.codename
+        group.attrs["kind"] = kind
+        chunks = (self.chunk_rows, 64)
+        if kind == "set":
+            dtype = h5py.vlen_dtype(np.dtype(np.int64))
+            fillvalue = None
+        else:
+            dtype = {"float": float, "int": np.int64, "bool": bool,
+                     "reference": np.int64}[kind]
+            fillvalue = _fill_values[kind]
+        group.create_dataset("values", shape=(self.n_written, 0),
+                             maxshape=(None, None), dtype=dtype,
+                             chunks=chunks, fillvalue=fillvalue,
+                             compression=self.compression, shuffle=True)
+        group.create_dataset("valid", shape=(self.n_written, 0),
+                             maxshape=(None, None), dtype=bool,
+                             chunks=chunks, compression=self.compression)
+        group.create_dataset("uids", shape=(0,), maxshape=(None,),
+                             dtype=np.int64, chunks=(64,))
+        group.create_dataset("instances", shape=(0,), maxshape=(None,),
+                             dtype=h5py.string_dtype(), chunks=(64,))
+        self._datasets[name] = group
+        return group
+
+    def _write_variable(self, var, trajectory, start, end):
+        """Append rows start to end of a variable's trajectory."""
+        kind = _kind(var)
+        if kind is None:
+            if var not in self._skipped:
+                self._skipped.add(var)
+                logger.warning("Values of %s (datatype %s) are not written "
+                               "to HDF5", var, var.datatype)
+            return
+        group = self._group(var, kind)
+        n_columns = len(trajectory.instances)
+        n_old = group["uids"].shape[0]
+        n = self.n_written + end - start
+        if n_columns > n_old:
+            # new instances, append their columns:
+            new = trajectory.instances[n_old:n_columns]
+            group["uids"].resize((n_columns,))
+            group["uids"][n_old:] = [_uid(inst) for inst in new]
+            group["instances"].resize((n_columns,))
+            group["instances"][n_old:] = [str(inst) for inst in new]
+        for key in ("values", "valid"):
+            group[key].resize((n, n_columns))
+        values = trajectory._values[start:end, :n_columns]
+        valid = trajectory._valid[start:end, :n_columns] \
+            & (np.arange(start, end)[:, None]
+               < trajectory.lengths[:n_columns])
+        if values.dtype == object:
+            valid &= _is_not_none(values)
+        group["valid"][self.n_written:n] = valid
+        group["values"][self.n_written:n] = \
+            self._convert(var, kind, values, valid)
+
+    @staticmethod
+    def _convert(var, kind, values, valid):
+        """Return an array of the stored representation of values."""
+        if kind == "set":
+            out = np.empty(values.shape, dtype=object)
+            empty = np.zeros(0, dtype=np.int64)
+            for index in np.ndindex(values.shape):
+                out[index] = np.array(sorted(_uid(inst)
+                                             for inst in values[index]),
+                                      dtype=np.int64) \
+                    if valid[index] else empty
+            return out
+        if kind == "reference":
+            out = np.full(values.shape, -1, dtype=np.int64)
+            for index in zip(*np.nonzero(valid)):
+                out[index] = _uid(values[index])
+            return out
+        dtype = {"float": float, "int": np.int64, "bool": bool}[kind]
+        if values.dtype != object:
+            out = values.astype(dtype)
+            out[~valid] = _fill_values[kind]
+            return out
+        out = np.full(values.shape, _fill_values[kind], dtype=dtype)
+        try:
+            out[valid] = np.asarray(values[valid].tolist(), dtype=dtype)
+        except (TypeError, ValueError):
+            raise TypeError("values of " + str(var) + " are not of type "
+                            + kind)
+        return out
+
+    def close(self):
+        """Close the file."""
+        self.file.close()
+
+
+class _HDF5TrajectoryReader(object):
+    """Reader of trajectories written by _HDF5TrajectoryWriter.
+
+    Values are only read from the file when they are accessed, and only the
+    requested time points and instances.
+    """
+
+    def __init__(self, filename):
+        """Open an HDF5 trajectory file for reading."""
+        h5py = _import_h5py()
+        self.file = h5py.File(filename, "r")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Close the file."""
+        self.file.close()
+
+    @property
+    def variables(self):
+        """list of the names of the stored Variables"""
+        return list(self.file["variables"])
+
+    @property
+    def entity_types(self):
+        """dict mapping the names of entity types and process taxa to the
+        names of their stored Variables"""
+        entity_types = {}
+        for name, group in self.file["variables"].items():
+            entity_types.setdefault(str(group.attrs["entity_type"]),
+                                    []).append(name)
+        return entity_types
+
+    @property
+    def times(self):
+        """array of time points"""
+        return self.file["t"][:]
+
+    def uids(self, name):
+        """Return the array of UIDs of the instances of a Variable."""
+        return self.file["variables"][name]["uids"][:]
+
+    def instances(self, name):
+        """Return the list of string representations of the instances of a
+        Variable."""
+        return [s.decode() if isinstance(s, bytes) else s
+                for s in self.file["variables"][name]["instances"][:]]
+
+    def _columns(self, name, uids):
+        if uids is None:
+            return slice(None)
+        positions = {uid: i for i, uid in enumerate(self.uids(name))}
+        return [positions[uid] for uid in uids]
+
+    def values(self, name, times=slice(None), uids=None):
+        """Return the values of a Variable.
+
+        Parameters
+        ----------
+        name : str
+            name of the Variable, as in variables
+        times : slice or array, optional
+            time point indices to read (default: all)
+        uids : list, optional
+            UIDs of the instances to read (default: all)
+
+        Returns
+        -------
+        array
+            values (time points x instances), with fill values (nan for
+            floats) where they are not valid, see mask()
+        """
+        data = self.file["variables"][name]["values"]
+        values = data[times]
+        return values[:, self._columns(name, uids)]
+
+    def mask(self, name, times=slice(None), uids=None):
+        """Return the boolean array (time points x instances) telling which
+        values of a Variable are valid, see values()."""
+        valid = self.file["variables"][name]["valid"][times]
+        return valid[:, self._columns(name, uids)]
+
+    def to_dict(self):
+        """Return the whole trajectory as a dict with key 't' (list of time
+        points) and, for each Variable name, a dict mapping the instances'
+        string representations to lists of values (None where not valid)."""
+        result = {"t": self.times.tolist()}
+        for name in self.variables:
+            values = self.values(name)
+            valid = self.mask(name)
+            result[name] = {
+                inst: [value if ok else None for value, ok
+                       in zip(values[:, i].tolist(), valid[:, i])]
+                for i, inst in enumerate(self.instances(name))}
+        return result
@@ -20,6 +20,8 @@ It sets the basic structure of mixins (entity types, process taxa).
 
 from ..data_model import variable
 from ..private._expressions import _DotConstruct, aggregation_names
+from ..private._structure_version import _StructureVersion, \
+    _ReferenceAttribute
 from ..data_model import OrderedSet
 
 import inspect
@@ -52,6 +54,8 @@ class _MixinType(type):
 #            print("new aggregation dot construct",dc,"at",cls,"with aggregation",name)
             return dc
         res = type.__getattribute__(cls, name)
+        if type(res) is _ReferenceAttribute:
+            return res.variable
         if isinstance(res, property):
             # find first overridden attribute in method resolution
             # order that is not a property (but a Variable object):
@@ -88,6 +92,13 @@ class _Mixin(object, metaclass=_MixinType):
     """Active entities of this type"""
     _composite_class = None
     """Composite class this mixin contributes to in the current model"""
+    _instances_version = 0
+    """counter increased whenever the list of instances changes"""
+    _tracked_references = None
+    """codenames of references whose assignment increases the
+    _StructureVersion"""
+    _columnar_store = None
+    """_ColumnarStore holding Variable values if configured as columnar"""
 
     # needed to make sphinx happy:
     __qualname__ = "pycopancore.private._mixin._Mixin"
@@ -136,7 +147,8 @@ class _Mixin(object, metaclass=_MixinType):
         """assign default values to all unset Variables"""
         for var in self.variables:
             if (not hasattr(self, var.codename)  # this happens for unset properties
-                or isinstance(getattr(self, var.codename), variable.Variable)):
+                or isinstance(getattr(self, var.codename),
+                              (variable.Variable, _ReferenceAttribute))):
                 # class attribute was returned by getattr,
                 # hence object attribute has not been assigned a value yet. 
                 try:
@@ -148,6 +160,13 @@ class _Mixin(object, metaclass=_MixinType):
 #    def __str__(self):
 #        return repr(self)
 
+    @classmethod
+    def _instances_changed(cls):
+        """Mark the list of instances and the instance structure as
+        changed."""
+        cls._instances_version += 1
+        _StructureVersion.increase()
+
     def set_value(self, var, value):
         """Dummy docstring"""
         # TODO: add docstring to method
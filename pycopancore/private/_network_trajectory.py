@@ -0,0 +1,212 @@
+"""_NetworkState class.
+
+Delta encoding of the trajectories of network-valued Variables (networkx
+graphs such as Culture.acquaintance_network). Instead of a reference to the
+(mutable) graph, each recorded time point holds a _NetworkState, which is
+either a keyframe (a snapshot of the graph's nodes and edges) or the
+changes (added and removed nodes and edges) since the previous state. If
+the network did not change, the previous state itself is recorded again, so
+that a network that rewires rarely costs almost no memory. A keyframe is
+recorded after every keyframe_interval changes to bound the time needed to
+rebuild a graph.
+
+Only the structure of networks is recorded, not the attributes of their
+nodes and edges.
+
+For saving, the states of a trajectory are converted to a network log, a
+dict with the entries
+
+- "directed": whether the graph is directed,
+- "keyframes": list of [index, nodes, edges],
+- "changes": list of [index, added nodes, removed nodes, added edges,
+  removed edges],
+- "invalid": list of indices at which the network was not recorded (e.g.
+  while its owner was inactive),
+
+where index is the index of the time point, from which graph_at() rebuilds
+the graph at any time point.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import networkx as nx
+
+
+def _edge_keys(graph):
+    """Return the set of edges of graph, as frozensets of their end nodes
+    if graph is undirected."""
+    if graph.is_directed():
+        return set(graph.edges())
+    return {frozenset(edge) for edge in graph.edges()}
+
+
+def _edge_nodes(edge):
+    """Return the end nodes of an edge returned by _edge_keys()."""
+    if isinstance(edge, frozenset):
+        return tuple(edge) if len(edge) == 2 else tuple(edge) * 2
+    return edge
+
+
+class _NetworkState(object):
+    """Structure of a network at one time point, encoded as a keyframe or
+    as changes relative to a previous _NetworkState."""
+
+    __slots__ = ("previous", "depth", "graph_class", "added_nodes",
+                 "removed_nodes", "added_edges", "removed_edges")
+
+    def __init__(self, previous, graph_class, added_nodes, removed_nodes,
+                 added_edges, removed_edges):
+        self.previous = previous
+        self.depth = 0 if previous is None else previous.depth + 1
+        self.graph_class = graph_class
+        self.added_nodes = frozenset(added_nodes)
+        self.removed_nodes = frozenset(removed_nodes)
+        self.added_edges = frozenset(added_edges)
+        self.removed_edges = frozenset(removed_edges)
+
+    def __getstate__(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+
+    @classmethod
+    def record(cls, graph, last, keyframe_interval):
+        """Return the state of graph and its sets of nodes and edges.
+
+        Parameters
+        ----------
+        graph : networkx.Graph
+            the network to record
+        last : tuple or None
+            the return value of the previous call for the same network
+        keyframe_interval : int
+            maximum number of changes between two keyframes
+
+        Returns
+        -------
+        tuple
+            (state, nodes, edges), where state is last's state if graph
+            did not change since
+        """
+        nodes = set(graph.nodes())
+        edges = _edge_keys(graph)
+        if last is not None:
+            state, last_nodes, last_edges = last
+            if nodes == last_nodes and edges == last_edges:
+                return last
+            if state.depth < keyframe_interval \
+                    and state.graph_class is graph.__class__:
+                return (cls(state, graph.__class__,
+                            nodes - last_nodes, last_nodes - nodes,
+                            edges - last_edges, last_edges - edges),
+                        nodes, edges)
+        return cls(None, graph.__class__, nodes, (), edges, ()), nodes, edges
+
+    def sets(self):
+        """Return the sets of nodes and edges of this state."""
+        chain = []
+        state = self
+        while state is not None:
+            chain.append(state)
+            state = state.previous
+        nodes = set()
+        edges = set()
+        for state in reversed(chain):
+            nodes -= state.removed_nodes
+            nodes |= state.added_nodes
+            edges -= state.removed_edges
+            edges |= state.added_edges
+        return nodes, edges
+
+    def graph(self):
+        """Return a new graph with the structure of this state."""
+        nodes, edges = self.sets()
+        graph = self.graph_class()
+        graph.add_nodes_from(nodes)
+        graph.add_edges_from(_edge_nodes(edge) for edge in edges)
+        return graph
+
+
+def _graphs(states):
+    """Return a list of graphs for a list of _NetworkStates (or None),
+    sharing one graph between consecutive time points with the same
+    state."""
+    graphs = []
+    last_state = last_graph = None
+    for state in states:
+        if state is None:
+            graphs.append(None)
+            continue
+        if state is not last_state:
+            last_state = state
+            last_graph = state.graph()
+        graphs.append(last_graph)
+    return graphs
+
+
+def network_log(states, node_key=str):
+    """Return the network log (see module docstring) of a list of
+    _NetworkStates (None where not valid), with nodes converted by
+    node_key."""
+    log = {"directed": False, "keyframes": [], "changes": [], "invalid": []}
+
+    def convert_edges(edges):
+        return [[node_key(node) for node in _edge_nodes(edge)]
+                for edge in edges]
+
+    last = None
+    for index, state in enumerate(states):
+        if state is None:
+            if log["keyframes"]:
+                log["invalid"].append(index)
+            last = None
+            continue
+        if state is last:
+            continue
+        log["directed"] = state.graph_class().is_directed()
+        if last is None or state.previous is not last:
+            # a keyframe (also after a gap or a dropped time point):
+            nodes, edges = state.sets()
+            log["keyframes"].append([index, [node_key(node)
+                                             for node in nodes],
+                                     convert_edges(edges)])
+        else:
+            log["changes"].append([
+                index,
+                [node_key(node) for node in state.added_nodes],
+                [node_key(node) for node in state.removed_nodes],
+                convert_edges(state.added_edges),
+                convert_edges(state.removed_edges)])
+        last = state
+    return log
+
+
+def graph_at(log, index):
+    """Rebuild the graph at the time point with the given index from a
+    network log (see network_log()), or return None if the network was
+    not recorded at that time point."""
+    keyframes = [keyframe for keyframe in log["keyframes"]
+                 if keyframe[0] <= index]
+    if not keyframes or index in log["invalid"]:
+        return None
+    start, nodes, edges = keyframes[-1]
+    graph = nx.DiGraph() if log["directed"] else nx.Graph()
+    graph.add_nodes_from(nodes)
+    graph.add_edges_from(edges)
+    for change_index, added_nodes, removed_nodes, added_edges, \
+            removed_edges in log["changes"]:
+        if start < change_index <= index:
+            graph.remove_edges_from(removed_edges)
+            graph.remove_nodes_from(removed_nodes)
+            graph.add_nodes_from(added_nodes)
+            graph.add_edges_from(added_edges)
+    return graph
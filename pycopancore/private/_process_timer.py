@@ -0,0 +1,142 @@
+"""_ProcessTimer class.
+
+Instrumentation of model runs: the Runner reports the wall-clock time and
+number of calls of each process (and of the other things it does between
+ODE solver steps) to a _ProcessTimer, split by the phase of the run scheme
+in which they happen:
+
+- "RHS explicits": Explicit processes applied during ODE integration
+  (for evaluating the RHS or the analytic Jacobian),
+- "RHS ODE terms": ODE processes,
+- "ex-post explicits": Explicit processes applied to output time points
+  and after Steps and Events,
+- "Steps" and "Events": Step and Event processes, including the
+  computation of their next occurrence,
+- "hooks": pre-, mid- and post-hooks,
+- "output": saving of each Variable to the trajectory and writing of
+  output files.
+
+The Runner only uses a _ProcessTimer if run() is called with timing=True,
+so that runs without it are not slowed down.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+from time import perf_counter
+
+phases = ("RHS explicits", "RHS ODE terms", "ex-post explicits", "Steps",
+          "Events", "hooks", "output")
+"""phases of a run in which processes are timed"""
+
+
+def _label(item):
+    """Return the name of a process, Variable or other timed item."""
+    owning_class = getattr(item, "owning_class", None)
+    if owning_class is not None and hasattr(item, "type"):
+        return owning_class.__name__ + "." + item.name
+    return str(item)
+
+
+class _ProcessTimer(object):
+    """Accumulator of wall-clock times and call counts per phase and
+    process."""
+
+    stats = None
+    """dict mapping (phase, process) to [number of calls, seconds]"""
+    total = None
+    """wall-clock time in seconds of the whole run, set by stop()"""
+
+    def __init__(self):
+        self.stats = {}
+        self.total = None
+        self._start = perf_counter()
+
+    def add(self, phase, item, seconds, calls=1):
+        """Add the time and number of calls of a process (or of a Variable,
+        hook type etc.) in a phase."""
+        try:
+            entry = self.stats[phase, item]
+        except KeyError:
+            entry = self.stats[phase, item] = [0, 0.0]
+        entry[0] += calls
+        entry[1] += seconds
+
+    def stop(self):
+        """Register the end of the run."""
+        self.total = perf_counter() - self._start
+
+    def rows(self):
+        """Return the list of (phase, name, calls, seconds), sorted by
+        decreasing time."""
+        rows = [(phase, _label(item), calls, seconds)
+                for (phase, item), (calls, seconds) in self.stats.items()]
+        rows.sort(key=lambda row: -row[3])
+        return rows
+
+    def phase_totals(self):
+        """Return a dict mapping each phase to its total time in
+        seconds."""
+        totals = dict.fromkeys(phases, 0.0)
+        for (phase, item), (calls, seconds) in self.stats.items():
+            totals[phase] = totals.get(phase, 0.0) + seconds
+        return totals
+
+    def summary(self, limit=None):
+        """Return a table of the times and call counts of all processes,
+        sorted by decreasing time, followed by the totals of the phases.
+
+        Parameters
+        ----------
+        limit : int, optional
+            maximum number of processes to list (default: all)
+        """
+        total = self.total or sum(seconds
+                                  for calls, seconds in self.stats.values())
+        rows = self.rows()
+        width = max([len(name) for phase, name, calls, seconds in rows]
+                    + [len("process")])
+        line = "%-17s  %-" + str(width) + "s  %9s  %11s  %6s"
+        lines = [line % ("phase", "process", "calls", "seconds", "%")]
+        for phase, name, calls, seconds in rows[:limit]:
+            lines.append(line % (phase, name, calls, "%.6f" % seconds,
+                                 "%.1f" % (100 * seconds / total)
+                                 if total else ""))
+        lines.append("")
+        for phase, seconds in self.phase_totals().items():
+            if seconds > 0:
+                lines.append(line % (phase, "(total)", "", "%.6f" % seconds,
+                                     "%.1f" % (100 * seconds / total)
+                                     if total else ""))
+        if self.total is not None:
+            lines.append(line % ("run", "(total)", "", "%.6f" % self.total,
+                                 "100.0"))
+        return "\n".join(lines)
+
+    def collapsed_stacks(self):
+        """Return the timings in the collapsed stack format read by
+        flamegraph tools (e.g. flamegraph.pl or speedscope): one line
+        "run;phase;process microseconds" for each process."""
+        lines = []
+        for (phase, item), (calls, seconds) in self.stats.items():
+            name = _label(item).replace(";", ",")
+            lines.append("run;%s;%s %d" % (phase, name,
+                                           round(seconds * 1e6)))
+        if self.total is not None:
+            # time not spent in any timed process (e.g. in the ODE solver):
+            rest = self.total - sum(seconds
+                                    for calls, seconds in self.stats.values())
+            if rest > 0:
+                lines.append("run %d" % round(rest * 1e6))
+        return "\n".join(lines) + "\n"
+
+    def write_collapsed_stacks(self, filename):
+        """Write collapsed_stacks() to a file."""
+        with open(filename, "w") as f:
+            f.write(self.collapsed_stacks())
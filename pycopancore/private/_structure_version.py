@@ -0,0 +1,101 @@
+"""_StructureVersion class.
+
+Version counter of the instance structure of the current model, i.e., of
+which entities and process taxa exist and are active, and how they refer to
+each other via ReferenceVariables and SetVariables. It is increased whenever
+some class' list of instances changes and whenever a reference is assigned,
+so that layouts derived from the structure (such as the instances targeted by
+a _DotConstruct or the layout of the runner's ODE value array) can be cached
+as long as the version is unchanged.
+
+Note that changing the contents of a set referenced by a SetVariable in
+place does not increase the version, only assigning to the attribute does
+(as the setters of the base component do to reset their caches).
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# License: BSD 2-clause license
+
+
+class _StructureVersion(object):
+    """Global counter of changes to the instance structure."""
+
+    value = 0
+    """current version"""
+
+    @classmethod
+    def increase(cls):
+        """Mark all layouts derived from the structure as outdated."""
+        cls.value += 1
+
+    @staticmethod
+    def track_references(composed_class, variables):
+        """Make assignments to the given ReferenceVariables and SetVariables
+        of composed_class increase the version.
+
+        Setters of properties implementing a Variable are wrapped, plain
+        attributes get a _ReferenceAttribute.
+        """
+        tracked = []
+        for var in variables:
+            cn = var.codename
+            for c in composed_class.__mro__:
+                if cn in c.__dict__:
+                    attr = c.__dict__[cn]
+                    break
+            else:
+                attr = None
+            if isinstance(attr, property):
+                if attr.fset is None:
+                    continue  # read-only
+                setattr(composed_class, cn,
+                        property(attr.fget, _tracked_setter(attr.fset),
+                                 attr.fdel, attr.__doc__))
+            elif attr is var or attr is None:
+                setattr(composed_class, cn, _ReferenceAttribute(var))
+            else:
+                continue
+            tracked.append(cn)
+        composed_class._tracked_references = tracked
+
+    @staticmethod
+    def untrack_references(composed_class):
+        """Undo track_references()."""
+        tracked = composed_class.__dict__.get("_tracked_references")
+        if tracked is None:
+            return
+        for cn in tracked:
+            if cn in composed_class.__dict__:
+                delattr(composed_class, cn)
+        del composed_class._tracked_references
+
+
+def _tracked_setter(fset):
+    """Return a property setter calling fset and increasing the version."""
+    def setter(inst, value):
+        fset(inst, value)
+        _StructureVersion.value += 1
+    return setter
+
+
+class _ReferenceAttribute(object):
+    """Data descriptor increasing the structure version when a reference
+    is assigned.
+
+    It has no __get__ method, so that reading the attribute still finds
+    the value in the instance's __dict__ as fast as for a plain attribute.
+    Accessed at the class, _MixinType returns the Variable instead.
+    """
+
+    def __init__(self, variable):
+        self.variable = variable
+        self.codename = variable.codename
+
+    def __set__(self, inst, value):
+        inst.__dict__[self.codename] = value
+        _StructureVersion.value += 1
@@ -0,0 +1,156 @@
+"""_SymbolicJacobian class.
+
+Symbolic differentiation of process specifications. A _SymbolicJacobian
+holds the partial derivatives of a symbolic expression with respect to
+those of its Variables and _DotConstructs that may change during ODE
+integration, compiled for fast evaluation. Evaluating it gives the sparse
+Jacobian of the expression's values with respect to the ODE value array,
+by the chain rule through the instance structure: references select single
+rows of the referenced variable's Jacobian, aggregations sum or average
+rows, and broadcasting repeats rows.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import numpy as np
+import sympy as sp
+from scipy.sparse import csr_matrix, diags
+
+from .. import data_model as D
+from ._expressions import _DotConstruct, compile_expression, get_vars, \
+    get_instance_dependencies, _broadcast_index, _aggregation_lens
+
+
+class _NotDifferentiable(Exception):
+    """raised when a specification cannot be differentiated symbolically"""
+    pass
+
+
+differentiable_aggregations = ("sum", "mean")
+"""aggregations whose derivatives are supported"""
+
+
+class _SymbolicJacobian(object):
+    """Compiled partial derivatives of a symbolic expression."""
+
+    expr = None
+    """the differentiated expression"""
+    terms = None
+    """list of tuples (atom, compiled partial derivative, _SymbolicJacobian
+    of the atom's argument or None), one for each Variable or
+    _DotConstruct in expr that may change during ODE integration"""
+
+    def __init__(self, expr, variables):
+        """Differentiate expr.
+
+        Parameters
+        ----------
+        expr : Expr
+            symbolic expression
+        variables : set
+            Variables that may change during ODE integration, i.e.,
+            ODE and Explicit targets
+
+        Raises
+        ------
+        _NotDifferentiable
+            if a partial derivative cannot be evaluated numerically
+        """
+        self.expr = expr
+        self.compiled = compile_expression(expr)
+        self.terms = []
+        if isinstance(expr, (D.Variable, _DotConstruct)):
+            atoms = [expr]
+        elif isinstance(expr, sp.Basic):
+            atoms = sorted(expr.atoms(D.Variable, _DotConstruct), key=str)
+        else:
+            atoms = []
+        for atom in atoms:
+            argument = None
+            if type(atom) == _DotConstruct and atom._aggregation:
+                if not get_vars(atom._argument) & variables:
+                    continue
+                if atom._aggregation not in differentiable_aggregations:
+                    raise _NotDifferentiable(atom)
+                argument = _SymbolicJacobian(atom._argument, variables)
+            elif type(atom) == _DotConstruct:
+                if atom.target_variable not in variables:
+                    continue
+            elif type(atom) == D.Variable:
+                if atom not in variables:
+                    continue
+            else:
+                continue
+            dummy = sp.Dummy()
+            partial = sp.diff(expr.xreplace({atom: dummy}), dummy) \
+                .xreplace({dummy: atom})
+            if partial == 0:
+                continue
+            compiled = compile_expression(partial)
+            if compiled.instructions is None:
+                raise _NotDifferentiable(partial)
+            self.terms.append((atom, compiled, argument))
+
+    def evaluate(self, jacobian_of, n_columns, iteration=None):
+        """Evaluate the Jacobian of the expression's values.
+
+        Parameters
+        ----------
+        jacobian_of : callable
+            function(var) returning the Jacobian of the values of var
+            (one row for each instance of var.owning_class) as a sparse
+            matrix, and a dict mapping these instances to their rows
+        n_columns : int
+            length of the ODE value array
+        iteration : int, optional
+            iteration for the expression cache
+
+        Returns
+        -------
+        tuple
+            Jacobian as a sparse matrix with one row for each value of the
+            expression, and the expression's cardinalities and branchings
+        """
+        values, cardinalities, branchings = self.compiled.evaluate(iteration)
+        length = np.size(values)
+        jacobian = csr_matrix((length, n_columns))
+        for atom, partial, argument in self.terms:
+            if argument is not None:
+                argjac, argcards, argbrs = argument.evaluate(
+                    jacobian_of, n_columns, iteration)
+                lens = _aggregation_lens(atom, argcards, argbrs)
+                weights = np.concatenate(
+                    [np.full(le, 1. / max(le, 1)
+                             if atom._aggregation == "mean" else 1.)
+                     for le in lens] + [[]])
+                groups = np.repeat(np.arange(len(lens)), lens)
+                atomjac = csr_matrix(
+                    (weights, (groups, np.arange(len(groups)))),
+                    shape=(len(lens), argjac.shape[0])) @ argjac
+            elif type(atom) == D.Variable:
+                atomjac = jacobian_of(atom)[0]
+            else:
+                varjac, positions = jacobian_of(atom.target_variable)
+                rows = [positions[inst]
+                        for ((var, inst),) in get_instance_dependencies(atom)]
+                atomjac = varjac[rows]
+            index = _broadcast_index(atomjac.shape[0],
+                                     cardinalities, branchings)
+            if index is not None:
+                atomjac = atomjac[index]
+            partialvalues = np.asarray(partial.eval(iteration), dtype=float)
+            index = _broadcast_index(partialvalues.size,
+                                     cardinalities, branchings)
+            if index is not None:
+                partialvalues = partialvalues[index]
+            elif partialvalues.size < length:
+                partialvalues = np.full(length, partialvalues[0])
+            jacobian = jacobian + diags(partialvalues) @ atomjac
+        return jacobian.tocsr(), cardinalities, branchings
@@ -3,7 +3,9 @@
 This class defines the trajectory dictionary class, that is used to
 save trajectories in the runner. It inherits from dictionary and its
 aim is to have an extra save and load function, so that these processes
-are easily done by the user."""
+are easily done by the user. It also provides the trajectory of each
+Variable as a numpy array (time points x instances) and the whole
+trajectory as an xarray Dataset."""
 
 # This file is part of pycopancore.
 #
@@ -15,8 +17,27 @@ are easily done by the user."""
 # License: BSD 2-clause license
 
 import pickle, json
+from collections.abc import Mapping
 import networkx as nx
+import numpy as np
 from . import _AbstractEntityMixin, _AbstractProcessTaxonMixin
+from ._trajectory_recorder import _TrajectoryRecorder, _TimeTrajectory, \
+    _VariableTrajectory
+from ._hdf5_trajectory import _HDF5TrajectoryWriter, \
+    _HDF5TrajectoryReader, _is_not_none
+from ._array_trajectory import _ArrayTrajectoryFile, \
+    _ArrayTrajectoryReader, _names
+from ._network_trajectory import graph_at
+from .. import data_model as D
+
+
+def _import_xarray():
+    try:
+        import xarray
+    except ImportError:
+        raise ImportError("exporting trajectories to xarray requires "
+                          "xarray")
+    return xarray
 
 
 class _TrajectoryDictionary(dict):
@@ -40,118 +61,41 @@ class _TrajectoryDictionary(dict):
         path: string
             path or directory to save to
         data_type: string
-            'pickle', 'json' or 'hdf5'
+            'pickle', 'json', 'hdf5', 'npz' or 'npy'. 'npz' saves numeric
+            Variables as typed numpy arrays in one .npz file, 'npy' as one
+            .npy file per array (which can be memory-mapped when loading)
+            in a directory named filename, and is much faster than
+            'pickle' and 'json' for large trajectories; other Variables
+            (e.g. networks) are stored as for 'pickle' inside them (see
+            _ArrayTrajectoryFile). Networks recorded by a Runner are saved
+            as network logs of their changes (see _NetworkState), from
+            which graph() rebuilds them after load().
         Returns
         -------
 
         """
-        if not data_type == "hdf5":
-            # Have a new dict to save everything to:
-            dict_to_save = {}
-            # Iterate through dict and replace Variables by strings of
-            # Variables and Entities/taxa as strings with their uid attached.
-            for key, item in self.items():
-                # Go to lower level, if item is indeed another dictionary. This
-                # is the case for all Variables except the time 't'!
-                # One could also check for isinstance(item, Variable)
-                if isinstance(item, dict):
-                    new_key = str(key)
-                    # print('new_key',  new_key, type(new_key))
-                    dict_to_save[new_key] = {}
-                    for key_2, value in item.items():
-                        # Here, key_2 are entities or taxa. Value are lists with
-                        # the values the variable took during the run.
-
-                        # First find out if key_2 is Taxon or Entity:
-                        if isinstance(key_2, _AbstractEntityMixin):
-                            # Entity:
-                            new_key_2 = str(key_2)
-                            # print('new_key_2', new_key_2, type(new_key_2))
-                            # If values are not numbers, they have to be
-                            # transformed into strings, too:
-                            if all(isinstance(val, (float, int)) for val in value):
-                                dict_to_save[new_key][new_key_2] = value
-                            # Maybe value is a list of list with floats/ints?
-                            elif (all(isinstance(val, (float, int)) for val in
-                                     list(self.traverse(value)))
-                                  ):
-                                dict_to_save[new_key][new_key_2] = value
-                            # Networks:
-                            elif all(isinstance(val, nx.Graph) for val in value):
-                                # save as dict of dicts
-                                new_value = [nx.to_dict_of_dicts(val) for val in value]
-                                # print(new_value)
-                                # iterate through timesteps in list, where for every
-                                # timestep there is a dictionary di in the list
-                                for di in new_value:
-                                    # Rewrite keys (the nodes), as they are
-                                    # objects, to strings of objects:
-                                    for node_key, connections in di.copy().items():
-                                        di[str(node_key)] = di.pop(node_key)
-                                        # Also, connections for all nodes need to
-                                        # be replaced by strings:
-                                        for node_key_2, connections_2 in connections.copy().items():
-                                            connections[str(node_key_2)] = connections.pop(node_key_2)
-                                dict_to_save[new_key][new_key_2] = new_value
-                            else:
-                                new_val = [str(val) for val in value]
-                                dict_to_save[new_key][new_key_2] = new_val
-
-                        elif isinstance(key_2, _AbstractProcessTaxonMixin):
-                            # Taxon
-                            new_key_2 = str(key_2)
-                            # If values are not numbers, they have to be
-                            # transformed into strings, too:
-                            if all(isinstance(val, (float, int)) for val in value):
-                                dict_to_save[new_key][new_key_2] = value
-                            # Maybe value is a list of list with floats/ints?
-                            elif (all(isinstance(val, (float, int)) for val in
-                                     list(self.traverse(value)))
-                                  ):
-                                dict_to_save[new_key][new_key_2] = value
-                            # Networks:
-                            elif all(isinstance(val, nx.Graph) for val in value):
-                                # save as dict of dicts
-                                new_value = [nx.to_dict_of_dicts(val) for val in value]
-                                # print(new_value)
-                                # iterate through timesteps in list, where for every
-                                # timestep there is a dictionary di in the list
-                                for di in new_value:
-                                    # Rewrite keys (the nodes), as they are
-                                    # objects, to strings of objects:
-                                    for node_key, connections in di.copy().items():
-                                        di[str(node_key)] = di.pop(node_key)
-                                        # Also, connections for all nodes need to
-                                        # be replaced by strings:
-                                        for node_key_2, connections_2 in connections.copy().items():
-                                            connections[str(node_key_2)] = connections.pop(node_key_2)
-                                dict_to_save[new_key][new_key_2] = new_value
-                            else:
-                                new_val = [str(val) for val in value]
-                                dict_to_save[new_key][new_key_2] = new_val
-                        else:
-                            raise Exception('neither taxon nor entity')
-                elif key == 't':
-                    # here we don't need to do anyhing
-                    dict_to_save['t'] = item
-                else:
-                    raise Exception('neither variable nor time!')
-
-            # checking if all entries have the same length as time:
-            # tlen = len(dict_to_save['t'])
-            # for var, item in dict_to_save.items():
-            #     if isinstance(item, dict):
-            #         for instance, val in item.items():
-            #             assert len(dict_to_save[var][instance]) == tlen, (
-            #                 tlen, len(dict_to_save[var][instance]),
-            #                 dict_to_save[var][instance], var, instance
-            #             )
-
+        # Fuse Filename and path:
+        # add "/" to paths if missing
+        save_path = path + "/" if not path.endswith("/") else path
+        if data_type == "hdf5":
+            # HDF5 mode
+            # HDF5 only supports same datatype entries in a dataset, so
+            # values are stored typed and the time points at which an entity
+            # is deactivated (where its values are None) are marked in a
+            # separate mask:
+            writer = _HDF5TrajectoryWriter(save_path + filename + '.h5',
+                                           self._recorder())
+            writer.write(final=True)
+            writer.close()
+        elif data_type == 'npz':
+            _ArrayTrajectoryFile.save(self, save_path + filename + '.npz')
+        elif data_type == 'npy':
+            _ArrayTrajectoryFile.save(self, save_path + filename,
+                                      data_type='npy')
+        else:
+            dict_to_save = self._to_plain_dict()
             # Add a file versio:
             dict_to_save['file-version'] = 0.1
-            # Fuse Filename and path:
-            # add "/" to paths if missing
-            save_path = path + "/" if not path.endswith("/") else path
             # Now save as datatype:
             if data_type == 'pickle':
                 save_name = save_path + filename + '.pickle'
@@ -162,15 +106,356 @@ class _TrajectoryDictionary(dict):
                 with open(save_name, 'w') as dumpfile:
                     json.dump(dict_to_save, dumpfile)
 
-        else:
-            # HDF5 mode
-            # If we want to implement this, we need to solve the following
-            # problem: HDF5 and Pytables only support same datatype entries in
-            # a table. If, however, an entity is deactivated during a run, all
-            # its values when being idel are None (dtype:None)! Earlier values
-            # might include floats, booleans, or integers. This is not possible
-            # with HDF5 at all.
-            raise Exception('Not implemented yet')
+    def _to_plain_dict(self, keys=None):
+        """Return a dict of the given or all keys in which Variables are
+        replaced by strings of Variables, Entities/taxa by strings with
+        their uid attached, and values by numbers, dicts of dicts (for
+        networks) or strings, as needed for saving as pickle or json."""
+        # Have a new dict to save everything to:
+        dict_to_save = {}
+        if keys is None:
+            keys = self.keys()
+        # Iterate through dict and replace Variables by strings of
+        # Variables and Entities/taxa as strings with their uid attached.
+        for key in keys:
+            item = self[key]
+            # Go to lower level, if item is indeed another dictionary. This
+            # is the case for all Variables except the time 't'!
+            # One could also check for isinstance(item, Variable)
+            if isinstance(item, Mapping):
+                new_key = str(key)
+                dict_to_save[new_key] = {}
+                if isinstance(item, _VariableTrajectory) \
+                        and item._values.dtype != object:
+                    # all values are floats (or None where not valid), so
+                    # the type need not be checked value by value:
+                    for key_2 in item:
+                        dict_to_save[new_key][str(key_2)] = item[key_2]
+                    continue
+                for key_2 in item:
+                    # Here, key_2 are entities or taxa. Values are lists with
+                    # the values the variable took during the run.
+                    if not isinstance(key_2, (_AbstractEntityMixin,
+                                              _AbstractProcessTaxonMixin)):
+                        raise Exception('neither taxon nor entity')
+                    new_key_2 = str(key_2)
+                    if isinstance(item, _VariableTrajectory) \
+                            and item.is_network(key_2):
+                        # save the recorded changes of the network rather
+                        # than every snapshot (see graph()):
+                        dict_to_save[new_key][new_key_2] = \
+                            item.network_log(key_2)
+                        continue
+                    value = item[key_2]
+                    # If values are not numbers, they have to be
+                    # transformed into strings, too:
+                    if all(isinstance(val, (float, int)) for val in value):
+                        dict_to_save[new_key][new_key_2] = value
+                    # Maybe value is a list of list with floats/ints?
+                    elif (all(isinstance(val, (float, int)) for val in
+                              list(self.traverse(value)))
+                          ):
+                        dict_to_save[new_key][new_key_2] = value
+                    # Networks:
+                    elif all(isinstance(val, nx.Graph) for val in value):
+                        # save as dict of dicts
+                        new_value = [nx.to_dict_of_dicts(val) for val in value]
+                        # iterate through timesteps in list, where for every
+                        # timestep there is a dictionary di in the list
+                        for di in new_value:
+                            # Rewrite keys (the nodes), as they are
+                            # objects, to strings of objects:
+                            for node_key, connections in di.copy().items():
+                                di[str(node_key)] = di.pop(node_key)
+                                # Also, connections for all nodes need to
+                                # be replaced by strings:
+                                for node_key_2, connections_2 in connections.copy().items():
+                                    connections[str(node_key_2)] = connections.pop(node_key_2)
+                        dict_to_save[new_key][new_key_2] = new_value
+                    else:
+                        new_val = [str(val) for val in value]
+                        dict_to_save[new_key][new_key_2] = new_val
+            elif key == 't':
+                # only convert to a list:
+                dict_to_save['t'] = list(item)
+            else:
+                raise Exception('neither variable nor time!')
+
+        # checking if all entries have the same length as time:
+        # tlen = len(dict_to_save['t'])
+        # for var, item in dict_to_save.items():
+        #     if isinstance(item, dict):
+        #         for instance, val in item.items():
+        #             assert len(dict_to_save[var][instance]) == tlen, (
+        #                 tlen, len(dict_to_save[var][instance]),
+        #                 dict_to_save[var][instance], var, instance
+        #             )
+        return dict_to_save
+
+    @classmethod
+    def load(cls,
+             *,
+             filename,
+             path='./',
+             data_type='pickle'):
+        """Load function.
+
+        Use this to load a trajectory saved by save().
+
+        Parameters
+        ----------
+        filename: string
+            name of the file saved, without extension
+        path: string
+            path or directory to load from
+        data_type: string
+            'pickle', 'json', 'hdf5', 'npz' or 'npy'
+        Returns
+        -------
+        _TrajectoryDictionary
+            with key 't' and for each Variable name a dict mapping strings
+            representing entities or taxa to lists of values (None where
+            not available)
+        """
+        load_path = path + "/" if not path.endswith("/") else path
+        if data_type == 'pickle':
+            with open(load_path + filename + '.pickle', 'rb') as loadfile:
+                return cls(pickle.load(loadfile))
+        if data_type == 'json':
+            with open(load_path + filename + '.json', 'r') as loadfile:
+                return cls(json.load(loadfile))
+        if data_type in ('npz', 'npy'):
+            return cls(_ArrayTrajectoryFile.load(
+                load_path + filename + ('.npz' if data_type == 'npz' else '')))
+        with _HDF5TrajectoryReader(load_path + filename + '.h5') as reader:
+            return cls(reader.to_dict())
+
+    @staticmethod
+    def open(*,
+             filename,
+             path='./',
+             data_type='npy'):
+        """Open a saved trajectory for reading parts of it without loading
+        it as a whole.
+
+        Parameters
+        ----------
+        filename: string
+            name of the file saved, without extension
+        path: string
+            path or directory to load from
+        data_type: string
+            'npy' (whose arrays are memory-mapped), 'npz' or 'hdf5'
+        Returns
+        -------
+        _ArrayTrajectoryReader or _HDF5TrajectoryReader
+            a reader (and context manager) with an index of the Variables
+            and their instances' UIDs, whose values() and mask() read only
+            the requested time points and instances
+        """
+        load_path = path + "/" if not path.endswith("/") else path
+        if data_type == 'hdf5':
+            return _HDF5TrajectoryReader(load_path + filename + '.h5')
+        return _ArrayTrajectoryReader(
+            load_path + filename + ('.npz' if data_type == 'npz' else ''))
+
+    def _recorder(self):
+        """Return a _TrajectoryRecorder holding this trajectory."""
+        times = self['t']
+        if isinstance(times, _TimeTrajectory) \
+                and all(getattr(item, '_recorder', None) is times._recorder
+                        for item in self.values()
+                        if isinstance(item, _VariableTrajectory)):
+            return times._recorder
+        # copy lists of values into a new recorder:
+        recorder = self._new_recorder()
+        for key, item in self.items():
+            if isinstance(key, D.Variable) and isinstance(item, Mapping):
+                self._record_lists(recorder, key, item)
+        return recorder
+
+    def _new_recorder(self):
+        """Return an empty _TrajectoryRecorder with this trajectory's time
+        points."""
+        times = list(self['t'])
+        recorder = _TrajectoryRecorder(capacity=max(len(times), 1))
+        recorder.extend_times(times)
+        return recorder
+
+    @staticmethod
+    def _record_lists(recorder, key, item):
+        """Copy a mapping from instances to lists of values (None where not
+        valid) into the recorder's trajectory for key."""
+        instances = list(item.keys())
+        block = np.empty((recorder.n_times, len(instances)), dtype=object)
+        for j, inst in enumerate(instances):
+            for i, value in enumerate(item[inst]):
+                block[i, j] = value
+        valid = _is_not_none(block)
+        if valid.any() and all(isinstance(value, float)
+                               for value in block[valid]):
+            block = np.where(valid, block, np.nan).astype(float)
+        recorder[key].record_block(instances, block, valid)
+
+    # array access:
+
+    def _key(self, var):
+        """Return the key of a Variable given by itself or by its name (as
+        in str(var), e.g. 'World.atmospheric_carbon')."""
+        if isinstance(var, str):
+            for key in self.keys():
+                if key != 't' and str(key) == var:
+                    return key
+            raise KeyError(var)
+        return var
+
+    def trajectory(self, var):
+        """Return the trajectory of a Variable (given by itself or by its
+        name) as a _VariableTrajectory, copying lists of values into a new
+        one if the values are not held by a _TrajectoryRecorder (e.g.
+        after load())."""
+        key = self._key(var)
+        item = self[key]
+        if isinstance(item, _VariableTrajectory):
+            return item
+        recorder = self._new_recorder()
+        self._record_lists(recorder, key, item)
+        return recorder[key]
+
+    def graph(self, var, inst, index):
+        """Return the network that a network-valued Variable (given by
+        itself or by its name) had for an instance (or, after load(), its
+        name) at the time point with the given index, or None if it had
+        none."""
+        item = self[self._key(var)]
+        if isinstance(item, _VariableTrajectory):
+            return item.graph(inst, index)
+        value = item[inst]
+        if isinstance(value, Mapping):
+            # a network log as saved by save():
+            return graph_at(value, index)
+        return value[index]
+
+    def times(self, copy=True):
+        """Return an array of the time points.
+
+        If copy is False and the trajectory is held by a
+        _TrajectoryRecorder (as that of a Runner), a read-only view of its
+        storage is returned instead, which is only valid until the next
+        time point is recorded."""
+        times = self['t']
+        if isinstance(times, _TimeTrajectory):
+            return times.values(copy=copy)
+        return np.array(times, dtype=float)
+
+    def array(self, var, instances=None, *, copy=True):
+        """Return the values of a Variable as an array.
+
+        Parameters
+        ----------
+        var : Variable or str
+            the Variable or its name (e.g. 'World.atmospheric_carbon')
+        instances : list, optional
+            instances (or, after load(), their names) to return the values
+            of (default: all, in the order of instances(var))
+        copy : bool, optional
+            if False, return a read-only view of the storage of the
+            _TrajectoryRecorder holding the trajectory (if any) instead of
+            a copy, which is only valid until the next time point is
+            recorded and requires instances to be None or a contiguous run
+            of instances(var)
+
+        Returns
+        -------
+        array
+            values (time points x instances) with nan (or None if values
+            are not floats) where they are not valid, see mask()
+        """
+        return self.trajectory(var).values(instances, copy=copy)
+
+    def mask(self, var, instances=None, *, copy=True):
+        """Return the boolean array (time points x instances) telling which
+        values of a Variable are valid, see array()."""
+        return self.trajectory(var).mask(instances, copy=copy)
+
+    def instances(self, var):
+        """Return the list of instances (or, after load(), their names)
+        of a Variable in the order of the columns of array()."""
+        item = self[self._key(var)]
+        if isinstance(item, _VariableTrajectory):
+            return list(item.instances)
+        return list(item.keys())
+
+    def uids(self, var):
+        """Return the array of UIDs of the instances of a Variable in the
+        order of the columns of array() (-1 for process taxa and for
+        instances given by name)."""
+        return self.trajectory(var).uids
+
+    def to_xarray(self, variables=None, *, copy=False):
+        """Return the trajectory as an xarray Dataset.
+
+        The Dataset has a dimension 't' of time points and for each entity
+        type or process taxon a dimension of its instances, named after it
+        (e.g. 'World'), whose coordinates are the instances' UIDs (or their
+        names for process taxa and after load()). Each Variable is a data
+        variable named as str(var) (e.g. 'World.atmospheric_carbon') over
+        't' and its entity type's dimension, with nan (or None if values
+        are not floats) where values are not valid, and has the attributes
+        'entity_type' and 'codename'.
+
+        Parameters
+        ----------
+        variables : list, optional
+            Variables (or their names) to include (default: all that were
+            recorded for any instance)
+        copy : bool, optional
+            if False (the default), data variables with float values are
+            read-only views of the storage of the _TrajectoryRecorder
+            holding the trajectory where possible (i.e., if all Variables of
+            an entity type were recorded for the same instances), see
+            array()
+
+        Returns
+        -------
+        xarray.Dataset
+        """
+        xarray = _import_xarray()
+        if variables is None:
+            variables = [key for key, item in self.items() if key != 't'
+                         and isinstance(item, Mapping) and len(item) > 0]
+        keys = [self._key(var) for var in variables]
+        # columns of each entity type's dimension, in order of appearance:
+        columns = {}
+        for key in keys:
+            entity_type_columns = columns.setdefault(_names(key)[0], {})
+            for inst in self.instances(key):
+                entity_type_columns.setdefault(inst,
+                                               len(entity_type_columns))
+        data = {}
+        for key in keys:
+            entity_type, codename = _names(key)
+            trajectory = self.trajectory(key)
+            instances = list(trajectory.instances)
+            if instances == list(columns[entity_type]):
+                values = trajectory.values(copy=copy)
+            else:
+                # align the columns with the entity type's dimension:
+                block = trajectory.values()
+                values = np.full((block.shape[0], len(columns[entity_type])),
+                                 np.nan if block.dtype != object else None,
+                                 dtype=block.dtype)
+                values[:, [columns[entity_type][inst]
+                           for inst in instances]] = block
+            data[str(key)] = xarray.Variable(
+                ('t', entity_type), values,
+                attrs={'entity_type': entity_type, 'codename': codename})
+        coords = {'t': self.times(copy=copy)}
+        for entity_type, instances in columns.items():
+            uids = [getattr(inst, '_uid', None) for inst in instances]
+            coords[entity_type] = np.array(uids) if None not in uids \
+                else [str(inst) for inst in instances]
+        return xarray.Dataset(data, coords=coords)
 
     # Helping function to save lists and tuples
     def traverse(self, item, tree_types=(list, tuple)):
@@ -179,4 +464,5 @@ class _TrajectoryDictionary(dict):
                 for subvalues in self.traverse(values, tree_types):
                     yield subvalues
         else:
-            yield item
\ No newline at end of file
+            yield item
+
@@ -0,0 +1,528 @@
+"""_TrajectoryRecorder class.
+
+Storage of model trajectories in preallocated numpy arrays. For each
+Variable, the values of all instances are kept in one two-dimensional block
+with a row for each time point and a column (slot) for each instance, plus a
+mask telling which entries are valid (e.g. not while an entity is inactive
+or before it was created). Invalid entries hold nan (or None in blocks of
+arbitrary values), so that the blocks can be handed out as arrays without
+copying them. Blocks grow by doubling along both axes, so that recording is
+amortized constant time per value, and are only allocated when the first
+value of a Variable is recorded.
+
+Optionally, the resolution of the recorded trajectory is reduced while
+recording: whenever a time point is appended less than a minimum spacing
+after the last but one, the last one is dropped, so that only the most
+recent time point is ever overwritten.
+
+Networks (networkx graphs) are recorded as delta-encoded _NetworkStates
+rather than as references to the (mutable) graphs, see _NetworkState.
+
+The oldest time points can be discarded (e.g. after they were written to a
+file) to limit the memory used during long runs.
+
+For backwards compatibility, each Variable's trajectory is also a read-only
+mapping from instances to lists of values in which invalid entries are None,
+just as the lists formerly stored in a _TrajectoryDictionary.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+from collections.abc import Mapping, Sequence
+
+import networkx as nx
+import numpy as np
+
+from ._network_trajectory import _NetworkState, _graphs, network_log
+
+
+def _invalid_block(shape, dtype=float):
+    """Return a block of the given shape and dtype filled with nan (None
+    for dtype object)."""
+    if dtype == object:
+        return np.full(shape, None, dtype=object)
+    return np.full(shape, np.nan, dtype=dtype)
+
+
+class _TrajectoryRecorder(object):
+    """Recorder of the time points and variable values of a model run."""
+
+    times = None
+    """_TimeTrajectory of recorded time points"""
+    variables = None
+    """dict Variable -> _VariableTrajectory"""
+    min_spacing = None
+    """minimum spacing of time points, or None to keep all of them"""
+    n_discarded = 0
+    """number of time points discarded from the beginning"""
+    keyframe_interval = 100
+    """maximum number of changes of a network between two keyframes"""
+
+    def __init__(self, capacity=64, min_spacing=None, keyframe_interval=100):
+        """Instantiate an empty _TrajectoryRecorder.
+
+        Parameters
+        ----------
+        capacity : int, optional
+            initial number of time points to allocate
+        min_spacing : float, optional
+            if given, reduce the resolution while recording: the most
+            recent time point is dropped when a time point is appended less
+            than min_spacing after the one before it (the first two time
+            points are always kept)
+        keyframe_interval : int, optional
+            maximum number of changes of a network between two keyframes,
+            see _NetworkState
+        """
+        self.capacity = capacity
+        self.min_spacing = min_spacing
+        self.keyframe_interval = keyframe_interval
+        self.times = _TimeTrajectory(self)
+        self.variables = {}
+        self._times = np.zeros(capacity)
+        self.n_times = 0
+
+    def __getstate__(self):
+        # (the trajectories themselves pickle as plain dicts, so pickle
+        # their attributes instead)
+        state = dict(self.__dict__)
+        del state["times"]
+        state["variables"] = {
+            var: {key: value for key, value in trajectory.__dict__.items()
+                  if key != "_recorder"}
+            for var, trajectory in self.variables.items()}
+        return state
+
+    def __setstate__(self, state):
+        variables = state.pop("variables")
+        self.__dict__.update(state)
+        self.times = _TimeTrajectory(self)
+        self.variables = {}
+        for var, trajectory_state in variables.items():
+            trajectory = _VariableTrajectory.__new__(_VariableTrajectory)
+            trajectory.__dict__.update(trajectory_state)
+            trajectory._recorder = self
+            self.variables[var] = trajectory
+
+    def __getitem__(self, var):
+        """Return the _VariableTrajectory of var, creating it if needed."""
+        try:
+            return self.variables[var]
+        except KeyError:
+            trajectory = self.variables[var] = _VariableTrajectory(self, var)
+            return trajectory
+
+    def _reserve(self, n_times):
+        """Make sure there is space for n_times time points."""
+        if n_times > self.capacity:
+            capacity = self.capacity
+            while capacity < n_times:
+                capacity *= 2
+            times = np.zeros(capacity)
+            times[:self.n_times] = self._times[:self.n_times]
+            self._times = times
+            for trajectory in self.variables.values():
+                trajectory._grow_times(capacity)
+            self.capacity = capacity
+
+    def append_time(self, t):
+        """Append a time point, possibly dropping the most recent one."""
+        if self.min_spacing is not None:
+            self._decimate(t)
+        self._reserve(self.n_times + 1)
+        self._times[self.n_times] = t
+        self.n_times += 1
+
+    def extend_times(self, ts):
+        """Append several time points (without reducing the resolution,
+        see thin())."""
+        n = len(ts)
+        self._reserve(self.n_times + n)
+        self._times[self.n_times:self.n_times + n] = ts
+        self.n_times += n
+
+    def reset_times(self, ts):
+        """Replace all time points by ts, keeping recorded values."""
+        self.n_times = 0
+        self.extend_times(ts)
+
+    def _decimate(self, t):
+        """Drop the most recent time point if t would follow the one before
+        it by less than min_spacing."""
+        n = self.n_times
+        if n + self.n_discarded > 2 \
+                and t - self._times[n - 2] < self.min_spacing:
+            self.n_times = n - 1
+            for trajectory in self.variables.values():
+                trajectory._drop_last_row(n)
+
+    def thin(self, ts):
+        """Prepare appending the sorted time points ts with reduced
+        resolution.
+
+        Drops the most recent time point if necessary and returns the
+        indices of those ts to pass to extend_times(), all of them if
+        min_spacing is None.
+        """
+        if self.min_spacing is None:
+            return np.arange(len(ts))
+        kept = []
+        for k, t in enumerate(ts):
+            if not kept:
+                self._decimate(t)
+            elif self.n_times + self.n_discarded + len(kept) > 2:
+                # time of the last but one resulting time point:
+                before = ts[kept[-2]] if len(kept) > 1 \
+                    else self._times[self.n_times - 1]
+                if t - before < self.min_spacing:
+                    kept.pop()
+            kept.append(k)
+        return np.array(kept, dtype=int)
+
+    def discard(self, n_times):
+        """Forget the first n_times time points.
+
+        At least the last two time points must be kept when the resolution
+        is reduced, since the next time point may replace the last one.
+        """
+        assert n_times <= self.n_times - (2 if self.min_spacing else 0)
+        if n_times <= 0:
+            return
+        n = self.n_times - n_times
+        self._times[:n] = self._times[n_times:self.n_times]
+        self.n_times = n
+        self.n_discarded += n_times
+        for trajectory in self.variables.values():
+            trajectory._discard(n_times)
+
+
+class _TimeTrajectory(Sequence):
+    """Read-only sequence view of the recorded time points."""
+
+    def __init__(self, recorder):
+        self._recorder = recorder
+
+    def __len__(self):
+        return self._recorder.n_times
+
+    def __getitem__(self, index):
+        return self._recorder._times[:self._recorder.n_times][index].tolist()
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(self._recorder._times[:self._recorder.n_times],
+                        dtype=dtype)
+
+    def values(self, copy=True):
+        """Return an array of the time points, or a read-only view of the
+        recorder's storage if copy is False (which is only valid until the
+        next time point is recorded)."""
+        times = self._recorder._times[:self._recorder.n_times]
+        if copy:
+            return times.copy()
+        times.flags.writeable = False
+        return times
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __reduce__(self):
+        # pickle and copy as a plain list:
+        return (list, (list(self),))
+
+
+class _VariableTrajectory(Mapping):
+    """Trajectories of one Variable for all instances that had a value.
+
+    As a mapping, it maps instances to lists of values, one for each time
+    point, containing None where no value was valid.
+    """
+
+    variable = None
+    """the Variable"""
+    instances = None
+    """list of recorded instances in the order of their slots"""
+    lengths = None
+    """array of the numbers of recorded time points for each slot"""
+    _slot_capacity = 16
+    """number of slots to allocate for the first instance"""
+
+    def __init__(self, recorder, var, slot_capacity=16):
+        self._recorder = recorder
+        self.variable = var
+        self.instances = []
+        self._slots = {}
+        # slot -> (_NetworkState, nodes, edges) of the last recorded network:
+        self._networks = {}
+        # (the blocks are only allocated when the first instance gets a
+        # slot, so that Variables which are never recorded take no space)
+        self._slot_capacity = slot_capacity
+        self._values = _invalid_block((0, 0))
+        self._valid = np.zeros((0, 0), dtype=bool)
+        self.lengths = np.zeros(0, dtype=int)
+
+    # storage management:
+
+    def _grow_times(self, capacity):
+        if not self.instances:
+            return
+        values = _invalid_block((capacity, self._values.shape[1]),
+                                self._values.dtype)
+        valid = np.zeros((capacity, self._values.shape[1]), dtype=bool)
+        values[:self._values.shape[0]] = self._values
+        valid[:self._values.shape[0]] = self._valid
+        self._values = values
+        self._valid = valid
+
+    def _grow_slots(self, n_slots):
+        capacity = self._values.shape[1] or self._slot_capacity
+        while capacity < n_slots:
+            capacity *= 2
+        n_rows = self._recorder.capacity
+        values = _invalid_block((n_rows, capacity), self._values.dtype)
+        valid = np.zeros((n_rows, capacity), dtype=bool)
+        values[:self._values.shape[0], :self._values.shape[1]] = self._values
+        valid[:self._values.shape[0], :self._values.shape[1]] = self._valid
+        lengths = np.zeros(capacity, dtype=int)
+        lengths[:len(self.lengths)] = self.lengths
+        self._values = values
+        self._valid = valid
+        self.lengths = lengths
+
+    def _to_objects(self):
+        """Convert the value block to dtype object to store any values."""
+        if self._values.dtype != object:
+            self._values = self._values.astype(object)
+            self._values[~self._valid] = None
+
+    def slots(self, instances, initial_length):
+        """Return an array of the slots of instances, creating new slots
+        of the given initial length (all invalid) if necessary."""
+        slots = self._slots
+        try:
+            return np.fromiter((slots[inst] for inst in instances),
+                               dtype=int, count=len(instances))
+        except KeyError:
+            pass
+        new = [inst for inst in dict.fromkeys(instances) if inst not in slots]
+        n = len(self.instances) + len(new)
+        if n > self._values.shape[1]:
+            self._grow_slots(n)
+        for inst in new:
+            slots[inst] = len(self.instances)
+            self.lengths[len(self.instances)] = initial_length
+            self.instances.append(inst)
+        return np.fromiter((slots[inst] for inst in instances),
+                           dtype=int, count=len(instances))
+
+    def _discard(self, n_rows):
+        if not self.instances:
+            return
+        n = self._values.shape[0] - n_rows
+        self._values[:n] = self._values[n_rows:]
+        self._valid[:n] = self._valid[n_rows:]
+        self._values[n:] = None if self._values.dtype == object else np.nan
+        self._valid[n:] = False
+        self.lengths = np.maximum(self.lengths - n_rows, 0)
+
+    def _drop_last_row(self, n_times):
+        if not self.instances:
+            return
+        self._values[n_times - 1] = None if self._values.dtype == object \
+            else np.nan
+        self._valid[n_times - 1] = False
+        self.lengths[self.lengths == n_times] = n_times - 1
+
+    # recording:
+
+    def record(self, instances, values):
+        """Append values to the trajectories of those instances which have
+        fewer values than there are time points, padding those of
+        new instances with invalid entries before."""
+        n_times = self._recorder.n_times
+        slots = self.slots(instances, n_times - 1)
+        lengths = self.lengths[slots]
+        pending = lengths < n_times
+        if not pending.any():
+            return
+        if not pending.all():
+            slots = slots[pending]
+            lengths = lengths[pending]
+            values = [v for v, p in zip(values, pending) if p]
+        if isinstance(values, np.ndarray) and values.dtype.kind == "f" \
+                and values.ndim == 1:
+            floats = values
+        elif all(isinstance(value, float) for value in values):
+            floats = np.fromiter(values, dtype=float, count=len(values))
+        else:
+            floats = None
+        if floats is not None:
+            self._values[lengths, slots] = floats.tolist() \
+                if self._values.dtype == object else floats
+        else:
+            # store arbitrary values one by one:
+            self._to_objects()
+            for row, slot, value in zip(lengths, slots, values):
+                if isinstance(value, nx.Graph):
+                    # store the network's changes since the last time
+                    # point instead of a reference:
+                    last = self._networks[slot] = _NetworkState.record(
+                        value, self._networks.get(slot),
+                        self._recorder.keyframe_interval)
+                    value = last[0]
+                # when handling lists, python only adds references!
+                self._values[row, slot] = value[:] \
+                    if isinstance(value, list) else value
+        self._valid[lengths, slots] = True
+        self.lengths[slots] = lengths + 1
+
+    def record_block(self, instances, block, valid=None):
+        """Store a block of values (one row for each of the last
+        len(block) time points, one column for each instance) for those
+        instances which have fewer values than there are time points.
+
+        If given, the boolean array valid of the same shape tells which of
+        the values are valid."""
+        n_times = self._recorder.n_times
+        first = n_times - len(block)
+        slots = self.slots(instances, first)
+        pending = self.lengths[slots] < n_times
+        if not pending.all():
+            slots = slots[pending]
+            block = block[:, pending]
+            if valid is not None:
+                valid = valid[:, pending]
+        if block.dtype == object:
+            self._to_objects()
+        elif self._values.dtype == object:
+            block = block.astype(object)
+        if valid is not None:
+            block = np.where(valid, block,
+                             None if block.dtype == object else np.nan)
+        self._values[first:n_times, slots] = block
+        self._valid[first:n_times, slots] = True if valid is None else valid
+        self.lengths[slots] = n_times
+
+    def pad(self, instances):
+        """Fill the trajectories of instances with invalid entries up to
+        the current number of time points."""
+        n_times = self._recorder.n_times
+        slots = self.slots(instances, n_times)
+        self.lengths[slots] = np.maximum(self.lengths[slots], n_times)
+
+    # array access:
+
+    @property
+    def uids(self):
+        """array of the UIDs of the recorded instances (-1 for process
+        taxa)"""
+        return np.fromiter((getattr(inst, "_uid", -1)
+                            for inst in self.instances),
+                           dtype=np.int64, count=len(self.instances))
+
+    def _columns(self, instances):
+        """Return the slots of instances as a slice if possible, so that
+        indexing with it returns a view."""
+        if instances is None:
+            return slice(0, len(self.instances))
+        slots = self.slots(instances, 0)
+        if len(slots) > 0 and np.array_equal(
+                slots, np.arange(slots[0], slots[0] + len(slots))):
+            return slice(slots[0], slots[0] + len(slots))
+        return slots
+
+    def _block(self, block, instances, copy):
+        columns = self._columns(instances)
+        if not self.instances:
+            # (no storage allocated yet)
+            return np.empty((self._recorder.n_times, 0), dtype=block.dtype)
+        part = block[:self._recorder.n_times, columns]
+        if copy:
+            # (indexing with an array of slots already copies)
+            return part.copy() if isinstance(columns, slice) else part
+        if not isinstance(columns, slice):
+            raise ValueError("instances must be a contiguous run of "
+                             "recorded instances to return a view")
+        part.flags.writeable = False
+        return part
+
+    def values(self, instances=None, copy=True):
+        """Return a two-dimensional array of values (time points x
+        instances) for the given or all recorded instances, with invalid
+        entries set to nan (or None if values are not floats).
+
+        If copy is False, a read-only view of the recorder's storage is
+        returned instead, which is only valid until the next time point is
+        recorded (and contains _NetworkStates instead of networks). This
+        requires instances to be None or a contiguous run of the recorded
+        instances (as instances[i:j])."""
+        values = self._block(self._values, instances, copy)
+        if copy and self._networks:
+            for j in range(values.shape[1]):
+                for i, graph in enumerate(_graphs(values[:, j])):
+                    values[i, j] = graph
+        return values
+
+    def mask(self, instances=None, copy=True):
+        """Return a two-dimensional boolean array (time points x instances)
+        telling which values are valid, see values()."""
+        return self._block(self._valid, instances, copy)
+
+    # networks:
+
+    def _states(self, inst):
+        """Return the list of recorded values of inst, None where not
+        valid."""
+        slot = self._slots[inst]
+        length = self.lengths[slot]
+        values = self._values[:length, slot].tolist()
+        for row in np.where(~self._valid[:length, slot])[0]:
+            values[row] = None
+        return values
+
+    def is_network(self, inst):
+        """Tell whether the values of inst are networks."""
+        return self._slots.get(inst) in self._networks
+
+    def network_log(self, inst, node_key=str):
+        """Return the network log of inst (see network_log()), with nodes
+        converted by node_key."""
+        return network_log(self._states(inst), node_key)
+
+    def graph(self, inst, index):
+        """Return the network of inst at the time point with the given
+        index, or None if it was not recorded then."""
+        slot = self._slots[inst]
+        if not index < self.lengths[slot] or not self._valid[index, slot]:
+            return None
+        return self._values[index, slot].graph()
+
+    # Mapping interface:
+
+    def __getitem__(self, inst):
+        values = self._states(inst)
+        if self.is_network(inst):
+            return _graphs(values)
+        return values
+
+    def __iter__(self):
+        return iter(self.instances)
+
+    def __len__(self):
+        return len(self.instances)
+
+    def __contains__(self, inst):
+        return inst in self._slots
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __reduce__(self):
+        # pickle and copy as a plain dict:
+        return (dict, (dict(self.items()),))
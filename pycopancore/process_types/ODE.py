@@ -37,7 +37,8 @@ class ODE(_AbstractProcess):
                  targets,
                  specification,
                  *,
-                 smoothness=1
+                 smoothness=1,
+                 dependencies=None
                 ):
         """Instantiate an instance of an ODE process.
 
@@ -52,9 +53,15 @@ class ODE(_AbstractProcess):
             attributes d_varname, or list of sympy expressions giving the
             RHS of the equation(s)
         smoothness
+        dependencies : list, optional
+            list of Variables a specification method reads. If not given,
+            they are guessed from the method's source code and the method
+            is assumed to possibly depend on all Variables when deciding
+            which Explicit processes are needed during integration
         """
         super().__init__(name)
 
         self.targets = targets
         self.specification = specification
         self.smoothness = smoothness
+        self.dependencies = dependencies
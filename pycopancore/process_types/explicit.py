@@ -35,7 +35,8 @@ class Explicit(_AbstractProcess):
                  name,
                  targets,
                  specification,
-                 smoothness=0
+                 smoothness=0,
+                 dependencies=None
                  ):
         """Instantiate an instance of an explicit process.
 
@@ -46,9 +47,15 @@ class Explicit(_AbstractProcess):
         specification : func
             function(self,t)
         smoothness :
+        dependencies : list, optional
+            list of Variables a specification method reads. If not given,
+            they are guessed from the method's source code and the method
+            is assumed to possibly depend on all Variables when deciding
+            which Explicit processes are needed during integration
         """
         super().__init__(name)
 
         self.targets = targets
         self.specification = specification
         self.smoothness = smoothness
+        self.dependencies = dependencies
@@ -15,3 +15,5 @@ Created on Mar 10, 2017
 
 from .runner import Runner
 from .hooks import Hooks
+from .ensemble_runner import EnsembleRunner
+from .sweep import Sweep, parameter_grid
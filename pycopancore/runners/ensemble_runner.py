@@ -0,0 +1,212 @@
+"""EnsembleRunner class.
+
+Runs an ensemble of variants of the same model structure, e.g. for a
+parameter study, as one combined model. Each ensemble member consists of
+its own entities, built by a user-supplied function from one variant (e.g. a
+dict of parameter values and initial values), while the process taxa (which
+can be instantiated only once) are shared by all members. Since all
+members exist at the same time and do not refer to each other, the composite
+ODE system integrated by the Runner is block-diagonal (up to the order of
+the value array, which lists the values of all members for one Variable
+after the other), and every symbolic specification is evaluated for all
+members at once in a single vectorized numpy call. This amortizes the
+Python overhead of a run over the ensemble.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+from .. import ReferenceVariable, SetVariable, Variable
+from ..private import _AbstractProcessTaxonMixin, _TrajectoryDictionary
+from .runner import Runner
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EnsembleRunner(Runner):
+    """Runner integrating all members of a model ensemble together.
+
+    Members must be independent: no entity of one member may refer to one
+    of another member via a ReferenceVariable or SetVariable, and process
+    implementations must not couple them in other ways (e.g. by a network
+    containing entities of several members, or by processes of the shared
+    process taxa aggregating over all entities). Variants may hence differ
+    in the values of the entities' Variables only; a ValueError is raised
+    if building the members sets different values of some process taxon's
+    Variable (e.g. a Culture parameter), since all members would share
+    the value set last. Steps and Events of all
+    members share the integration intervals between discontinuities, so the
+    speed-up is largest for ODE and Explicit processes.
+    """
+
+    members = None
+    """list of lists of the entities belonging to each member"""
+    member_trajectories = None
+    """list of trajectory dicts of the last run, one for each member"""
+
+    def __init__(self,
+                 model,
+                 build_member,
+                 variants,
+                 *,
+                 termination_calls=None
+                 ):
+        """Build the ensemble members and instantiate an EnsembleRunner.
+
+        Parameters
+        ----------
+        model : Model
+            The (configured) model all members are instances of.
+        build_member : callable
+            function(variant) instantiating the entities of one member,
+            which may refer to the process taxa instantiated before. Its
+            return value is ignored, the new entities are found in the
+            entity types' instances lists.
+        variants : iterable
+            one variant for each member, passed to build_member
+        termination_calls : list, optional
+            see Runner
+        """
+        self._member_of = {}
+        self.members = []
+        classes = model.entity_types
+        for k, variant in enumerate(variants):
+            before = {c: set(c.instances or ()) for c in classes}
+            build_member(variant)
+            members = [inst for c in classes for inst in (c.instances or ())
+                       if inst not in before[c]]
+            values = _taxon_values(model)
+            if k == 0:
+                taxon_values = values
+            else:
+                _check_taxon_values(taxon_values, values, k)
+            for inst in members:
+                self._member_of[inst] = k
+            self.members.append(members)
+        for k, members in enumerate(self.members):
+            for inst in members:
+                for other in _references(inst):
+                    if self._member_of.get(other, k) != k:
+                        raise ValueError(
+                            "ensemble members are not independent: "
+                            + str(inst) + " of member " + str(k)
+                            + " refers to " + str(other) + " of member "
+                            + str(self._member_of[other]))
+        logger.info("Built %d ensemble members with %d entities",
+                    len(self.members), len(self._member_of))
+        super(EnsembleRunner, self).__init__(
+            model, termination_calls=termination_calls)
+
+    def member_of(self, inst):
+        """Return the index of the member inst belongs to, or None for
+        process taxa.
+
+        Entities created during a run (e.g. by Events) are assigned to the
+        member of the first entity they refer to.
+        """
+        if isinstance(inst, _AbstractProcessTaxonMixin):
+            return None
+        try:
+            return self._member_of[inst]
+        except KeyError:
+            pass
+        for other in _references(inst):
+            k = self._member_of.get(other)
+            if k is not None:
+                self._member_of[inst] = k
+                return k
+        return None
+
+    def run(self, **kwargs):
+        """Run all members together.
+
+        Takes the same parameters as Runner.run, and additionally stores
+        the combined trajectory dict as trajectory_dict.
+
+        Returns
+        -------
+        list
+            the members' trajectory dicts, each with key 't' and a dict
+            mapping the member's entities (and the shared process taxa) to
+            lists of values for each Variable
+        """
+        trajectory = super(EnsembleRunner, self).run(**kwargs)
+        self.member_trajectories = [_TrajectoryDictionary()
+                                    for _ in self.members]
+        for member_trajectory in self.member_trajectories:
+            member_trajectory['t'] = list(trajectory['t'])
+        for var, values in trajectory.items():
+            if not isinstance(var, Variable):
+                continue
+            for member_trajectory in self.member_trajectories:
+                member_trajectory[var] = {}
+            for inst in values:
+                k = self.member_of(inst)
+                if k is not None:
+                    self.member_trajectories[k][var][inst] = values[inst]
+                elif isinstance(inst, _AbstractProcessTaxonMixin):
+                    for member_trajectory in self.member_trajectories:
+                        member_trajectory[var][inst] = values[inst]
+        return self.member_trajectories
+
+
+def _references(inst):
+    """Return the list of instances inst refers to via ReferenceVariables
+    and SetVariables."""
+    refs = []
+    for var in inst.__class__.variables:
+        if not isinstance(var, (ReferenceVariable, SetVariable)):
+            continue
+        value = getattr(inst, var.codename, None)
+        if value is None or isinstance(value, Variable):
+            continue
+        if isinstance(var, SetVariable):
+            refs.extend(value)
+        else:
+            refs.append(value)
+    return refs
+
+
+def _taxon_values(model):
+    """Return a dict mapping (Variable, process taxon) to the value of all
+    non-reference Variables of the model's process taxa."""
+    values = {}
+    for c in model.process_taxa:
+        for inst in (c.instances or ()):
+            for var in c.variables:
+                if isinstance(var, (ReferenceVariable, SetVariable)):
+                    continue
+                value = getattr(inst, var.codename, None)
+                if not isinstance(value, Variable):
+                    values[(var, inst)] = value
+    return values
+
+
+def _check_taxon_values(expected, values, k):
+    """Raise a ValueError if member k's variant set a process taxon's
+    Variable to a value different from that of member 0."""
+    for key in set(expected) | set(values):
+        a, b = expected.get(key), values.get(key)
+        if a is b:
+            continue
+        try:
+            equal = np.array_equal(a, b)
+        except Exception:
+            equal = False
+        if not equal:
+            raise ValueError(
+                "ensemble members must not differ in process taxon "
+                "Variables, which they share: member " + str(k) + " sets "
+                + str(key[0]) + " to " + str(b)
+                + " instead of " + str(a) + " (vary Variables of entities "
+                "instead)")
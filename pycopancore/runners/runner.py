@@ -12,23 +12,35 @@
 
 # TODOs: 
 # - rename to ScipyODERunner
-# - enable verbosity level, use proper logger
 
 from .. import Event, Step, Variable
+from ..util import verbosity
 from ..private import _AbstractRunner, _DotConstruct, eval, unknown, \
-    _AbstractEntityMixin, _TrajectoryDictionary, _AbstractProcessTaxonMixin
+    get_instance_dependencies, _broadcast_index, \
+    _AbstractEntityMixin, _TrajectoryDictionary, _AbstractProcessTaxonMixin, \
+    _DiscontinuitySchedule, _TrajectoryRecorder, _StructureVersion, \
+    _Checkpoint, _HDF5TrajectoryWriter, _ProcessTimer
 # TODO: discuss whether this makes sense or leads to problems:
 from .hooks import Hooks
+from .solvers import get_solver
 
-from scipy import integrate
+import logging
 import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix, diags
 
-from time import time
+from time import time, perf_counter
 # import sys
 
+logger = logging.getLogger(__name__)
+
 # from profilehooks import coverage, profile
 
 
+def _copy_values(values):
+    """Return a copy of an array of values, or the list of values itself."""
+    return values.copy() if isinstance(values, np.ndarray) else values
+
+
 class Runner(_AbstractRunner):
     """Runner-class, it owns the run function which calculates trajectories.
 
@@ -38,6 +50,32 @@ class Runner(_AbstractRunner):
 
     _current_iteration = None
     """counter for expression evaluation cache"""
+    _target_variables = None
+    """list of Variables contained in the ODE value array"""
+    _layout_version = None
+    """_StructureVersion value for which the layout of the ODE value array
+    (_target_variables and their slices) was determined, or None"""
+    _jac_sparsity = None
+    """cached result of get_jac_sparsity for the current layout"""
+    solver_statistics = None
+    """list of dicts of ODE solver statistics, one for each interval
+    between discontinuities integrated during the last run, with keys
+    "t_0", "t_1", "time" (seconds taken) and those described in
+    _SolverBackend.integrate"""
+    discontinuities = None
+    """_DiscontinuitySchedule of the next occurrences of Steps and Events
+    during a run, which may be used to reschedule or cancel them"""
+    _explicits_state = None
+    """tuple (t, value_array) at which Explicit processes were last applied
+    during ODE integration, or None"""
+    trajectory_recorder = None
+    """_TrajectoryRecorder holding the values of the last run's
+    trajectory_dict as numpy arrays"""
+    _hdf5_writer = None
+    """_HDF5TrajectoryWriter of the current run, or None"""
+    timer = None
+    """_ProcessTimer holding the times and call counts of all processes
+    of the last run if it was run with timing=True, else None"""
 
     def __init__(self,
                  model,
@@ -63,6 +101,8 @@ class Runner(_AbstractRunner):
         self.model = model
         self.processes = model.processes
         self.explicit_processes = model.explicit_processes
+        self.RHS_explicit_processes = model.RHS_explicit_processes
+        self.output_explicit_processes = model.output_explicit_processes
         self.event_processes = model.event_processes
         self.step_processes = model.step_processes
         self.ode_processes = model.ODE_processes
@@ -76,24 +116,32 @@ class Runner(_AbstractRunner):
         self._current_iteration = 0
 
 #    @profile  # generates time profiling information
-    def apply_explicits(self, t):
-        """Apply all Explicit processes.
+    def apply_explicits(self, t, processes=None, phase="ex-post explicits"):
+        """Apply Explicit processes.
 
         Parameters
         ----------
         t : float
             Model time
+        processes : iterable, optional
+            Explicit processes to apply (default: all)
+        phase : str, optional
+            phase to which the time taken is attributed if timing (see
+            _ProcessTimer)
         """
-        # TODO: apply them in an order that respects dependencies among
-        # variables! for this, determine dependency structure in
-        # modellogics.configure!
         # TODO: use a numpy array to store values of explicitly calculated
         # variables just as for ode variables, to avoid reading and writing
         # entities' attributes all the time (profiling has shown that this
         # takes a significant portion of the time).
-        for p in self.explicit_processes:
+        if processes is None:
+            processes = self.explicit_processes
+        timer = self.timer
+        for p in processes:
 #            print(t,"Process",p)
+            if timer is not None:
+                start = perf_counter()
             spec = p.specification  # either a list of symbolic expressions or a method
+            compiled = p.compiled_specification
             if isinstance(spec, list):
                 # it's a list of symbolic expressions, one for each target in
                 # the same order as in "targets". hence we loop over those:
@@ -102,8 +150,11 @@ class Runner(_AbstractRunner):
                     # evaluate corresponding expression,
                     # giving a list of values, one for each instance,
                     # in an order determined by the target:
-                    values = eval(spec[i],
-                                  self._current_iteration)
+                    if compiled is not None:
+                        values = compiled[i].eval(self._current_iteration)
+                    else:
+                        values = eval(spec[i],
+                                      self._current_iteration)
                     # note that values may have different length than
                     # p.owning_class.instances due to broadcasting effects
                     # if the target is a dotconstruct.
@@ -115,6 +166,8 @@ class Runner(_AbstractRunner):
                 # the target (!) instances' attributes directly:
                 for inst in p.owning_class.instances:
                     spec(inst, t)
+            if timer is not None:
+                timer.add(phase, p, perf_counter() - start)
 
 #    @profile  # generates time profiling information
     def get_rhs_array(self,
@@ -148,21 +201,29 @@ class Runner(_AbstractRunner):
             var.fast_set_values(values=value_array[target._from:target._to])
             var.clear_derivatives()
 
-        # Execute all explicit processes (3.1.2 in runner scheme):
-        self.apply_explicits(t)
-        # TODO: for speedup, only do this for those explicits whose targets
-        # are needed during ODE integration, and execute all others ex post.
+        # Execute those explicit processes whose targets are needed during
+        # ODE integration (3.1.2 in runner scheme), all others are
+        # executed ex post:
+        self.apply_explicits(t, self.RHS_explicit_processes, "RHS explicits")
+        self._explicits_state = (t, value_array.copy())
 
         # let all processes calculate their derivative terms:
         summands_array = np.zeros(value_array.size)
+        timer = self.timer
         for p in self.ode_processes:
+            if timer is not None:
+                start = perf_counter()
             spec = p.specification
+            compiled = p.compiled_specification
             if isinstance(spec, list):
                 # its a list of symbolic expressions, one for each target:
                 for i, target in enumerate(p.targets):
                     # evaluate symbolic expression for each target instance,
                     # giving a list:
-                    summands = eval(spec[i], self._current_iteration)
+                    if compiled is not None:
+                        summands = compiled[i].eval(self._current_iteration)
+                    else:
+                        summands = eval(spec[i], self._current_iteration)
                     if isinstance(target, Variable):
                         # add result directly to output array
                         # (rather than in instances' derivative attributes):
@@ -192,6 +253,8 @@ class Runner(_AbstractRunner):
 #                print("calling spec for",p,"with targets",p.targets)
                 for inst in p.owning_class.instances:
                     spec(inst, t)
+            if timer is not None:
+                timer.add("RHS ODE terms", p, perf_counter() - start)
 
         # compose complete derivative array:
         derivative_array = np.zeros(value_array.size)
@@ -213,6 +276,208 @@ class Runner(_AbstractRunner):
 #        print("derivs:",derivative_array)
         return derivative_array
 
+    def get_jac_sparsity(self, target_variables):
+        """Return the sparsity pattern of the Jacobian of get_rhs_array.
+
+        The pattern is derived from the symbolic specifications of ODE and
+        Explicit processes and the current references between instances.
+        Dependencies via Explicit processes are followed transitively.
+        Derivatives computed by specification methods, or depending on
+        variables set by Explicit specification methods, are assumed to
+        depend on the whole state.
+
+        Parameters
+        ----------
+        target_variables : list
+            Variables contained in the value array, with slice indices
+            _from and _to already set
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            matrix with a 1 at [i, j] if derivative i may depend on value j
+        """
+        arraylen = sum(var._to - var._from for var in target_variables)
+        # column of each (Variable, instance) pair in the value array:
+        columns = {}
+        for var in target_variables:
+            for pos, inst in enumerate(var.owning_class.instances):
+                columns[(var, inst)] = var._from + pos
+        # direct dependencies of explicitly computed attributes:
+        explicit_deps = {}
+        dense_vars = set()
+        for p in self.explicit_processes:
+            if not isinstance(p.specification, list):
+                dense_vars.update(target.target_variable
+                                  for target in p.targets)
+                continue
+            for i, target in enumerate(p.targets):
+                deps = get_instance_dependencies(p.specification[i])
+                if isinstance(target, Variable):
+                    instances = p.owning_class.instances
+                else:
+                    deps = target._broadcast(deps) if len(deps) > 0 else deps
+                    instances = target.target_instances
+                var = target.target_variable
+                for inst, d in zip(instances, deps):
+                    explicit_deps.setdefault((var, inst), set()).update(d)
+        # resolve them to columns, with None meaning all columns:
+        resolved = {}
+
+        def resolve(deps):
+            cols = set()
+            for key in deps:
+                if key in columns:
+                    cols.add(columns[key])
+                elif key[0] in dense_vars:
+                    return None
+                elif key in explicit_deps:
+                    if key not in resolved:
+                        # mark as visited in case of cyclic dependencies:
+                        resolved[key] = set()
+                        resolved[key] = resolve(explicit_deps[key])
+                    if resolved[key] is None:
+                        return None
+                    cols.update(resolved[key])
+            return cols
+
+        rows = []
+        cols = []
+        dense_rows = []
+        for p in self.ode_processes:
+            if not isinstance(p.specification, list):
+                for target in p.targets:
+                    var = target.target_variable
+                    dense_rows += range(var._from, var._to)
+                continue
+            for i, target in enumerate(p.targets):
+                deps = get_instance_dependencies(p.specification[i])
+                var = target.target_variable
+                if isinstance(target, Variable):
+                    targetrows = range(var._from, var._to)
+                else:
+                    deps = target._broadcast(deps) if len(deps) > 0 else deps
+                    targetrows = [columns[(var, inst)]
+                                  for inst in target.target_instances]
+                for row, d in zip(targetrows, deps):
+                    c = resolve(d)
+                    if c is None:
+                        dense_rows.append(row)
+                    else:
+                        rows += [row] * len(c)
+                        cols += c
+        for row in set(dense_rows):
+            rows += [row] * arraylen
+            cols += range(arraylen)
+        sparsity = coo_matrix((np.ones(len(rows)), (rows, cols)),
+                              shape=(arraylen, arraylen)).tocsr()
+        # entries may have been summed up, so reset them to 1:
+        sparsity.data[:] = 1
+        return sparsity
+
+    def get_jacobian(self, t, value_array):
+        """Return the Jacobian of get_rhs_array as a sparse matrix.
+
+        Evaluates the symbolic partial derivatives prepared by
+        ModelLogics.configure(analytic_jacobian=True) and combines them by
+        the chain rule, following dependencies via Explicit processes.
+
+        Parameters
+        ----------
+        t : float
+            Model time
+        value_array : array
+            array of variable values
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            matrix of partial derivatives of the derivatives (rows) w.r.t.
+            the values (columns)
+        """
+        self._current_iteration += 1  # marks current evaluation caches as outdated
+        target_variables = set(self._target_variables)
+        for var in target_variables:
+            var.fast_set_values(values=value_array[var._from:var._to])
+        self.apply_explicits(t, self.RHS_explicit_processes, "RHS explicits")
+        self._explicits_state = (t, value_array.copy())
+
+        n = value_array.size
+        iteration = self._current_iteration
+        # Jacobians of all Variables' values, computed on demand:
+        jacobians = {}
+
+        def jacobian_of(var):
+            try:
+                return jacobians[var]
+            except KeyError:
+                pass
+            instances = var.owning_class.instances
+            positions = {inst: pos for pos, inst in enumerate(instances)}
+            if var in target_variables:
+                jac = csr_matrix(
+                    (np.ones(len(instances)),
+                     (np.arange(len(instances)),
+                      np.arange(var._from, var._to))),
+                    shape=(len(instances), n))
+            else:
+                # computed by Explicit processes, or constant:
+                jac = csr_matrix((len(instances), n))
+                assigned = np.zeros(len(instances))
+                for p in self.explicit_processes:
+                    for i, target in enumerate(p.targets):
+                        if target.target_variable is not var:
+                            continue
+                        targetjac, cards, brs = \
+                            p.jacobian_specification[i].evaluate(
+                                jacobian_of, n, iteration)
+                        if isinstance(target, Variable):
+                            rows = np.arange(len(instances))
+                        else:
+                            index = _broadcast_index(targetjac.shape[0],
+                                                     target.cardinalities,
+                                                     target.branchings)
+                            if index is not None:
+                                targetjac = targetjac[index]
+                            rows = np.array([positions[inst] for inst
+                                             in target.target_instances],
+                                            dtype=int)
+                        # the last value stored for a row counts:
+                        last = {row: k for k, row in enumerate(rows)}
+                        selection = csr_matrix(
+                            (np.ones(len(last)),
+                             (list(last.keys()), list(last.values()))),
+                            shape=(len(instances), len(rows)))
+                        keep = np.ones(len(instances))
+                        keep[list(last.keys())] = 0
+                        jac = diags(keep) @ jac + selection @ targetjac
+            jacobians[var] = (jac.tocsr(), positions)
+            return jacobians[var]
+
+        jacobian = csr_matrix((n, n))
+        for p in self.ode_processes:
+            for i, target in enumerate(p.targets):
+                targetjac, cards, brs = p.jacobian_specification[i].evaluate(
+                    jacobian_of, n, iteration)
+                var = target.target_variable
+                if isinstance(target, Variable):
+                    rows = np.arange(var._from, var._to)
+                else:
+                    index = _broadcast_index(targetjac.shape[0],
+                                             target.cardinalities,
+                                             target.branchings)
+                    if index is not None:
+                        targetjac = targetjac[index]
+                    positions = jacobian_of(var)[1]
+                    rows = var._from + np.array(
+                        [positions[inst] for inst in target.target_instances],
+                        dtype=int)
+                # terms for the same row add up:
+                jacobian = jacobian + csr_matrix(
+                    (np.ones(len(rows)), (rows, np.arange(len(rows)))),
+                    shape=(n, len(rows))) @ targetjac
+        return jacobian.tocsr()
+
     # @profile
     def run(self,
             *,
@@ -220,9 +485,24 @@ class Runner(_AbstractRunner):
             t_1,
             dt,  # TODO: rename to "resolution" since it is only an upper bound?
             exclusions=None,
-            # TODO: add some kwargs for choosing solver and setting its params
             max_resolution=False,
-            add_to_output=None  # optional list of variables to include in output
+            add_to_output=None,  # optional list of variables to include in output
+            solver="dopri5",
+            rtol=None,
+            atol=None,
+            first_step=None,
+            max_step=None,
+            solver_options=None,
+            use_jac_sparsity=True,
+            use_analytic_jacobian=True,
+            dense_output=False,
+            output_times=None,
+            checkpoint_file=None,
+            checkpoint_interval=3600,
+            hdf5_file=None,
+            keep_trajectory=True,
+            timing=False,
+            _resume_state=None
             ):
         """Run the model for a specified time interval.
 
@@ -240,6 +520,66 @@ class Runner(_AbstractRunner):
         exclusions: list
             List with Variables, that shan't be included into the output
             trajectory_dict
+        max_resolution : bool, optional
+            if True, reduce the resolution of the output while running:
+            a time point is dropped if the ones before and after it are
+            less than dt apart (default: False)
+        solver : str, optional
+            ODE integration method, either one of the integrators of
+            scipy.integrate.ode ("dopri5" (default), "dop853", "vode")
+            or one of the methods of scipy.integrate.solve_ivp
+            ("RK23", "RK45", "DOP853", "Radau", "BDF", "LSODA")
+        rtol, atol : float, optional
+            relative and absolute tolerance (default: solver's default)
+        first_step : float, optional
+            initial step size (default: chosen by solver)
+        max_step : float, optional
+            maximal step size (default: dt, or no limit if dense_output is
+            True or output_times are given)
+        solver_options : dict, optional
+            further options passed to the solver, e.g. nsteps for the
+            integrators of scipy.integrate.ode (default for dopri5:
+            nsteps=10000, verbosity=1)
+        use_jac_sparsity : bool, optional
+            whether to pass the sparsity pattern of the Jacobian, as derived
+            from the processes' specifications, to implicit solvers
+            ("Radau", "BDF") which then need fewer RHS evaluations to
+            estimate the Jacobian (default: True)
+        use_analytic_jacobian : bool, optional
+            whether to pass get_jacobian to implicit solvers ("Radau",
+            "BDF", "LSODA") if the model was configured with
+            analytic_jacobian=True and all relevant specifications could be
+            differentiated (default: True)
+        dense_output : bool, optional
+            if True, the solver takes steps as large as its error control
+            allows, and ODE variables (and Explicit processes) are only
+            evaluated on the time grid t_0 + k*dt by interpolation, and at
+            the times of Steps and Events (default: False, in which case
+            every solver step is output)
+        output_times : array, optional
+            time grid to use instead of t_0 + k*dt, implies
+            dense_output=True
+        checkpoint_file : str, optional
+            if given, a checkpoint of the run is written to this file
+            whenever checkpoint_interval seconds have passed since the last
+            one (at the next discontinuity), from which the run can be
+            continued by resume()
+        checkpoint_interval : float, optional
+            minimum wall-clock time in seconds between checkpoints
+            (default: 3600)
+        hdf5_file : str, optional
+            if given, the trajectory is appended to this HDF5 file while
+            running (requires h5py), see _HDF5TrajectoryWriter
+        keep_trajectory : bool, optional
+            if False, time points are dropped from the returned
+            trajectory_dict once they were written to hdf5_file, so that
+            the memory used does not grow with the length of the run
+            (default: True)
+        timing : bool, optional
+            if True, record the wall-clock time and number of calls of
+            each process, split by phase of the run, in timer (a
+            _ProcessTimer) and log a summary table after the run
+            (default: False)
 
         Returns
         -------
@@ -251,141 +591,194 @@ class Runner(_AbstractRunner):
                 key: entity or taxon,
                 value: list of variable values in same order as time points.
         """
-        print("\nRunning from", t_0, "to", t_1, "with output at least every",
-              dt, "...")
+        # arguments to store in checkpoints:
+        run_kwargs = {key: value for key, value in locals().items()
+                      if key not in ("self", "_resume_state")}
+        logger.info("Running from %s to %s with output at least every %s ...",
+                    t_0, t_1, dt)
+        # whether to log details of single Event and Step occurrences:
+        debug = logger.isEnabledFor(logging.DEBUG)
+        _runstarttime = time()  # for performance reporting
+        # wall-clock time of the next progress message:
+        next_progress = [_runstarttime + verbosity.progress_interval]
 
         # Initialize running time variable to starting time:
         t = t_0
 
+        timer = self.timer = _ProcessTimer() if timing else None
+
         # For performance reasons, convert all variable values to standard
         # units, so that no DimensionalQuantities are left in variable values:
         self.model.convert_to_standard_units()
 
-        # Create output dictionary:
+        # Create output dictionary, whose entries are views on the arrays
+        # of a trajectory recorder:
+        if _resume_state is None:
+            recorder = _TrajectoryRecorder(
+                min_spacing=dt if max_resolution else None)
+        else:
+            # continue the trajectory and time stored in the checkpoint:
+            recorder = _resume_state["recorder"]
+            t = _resume_state["t"]
+        self.trajectory_recorder = recorder
+        writer = self._hdf5_writer = None
+        if hdf5_file is not None:
+            writer = self._hdf5_writer = _HDF5TrajectoryWriter(
+                hdf5_file, recorder,
+                state=_resume_state and _resume_state["hdf5_writer"])
         self.trajectory_dict = _TrajectoryDictionary()
+        self.trajectory_dict['t'] = recorder.times
         for v in self.model.variables:
-            self.trajectory_dict[v] = {}
+            self.trajectory_dict[v] = recorder[v]
 
         # Remove exclusions from being saved:
-        targets_to_save = self.model.process_targets
+        targets_to_save = list(self.model.process_targets)
         # print(self.model.process_targets)
         if exclusions is not None:
             for var in exclusions:
                 targets_to_save.remove(var)
 
-        # Save initial state to output dict:
-        self.trajectory_dict['t'] = [t]
+        # the layout of the ODE value array is determined anew:
+        self._layout_version = None
 
-        self.save_to_traj(targets_to_save,
-                          add_to_output,
-                          max_resolution,
-                          dt)
-        # TODO: have save_to_traj() save t as well to have this cleaner.
+        if _resume_state is not None:
+            next_discontinuities = self.discontinuities = \
+                _resume_state["discontinuities"]
+        else:
+            # Save initial state to output dict:
+            recorder.append_time(t)
 
-        # Create dictionary containing discontinuities:
-        next_discontinuities = {}
+            self.save_to_traj(targets_to_save, add_to_output)
+            # TODO: have save_to_traj() save t as well to have this cleaner.
 
-        # Apply all Explicit processes (2.2 in runner scheme)
-        print("  Initial application of Explicit processes...")
-        self.apply_explicits(t_0)
+            # Create schedule of discontinuities:
+            next_discontinuities = self.discontinuities = \
+                _DiscontinuitySchedule()
 
-        # Only now save initial state to output dict:
-        self.trajectory_dict['t'] = [t]
-        self.save_to_traj(targets_to_save,
-                          add_to_output,
-                          max_resolution,
-                          dt)
-        # TODO: have save_to_traj() save t as well to have this cleaner.
+            # Apply all Explicit processes (2.2 in runner scheme)
+            logger.debug("  Initial application of Explicit processes...")
+            self.apply_explicits(t_0)
 
-        # TODO: discuss whether hooks make sense, then maybe:
-        # TODO: add hooks to runner scheme
-        # apply all pre-hooks
-        if Hooks._pre_hooks:
-            print("  Executing pre-hooks ...")
-            Hooks.execute_hooks(Hooks.Types.pre, self.model, t_0)
-
-        # Find first occurrence times of events (2.3 in runner scheme):
-        print("  Finding times of first occurrence of Events...")
-        for event in self.event_processes:
-            print("    Event process", event, "...")
-            eventtype = event.specification[0]
-            rate_or_timefunc = event.specification[1]
-            # TODO: Check if the following loop is correct:
-            for inst in event.owning_class.instances:
-                # inst is a process taxon or entity
-                assert eventtype in ("rate", "time"), \
-                    "unsupported type of Event"
-                if eventtype == "rate":
-                    assert rate_or_timefunc > 0, \
-                        "zero, negative, or varying rates not supported yet."
-                    next_time = t_0 + np.random.exponential(1. / rate_or_timefunc)
-                    # TODO: if rate_or_timefunc is a function or symbolic expression in this case,
-                    # it returns a potentially time-varying rate that depends on state,
-                    # hence it must be used in ode integration to integrate
-                    # its cumulative distribution function, and when the
-                    # latter crosses a threshold that we randomly draw
-                    # here, solout must terminate (see below).
-                elif eventtype == "time":
-                    # in this case, rate_or_timefunc directly returns a time:
-                    next_time = rate_or_timefunc(inst, t)
-                    assert next_time > t_0, "next time must be > t"
-                try:
-                    next_discontinuities[next_time].append((event, inst))
-                except KeyError:
-                    next_discontinuities[next_time] = [(event, inst)]
-                print("      time", next_time, ":", inst)
-
-        # Fill next_discontinuities with times of next steps and perform
-        # a step if necessary (still 2.3 in runner scheme):
-        print("  Executing Steps and finding times of next execution...")
-        for step in self.step_processes:
-            print("    Step process", step, "...")
-            next_time_func = step.specification[0]
-            method = step.specification[1]
-            for inst in step.owning_class.instances:
-                # inst is a process taxon or entity
-                # FIXME: it seems inconsistent how we currently deal with the
-                # question whether a step exectutes at t_0 since it is unclear
-                # how the step would indicate that it is so.
-                # if next_time_func(inst, t) gives the smallest stepping time
-                # AFTER t, the following check would be incorrect:
-                if next_time_func(inst, t_0) == t_0:
-                    # so this step occurs right at the beginning
-                    method(inst, t)
-                    # ask process when it steps next:
-                    next_time = next_time_func(inst, t)
-                    assert next_time > t_0, "next time must be > t"
-                # TODO: Same time for all instances? self. necessary?
-                else:
-                    # ask process when it steps next:
-                    next_time = next_time_func(inst, t)
-                    assert next_time > t_0, "next time must be > t"
-                # register next stepping time in dict:
-                try:
-                    next_discontinuities[next_time].append((step, inst))
-                    # so there were already events at the same time
-                except KeyError:
-                    # so there was no event yet at that time
-                    next_discontinuities[next_time] = [(step, inst)]
-                print("      time", next_time, ":", inst)
+            # Only now save initial state to output dict:
+            recorder.reset_times([t])
+            self.save_to_traj(targets_to_save, add_to_output)
+            # TODO: have save_to_traj() save t as well to have this cleaner.
+
+            # TODO: discuss whether hooks make sense, then maybe:
+            # TODO: add hooks to runner scheme
+            # apply all pre-hooks
+            if Hooks._pre_hooks:
+                logger.debug("  Executing pre-hooks ...")
+                if timer is not None:
+                    start = perf_counter()
+                Hooks.execute_hooks(Hooks.Types.pre, self.model, t_0)
+                if timer is not None:
+                    timer.add("hooks", "pre-hooks", perf_counter() - start)
+
+            # Find first occurrence times of events (2.3 in runner scheme):
+            logger.debug("  Finding times of first occurrence of Events...")
+            for event in self.event_processes:
+                logger.debug("    Event process %s ...", event)
+                eventtype = event.specification[0]
+                rate_or_timefunc = event.specification[1]
+                if timer is not None:
+                    start = perf_counter()
+                # TODO: Check if the following loop is correct:
+                for inst in event.owning_class.instances:
+                    # inst is a process taxon or entity
+                    assert eventtype in ("rate", "time"), \
+                        "unsupported type of Event"
+                    if eventtype == "rate":
+                        assert rate_or_timefunc > 0, \
+                            "zero, negative, or varying rates not supported yet."
+                        next_time = t_0 + np.random.exponential(1. / rate_or_timefunc)
+                        # TODO: if rate_or_timefunc is a function or symbolic expression in this case,
+                        # it returns a potentially time-varying rate that depends on state,
+                        # hence it must be used in ode integration to integrate
+                        # its cumulative distribution function, and when the
+                        # latter crosses a threshold that we randomly draw
+                        # here, solout must terminate (see below).
+                    elif eventtype == "time":
+                        # in this case, rate_or_timefunc directly returns a time:
+                        next_time = rate_or_timefunc(inst, t)
+                        assert next_time > t_0, "next time must be > t"
+                    next_discontinuities.schedule(next_time, event, inst)
+                    if debug:
+                        logger.debug("      time %s: %s", next_time, inst)
+                if timer is not None:
+                    timer.add("Events", event, perf_counter() - start,
+                              len(event.owning_class.instances))
+
+            # Fill next_discontinuities with times of next steps and perform
+            # a step if necessary (still 2.3 in runner scheme):
+            logger.debug("  Executing Steps and finding times of next "
+                         "execution...")
+            for step in self.step_processes:
+                logger.debug("    Step process %s ...", step)
+                next_time_func = step.specification[0]
+                method = step.specification[1]
+                if timer is not None:
+                    start = perf_counter()
+                for inst in step.owning_class.instances:
+                    # inst is a process taxon or entity
+                    # FIXME: it seems inconsistent how we currently deal with the
+                    # question whether a step exectutes at t_0 since it is unclear
+                    # how the step would indicate that it is so.
+                    # if next_time_func(inst, t) gives the smallest stepping time
+                    # AFTER t, the following check would be incorrect:
+                    if next_time_func(inst, t_0) == t_0:
+                        # so this step occurs right at the beginning
+                        method(inst, t)
+                        # ask process when it steps next:
+                        next_time = next_time_func(inst, t)
+                        assert next_time > t_0, "next time must be > t"
+                    # TODO: Same time for all instances? self. necessary?
+                    else:
+                        # ask process when it steps next:
+                        next_time = next_time_func(inst, t)
+                        assert next_time > t_0, "next time must be > t"
+                    # register next stepping time in schedule:
+                    next_discontinuities.schedule(next_time, step, inst)
+                    if debug:
+                        logger.debug("      time %s: %s", next_time, inst)
+                if timer is not None:
+                    timer.add("Steps", step, perf_counter() - start,
+                              len(step.owning_class.instances))
 
         # At this point, no application of Explicit processes is necessary
         # since that is done during ODE integration
 
-        # prepare ODE solver:
-        solver = integrate.ode(self.get_rhs_array)
-        # apparently dopri5 is faster than vode, so we use dopri5.
+        # prepare ODE solver.
+        # apparently dopri5 is faster than vode, so we use dopri5 by default.
         # in vode, choosing bdf or adams doesn't seem to make any difference
-        # solver.set_integrator("vode", max_step=dt, method="bdf")
-        solver.set_integrator("dopri5",  # TODO: make this a parameter?
-                              max_step=dt,
-                              verbosity=1,
-                              nsteps=10000  # TODO: make this a parameter?
-                              )
+        options = {"verbosity": 1, "nsteps": 10000} \
+            if solver == "dopri5" else {}
+        options.update(solver_options or {})
+        solver = get_solver(self.get_rhs_array, solver,
+                            rtol=rtol, atol=atol, first_step=first_step,
+                            max_step=max_step if max_step is not None
+                            else dt if output_times is None
+                            and not dense_output else np.inf,
+                            **options)
+        self.solver_statistics = [] if _resume_state is None \
+            else _resume_state["solver_statistics"]
+
+        # time grid for output in dense output mode:
+        if output_times is not None:
+            output_grid = np.sort(np.asarray(output_times, dtype=float))
+        elif dense_output:
+            output_grid = t_0 + dt * np.arange(
+                1, int(np.ceil((t_1 - t_0) / dt)))
+        else:
+            output_grid = None
 
         # running lists of times and solutions:
         times = []
         sol = []
+        # dict of output values of all targets to save, captured at those
+        # positions in times where Explicit processes were already applied:
+        captured = {}
+        output_targets = targets_to_save + (add_to_output or [])
 
         # callback function the solver calls to output solutions:
         def solout(sol_t, sol_valuearray):
@@ -401,142 +794,213 @@ class Runner(_AbstractRunner):
             # save solution to lists:
             times.append(sol_t)
             sol.append(sol_valuearray.copy())
-            # TODO: ALSO output values of non-dynamical variables, like those
-            # from Explicit processes, so that they don't need to be
-            # calculated again after ode finished!
+            # if the last RHS evaluation was at this very time point and
+            # state (as for the last stage of a Dormand-Prince step), the
+            # results of Explicit processes are still in the instances'
+            # attributes, so only apply those not needed during integration
+            # and store them to avoid applying all of them again later.
+            # This requires that they were applied in an order respecting
+            # their dependencies, otherwise some values would be stale:
+            state = self._explicits_state
+            if self.explicit_processes and state is not None \
+                    and self.model.explicit_processes_ordered \
+                    and state[0] == sol_t \
+                    and np.array_equal(state[1], sol_valuearray):
+                if self.output_explicit_processes:
+                    self.apply_explicits(sol_t,
+                                         self.output_explicit_processes)
+                captured[len(times) - 1] = [
+                    _copy_values(target.target_variable.eval(
+                        target.target_class.instances))
+                    for target in output_targets]
             # TODO: this is the place to implement termination
             # due to events without a priori known occurrence
             # time! if solout returns 0 (or -1?), solver will
             # terminate. Similarly for solver "vode" above
-            print("      t =", sol_t, "            ", end='\r')
+            if time() >= next_progress[0]:
+                # report progress at most every progress_interval seconds:
+                next_progress[0] = time() + verbosity.progress_interval
+                logger.info("  t = %s", sol_t)
             # TODO: return value??
-        solver.set_solout(solout)
+
+        if _resume_state is not None:
+            # continue with the random numbers where the checkpoint was
+            # written:
+            _Checkpoint.restore_random_state(_resume_state["random_state"])
+        # wall-clock time of the next checkpoint:
+        next_checkpoint = time() + checkpoint_interval
 
         # Now loop until end time or early termination is reached:
         while t < t_1:
             # check whether to terminate early:
             if self.terminate():
-                print('Terminating run early at time ', t)
+                logger.info("Terminating run early at time %s", t)
                 break
+            # write a checkpoint if it is time to:
+            if checkpoint_file is not None and time() >= next_checkpoint:
+                if timer is not None:
+                    start = perf_counter()
+                self.write_checkpoint(checkpoint_file, run_kwargs, t)
+                if timer is not None:
+                    timer.add("output", "checkpoint", perf_counter() - start)
+                next_checkpoint = time() + checkpoint_interval
             # Get next discontinuity to find the next timestep where something
             # happens.
-            # If there are no discontinuities, the next_discontinuities
-            # dict is empty, therefore try is necessary:
-            try:
-                next_time = min(t_1, min(next_discontinuities.keys()))  # TODO: speed-up by using different data type for next_discontinuities, something like OrderedDict?
-            except ValueError:
+            # If there are no discontinuities, next_time() returns None:
+            next_time = next_discontinuities.next_time()
+            if next_time is None or next_time > t_1:
                 next_time = t_1
 
             # Call ode solver if there are any ODE processes:
             if self.model.ODE_processes:
 
-                print("  Running smoothly from", t, "to", next_time, "...")
-
-                # clear all targets _DotConstructs' caches of target instances
-                # since events and steps may have changed instance references:
-                for target in self.model.ODE_targets \
-                        + self.model.explicit_targets:
-                    target._target_instances = unknown
-
-                # determine array layouts (froms and tos of slices)
-                # and compose initial value-array:
-                print("    Composing initial value array...")
-                # list of target variables:
-                target_variables = list(set(
-                        [target.target_variable
-                         for target in self.model.ODE_targets]))
-                # list of array slice lengths, one for each target variable,
-                # length equalling number of target instances:
-                lens = [len(var.owning_class.instances)
-                        for var in target_variables]
-                # upper slice index is given by cumulative sum of lens:
-                tos = np.cumsum(lens)
-                # lower slice index is previous slice's upper index:
-                froms = np.concatenate(([0], tos[:-1]))
-                # total array length:
-                arraylen = sum(lens)
-                # init the array:
-                initial_array_ode = np.zeros(arraylen)
-                for i, var in enumerate(target_variables):
-                    # store slice indices in target variables:
-                    var._from = froms[i]
-                    var._to = tos[i]
+                logger.debug("  Running smoothly from %s to %s ...", t, next_time)
+
+                # determine array layouts (froms and tos of slices) unless
+                # the instance structure is unchanged since the last interval
+                # (_DotConstructs similarly renew their caches of target
+                # instances only after the structure changed):
+                if self._layout_version != _StructureVersion.value:
+                    logger.debug("    Determining array layout...")
+                    # list of target variables:
+                    # (in a fixed order so that runs are reproducible
+                    # across processes, e.g. when resumed from a checkpoint)
+                    target_variables = list(dict.fromkeys(
+                            [target.target_variable
+                             for target in self.model.ODE_targets]))
+                    # list of array slice lengths, one for each target
+                    # variable, length equalling number of target instances:
+                    lens = [len(var.owning_class.instances)
+                            for var in target_variables]
+                    # upper slice index is given by cumulative sum of lens:
+                    tos = np.cumsum(lens)
+                    # lower slice index is previous slice's upper index:
+                    froms = np.concatenate(([0], tos[:-1]))
+                    for i, var in enumerate(target_variables):
+                        # store slice indices in target variables:
+                        var._from = froms[i]
+                        var._to = tos[i]
+                    # store slice indices also in targets:
+                    for target in self.model.ODE_targets:
+                        var = target.target_variable
+                        target._from = var._from
+                        target._to = var._to
+                    self._target_variables = target_variables
+                    self._jac_sparsity = None
+                    self._layout_version = _StructureVersion.value
+                target_variables = self._target_variables
+
+                # compose initial value-array:
+                logger.debug("    Composing initial value array...")
+                initial_array_ode = np.zeros(
+                    sum(var._to - var._from for var in target_variables))
+                for var in target_variables:
                     # get initial values from instances and store in array:
-                    initial_array_ode[froms[i]:tos[i]] = \
+                    initial_array_ode[var._from:var._to] = \
                         var.eval(instances=var.owning_class.instances)
-                # store slice indices also in targets:
-                for target in self.model.ODE_targets:
-                    var = target.target_variable
-                    target._from = var._from
-                    target._to = var._to
 
                 # In Odeint, call get_rhs_array to get the RHS of the ODE
                 # system as an array (step 3.1 in runner scheme) then return
                 # the trajectory (3.2 in runner scheme):
 
-                print("    Calling ODE solver...")
+                logger.debug("    Calling ODE solver...")
 
                 _starttime = time()  # for performance reporting
 
                 times = []
                 sol = []
-                solver.set_initial_value(initial_array_ode, t)
+                captured.clear()
+                self._explicits_state = None
+                jac = None
+                jac_sparsity = None
+                if use_analytic_jacobian and solver.supports_jac \
+                        and self.model.analytic_jacobian:
+                    jac = self.get_jacobian
+                elif use_jac_sparsity and solver.supports_jac_sparsity:
+                    if self._jac_sparsity is None:
+                        self._jac_sparsity = \
+                            self.get_jac_sparsity(target_variables)
+                    jac_sparsity = self._jac_sparsity
+                if output_grid is not None:
+                    interval_times = output_grid[(output_grid > t)
+                                                 & (output_grid < next_time)]
+                else:
+                    interval_times = None
+
                 # now tell the solver to integrate from current time to
-                # next_time. it will call solout at least every dt:
-                solver.integrate(next_time)
+                # next_time. it will call solout at least every dt
+                # (or at the interval's output times):
+                stats = solver.integrate(t, initial_array_ode, next_time,
+                                         solout, jac_sparsity=jac_sparsity,
+                                         jac=jac,
+                                         output_times=interval_times)
                 # now solout has filled the times and sol with the integration
                 # result, so we can process them:
                 ts = np.array(times)
                 ode_trajectory = np.array(sol)
 
-                # TODO: capture solver failures and report any errors!
-
-                print("      ...took", time()-_starttime, "seconds and",
-                      len(times), "time steps")
+                stats["t_0"] = t
+                stats["t_1"] = next_time
+                stats["time"] = time() - _starttime
+                self.solver_statistics.append(stats)
+                if not stats["success"]:
+                    logger.warning("ODE solver %s failed before reaching %s",
+                                   solver.name, next_time)
+
+                logger.debug("      ...took %s seconds and %d time steps",
+                             stats["time"], len(times))
+                logger.debug("      (%s RHS evaluations, %s Jacobian evaluations, "
+                             "%s rejected steps)", stats["nfev"],
+                             stats["njev"], stats["n_rejected"])
+
+                # If requested, reduce the resolution by skipping some
+                # of the time points:
+                positions = np.arange(len(ts))
+                if max_resolution:
+                    positions = recorder.thin(ts)
+                    ts = ts[positions]
+                    ode_trajectory = ode_trajectory[positions]
 
                 # Save t values to output dict:
-                self.trajectory_dict['t'] += list(ts)
+                recorder.extend_times(ts)
 
-                print("    Saving results to output dict...")
+                logger.debug("    Saving results to output dict...")
                 # save trajectory of ODE variables to output dict:
-                tlen = len(self.trajectory_dict['t'])  # no. of simulated time points
                 for i, target in enumerate(self.model.ODE_targets):
-                    # from this target's slice starting at column target._from,
-                    # read results column by column and store in corresponding
-                    # target instances:
-                    for pos, inst in enumerate(target.target_class.instances):
-                        # get this instance's value column as a list,
-                        # containing the values for all time points:
-                        values = list(
-                                ode_trajectory[:, target._from + pos])
-                        try:
-                            if len(self.trajectory_dict[
-                                       target.target_variable][inst]) < tlen:
-                                # append to existing list:
-                                self.trajectory_dict[
-                                    target.target_variable][inst] += values
-                        except KeyError:
-                            # store as new list:
-                            self.trajectory_dict[
-                                target.target_variable][inst] = values
+                    # this target's slice starting at column target._from
+                    # has one column for each target instance:
+                    instances = target.target_class.instances
+                    recorder[target.target_variable].record_block(
+                        instances,
+                        ode_trajectory[:, target._from:
+                                       target._from + len(instances)])
 
                 # Take the time steps output by the ODE solver and apply
                 # Explicit processes a posteriori (step 3.3 in runner scheme).
                 # Save them to the trajectory_dict
                 # This is only done if there are any Explicit processes.
 
-                # TODO: in principle, this is inefficient since these processes
-                # were applied already during ODE integration, only their
-                # results were not stored. Can this be improved? Sadly, depen-
-                # ding on the solver method, we might not be sure that when
-                # solout is called, the previous call to apply_explicits was
-                # for the same time point and state, so we cannot simply use
-                # its result... (is this really true?)
+                # Where the solver output a time point right after evaluating
+                # the RHS there, the results were captured by solout and are
+                # stored directly. Depending on the solver method, this is
+                # not the case for all time points (e.g. not for interpolated
+                # ones), so the Explicit processes are applied again there.
 
                 if len(self.explicit_processes) > 0:
-                    print("    Applying Explicit processes to simulated "
-                          "time points...")
+                    reuse = np.array([pos in captured for pos in positions],
+                                     dtype=bool)
+                    if len(ts) > 0 and not reuse.all():
+                        # the last time point must be evaluated again so
+                        # that instances' attributes end up in its state:
+                        reuse[-1] = False
+                    logger.debug("    Applying Explicit processes to %d of %d "
+                                 "simulated time points...",
+                                 len(ts) - reuse.sum(), len(ts))
                     for pos, t in enumerate(ts):
+                        if reuse[pos]:
+                            self.save_to_traj(targets_to_save, add_to_output,
+                                              captured[positions[pos]])
+                            continue
                         self._current_iteration += 1  # marks current evaluation caches as outdated
                         # copy values from returned matrix to instances'
                         # attributes:
@@ -547,25 +1011,24 @@ class Runner(_AbstractRunner):
                             var.fast_set_values(ode_values[var._from:var._to])
                         self.apply_explicits(t)
                         # complete the output dictionary:
-                        self.save_to_traj(targets_to_save,
-                                          add_to_output,
-                                          max_resolution,
-                                          dt)
+                        self.save_to_traj(targets_to_save, add_to_output)
 
             # set current model time to end of previous ODE integration:
             t = next_time
 
             # After all that is done, determine what happens at the
             # discontinuity (step 3.4 in runner scheme)
-            # Delete the discontinuity from the dictionary and determine when
+            # Delete the discontinuity from the schedule and determine when
             # the next one happens:
             if t < t_1 and len(next_discontinuities) > 0:
 
                 # set current model time to end of previous ODE integration:
                 t = next_time
-                self.trajectory_dict['t'].append(t)
+                recorder.append_time(t)
 
-                print("  Executing Steps and/or Events at", t, "...")
+                if debug:
+                    logger.debug("  Executing Steps and/or Events at %s ...",
+                                 t)
 
                 # loop over all co-occurring steps/events.
                 # TODO: determine a "correct" order of steps/events or deal
@@ -583,8 +1046,11 @@ class Runner(_AbstractRunner):
                         if not inst.is_active:
                             # If it is not active, break.
                             continue
+                    if timer is not None:
+                        start = perf_counter()
                     if isinstance(process, Event):
-                        print("    Event", process, "@", inst, "...")
+                        if debug:
+                            logger.debug("    Event %s @ %s ...", process, inst)
                         eventtype = process.specification[0]
                         rate_or_timefunc = process.specification[1]
                         method = process.specification[2]
@@ -601,15 +1067,13 @@ class Runner(_AbstractRunner):
                             next_time = rate_or_timefunc(inst, t)
                             assert next_time > t, "next time must be > t"
                         # register it:
-                        try:
-                            next_discontinuities[next_time].append((process,
-                                                                    inst))
-                        except KeyError:
-                            next_discontinuities[next_time] = [(process,
-                                                                inst)]
-                        print("      next time", next_time)
+                        next_discontinuities.schedule(next_time, process,
+                                                      inst)
+                        if debug:
+                            logger.debug("      next time %s", next_time)
                     elif isinstance(process, Step):
-                        print("    Step", process, "@", inst, "...")
+                        if debug:
+                            logger.debug("    Step %s @ %s ...", process, inst)
                         timefunc = process.specification[0]
                         method = process.specification[1]
                         # Perform the step by calling its implementation method:
@@ -618,61 +1082,148 @@ class Runner(_AbstractRunner):
                         next_time = timefunc(inst, t)
                         assert next_time > t, "next time must be > t"
                         # register it:
-                        try:
-                            next_discontinuities[next_time].append((process,
-                                                                    inst))
-                        except KeyError:
-                            next_discontinuities[next_time] = [(process,
-                                                                inst)]
-                        print("      next time", next_time)
+                        next_discontinuities.schedule(next_time, process,
+                                                      inst)
+                        if debug:
+                            logger.debug("      next time %s", next_time)
+                    if timer is not None:
+                        timer.add("Events" if isinstance(process, Event)
+                                  else "Steps", process,
+                                  perf_counter() - start)
 
                 # Complete the new state by applying all explicit processes
                 # (3.5 in runner scheme):
-                print("    Applying Explicit processes to changed state...")
+                if debug:
+                    logger.debug("    Applying Explicit processes to changed "
+                                 "state...")
                 if self.model.explicit_processes:
                     self.apply_explicits(t)
 
                 # Store all information that has been calculated at time t:
-                print("    Completing output dict...")
-
-                self.save_to_traj(targets_to_save, add_to_output,
-                                  max_resolution, dt)
+                if debug:
+                    logger.debug("    Completing output dict...")
+
+                self.save_to_traj(targets_to_save, add_to_output)
+
+            # append completed time points to the HDF5 file:
+            if writer is not None and writer.n_pending >= writer.chunk_rows:
+                if timer is not None:
+                    start = perf_counter()
+                writer.write()
+                if timer is not None:
+                    timer.add("output", "HDF5 file", perf_counter() - start)
+                if not keep_trajectory:
+                    # (keeping the last two, which may still be needed for
+                    # reducing the resolution)
+                    recorder.discard(min(
+                        writer.n_written - recorder.n_discarded,
+                        recorder.n_times - 2))
 
             # TODO: discuss whether hooks make sense, then maybe:
             # TODO: add hooks to runner scheme
             # apply all mid-hooks
             if Hooks._mid_hooks:
-                print("  Executing mid-hooks ...")
+                logger.debug("  Executing mid-hooks ...")
+                if timer is not None:
+                    start = perf_counter()
                 Hooks.execute_hooks(Hooks.Types.mid, self.model, t_0)
+                if timer is not None:
+                    timer.add("hooks", "mid-hooks", perf_counter() - start)
 
         # TODO: discuss whether hooks make sense, then maybe:
         # TODO: add hooks to runner scheme
         # apply all post-hooks
         if Hooks._post_hooks:
-            print("  Executing post-hooks ...")
+            logger.debug("  Executing post-hooks ...")
+            if timer is not None:
+                start = perf_counter()
             Hooks.execute_hooks(Hooks.Types.post, self.model, t_0)
+            if timer is not None:
+                timer.add("hooks", "post-hooks", perf_counter() - start)
 
         # Assert every list still has the same lenght:
-        print('asserting same lenghts of all entries')
-        tlen = len(self.trajectory_dict['t'])
+        tlen = recorder.n_times
         for target in targets_to_save:
             var = target.target_variable
             instances = target.target_class.instances
-            for inst in instances:
-                assert len(self.trajectory_dict[var][inst]) == tlen, (
-                    len(self.trajectory_dict[var][inst]), tlen,
-                    self.trajectory_dict[var][inst],
-                    self.trajectory_dict['t'],
-                    var
-                )
+            trajectory = recorder[var]
+            lengths = trajectory.lengths[trajectory.slots(instances, tlen)]
+            assert (lengths == tlen).all(), (lengths, tlen, var)
+
+        if writer is not None:
+            if timer is not None:
+                start = perf_counter()
+            writer.write(final=True)
+            writer.close()
+            if timer is not None:
+                timer.add("output", "HDF5 file", perf_counter() - start)
+
+        logger.info("...took %.3f seconds, %d time points, %d ODE solver "
+                    "calls with %d RHS evaluations",
+                    time() - _runstarttime, recorder.n_discarded + tlen,
+                    len(self.solver_statistics),
+                    sum(stats["nfev"] or 0
+                        for stats in self.solver_statistics))
+        if timer is not None:
+            timer.stop()
+            logger.info("Timing of processes:\n%s", timer.summary())
 
         return self.trajectory_dict
 
+    def write_checkpoint(self, path, run_kwargs, t):
+        """Write a checkpoint of the current run at time t.
+
+        Parameters
+        ----------
+        path : str
+            file to write to
+        run_kwargs : dict
+            the arguments run() was called with
+        t : float
+            current model time, which must be the time of the last point
+            of the trajectory and of a discontinuity or the run's start
+        """
+        logger.info("Writing checkpoint at t = %s to %s", t, path)
+        _Checkpoint.save(path, self.model, {
+            "run_kwargs": run_kwargs,
+            "t": t,
+            "recorder": self.trajectory_recorder,
+            "discontinuities": self.discontinuities,
+            "solver_statistics": self.solver_statistics,
+            "termination_calls": self.termination_calls,
+            "hdf5_writer": self._hdf5_writer and self._hdf5_writer.state()})
+
+    def resume(self, checkpoint):
+        """Continue a run from a checkpoint written during run().
+
+        The model (configured in the same way as when the checkpoint was
+        written, but possibly in a different process) loses all its current
+        instances, which are replaced by those stored in the checkpoint.
+        The Runner's termination_calls are replaced by the stored ones,
+        while Hooks are not stored and must be registered as for the
+        interrupted run. If the model does not depend on
+        the iteration order of sets of entities, the resumed run produces
+        exactly the same trajectory as an uninterrupted run.
+
+        Parameters
+        ----------
+        checkpoint : str
+            checkpoint file
+
+        Returns
+        -------
+        trajectory_dict: dict
+            Model trajectory from the interrupted run's start, see run()
+        """
+        state = _Checkpoint.load(checkpoint, self.model)
+        logger.info("Resuming run from checkpoint at t = %s", state["t"])
+        self.termination_calls = state["termination_calls"]
+        return self.run(_resume_state=state, **state["run_kwargs"])
+
     def save_to_traj(self,
                      targets,
                      add_to_output,
-                     max_resolution,
-                     dt):
+                     values=None):
         """Save simulation results to output dictionary.
 
         Update self.trajectory_dict for some targets.
@@ -683,102 +1234,37 @@ class Runner(_AbstractRunner):
             list of targets (variables or dotconstructs) to save
         add_to_output : list or None
             optional additional list
+        values : list, optional
+            list of the targets' values to use instead of reading them from
+            instance attributes
         """
+        recorder = self.trajectory_recorder
+        timer = self.timer
         if add_to_output is not None:
-            targets += add_to_output
-        # determine no. of simulated time points:
-        tlen = len(self.trajectory_dict["t"])
-        for target in targets:
+            targets = targets + add_to_output
+        for pos, target in enumerate(targets):
+            if timer is not None:
+                start = perf_counter()
             # target is a variable or a dotconstruct
             var = target.target_variable
+            trajectory = recorder[var]
             instances = target.target_class.instances
-            idle_instances = None
+            # store values from instance attributes for those instances
+            # that don't have a value at the current time point yet,
+            # new instances get invalid entries for the time that has passed:
+            trajectory.record(instances, var.eval(instances)
+                              if values is None else values[pos])
             # Check for deactivated instances. The following check is
             # necessary, since Process Taxa cannot be inactive:
             if issubclass(target.target_class,
                           _AbstractEntityMixin):
+                # fill the trajectories of idle instances with invalid
+                # entries to fit the length of 't':
                 idle_instances = target.target_class.idle_entities
-            # get values to store from instance attributes:
-            values = var.eval(instances)
-
-            # write values into all active Instances:
-            for i, inst in enumerate(instances):
-                try:
-                    # check whether value needs to be stored by comparing
-                    # existing list length with no. of time points:
-                    if len(self.trajectory_dict[var][inst]) < tlen:
-                        if isinstance(values[i], list):
-                            # when handling lists, python only add references!
-                            self.trajectory_dict[var][inst].append(values[i][:])
-                        else:
-                            self.trajectory_dict[var][inst].append(values[i])
-                    # else do nothing since value was already stored.
-                    # assert len(self.trajectory_dict[var][inst]) == tlen
-                except KeyError:
-                    # This branch is active if the entity has not been
-                    # activated before.
-                    # create new list with Nones for time that has passed:
-                    value_strip = [None] * (tlen - 1)
-                    value_strip.append(values[i])
-                    self.trajectory_dict[var][inst] = value_strip
-                    assert len(self.trajectory_dict[var][inst]) == tlen
-
-            # check if there are any idle instances and fill their trajectory
-            # with None to fit the length of 't':
-            if idle_instances:
-                for i, inst in enumerate(idle_instances):
-                    try:  # already in trajectory_dict
-                        # Check for length of list:
-                        if len(self.trajectory_dict[var][inst]) < tlen:
-                            len_of_none = (
-                                tlen - len(self.trajectory_dict[var][inst]))
-                            none_list = [None]*len_of_none
-                            # Make list as long as 't' in trajectory_dict:
-                            for j in none_list:
-                                self.trajectory_dict[var][inst].append(j)
-                            # And make sure it has the length of 't'
-                            assert len(self.trajectory_dict[var][inst]) == tlen
-                    except KeyError:  # Not yet in trajectory_dict
-                        # create new list:
-                        none_list = [None]*tlen
-                        self.trajectory_dict[var][inst] = [none_list]
-                        assert len(self.trajectory_dict[var][inst]) == tlen
-        if max_resolution:
-            print('    Reducing resolution')
-            for i, val in enumerate(self.trajectory_dict['t']):
-                # See if 3 timesteps are closer than dt:
-                if (i > 1) and i < (len(self.trajectory_dict['t']) - 10):
-                    diff = (self.trajectory_dict['t'][i + 1]
-                            - self.trajectory_dict['t'][i - 1])
-                    if diff < dt:
-                        del self.trajectory_dict['t'][i]
-                        # print(f'deleting, diff={diff}')
-                        # delete this value from all trajectories
-                        for target in targets:
-                            var = target.target_variable
-                            instances = target.target_class.instances
-                            for inst in instances:
-                                # all active entities/taxa
-                                if (len(self.trajectory_dict[var][inst])
-                                        > len(self.trajectory_dict['t'])):
-                                    del self.trajectory_dict[var][inst][i]
-                                assert len(self.trajectory_dict[var][
-                                               inst]) == len(
-                                    self.trajectory_dict['t'])
-                            if issubclass(target.target_class,
-                                          _AbstractEntityMixin):
-                                # check for inactivie entities
-                                idle_instances = target.target_class.idle_entities
-                                if idle_instances:
-                                    for inst in idle_instances:
-                                        if (len(self.trajectory_dict[var][inst])
-                                                > len(
-                                                self.trajectory_dict['t'])):
-                                            del self.trajectory_dict[var][inst][
-                                                i]
-                                        assert len(self.trajectory_dict[var][
-                                                       inst]) == len(
-                                            self.trajectory_dict['t'])
+                if idle_instances:
+                    trajectory.pad(idle_instances)
+            if timer is not None:
+                timer.add("output", var, perf_counter() - start)
 
     def terminate(self):
         """Determine if the runner should stop.
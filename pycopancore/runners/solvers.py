@@ -0,0 +1,264 @@
+"""ODE solver backends used by the Runner.
+
+Each backend integrates the composite ODE system of a model from one
+discontinuity to the next, calling an output function at each accepted
+step, and reports statistics about the integration. The backend is chosen
+by name via get_solver():
+
+- the integrators of scipy's legacy ode class ("dopri5", "dop853",
+  "vode"), and
+- the OdeSolver methods of scipy's solve_ivp ("RK23", "RK45", "DOP853",
+  "Radau", "BDF", "LSODA").
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+from scipy import integrate
+from scipy.integrate._ivp.rk import RungeKutta
+
+
+class _SolverBackend(object):
+    """Abstract class of ODE solver backends."""
+
+    name = None
+    """name of the integration method"""
+    options = None
+    """dict of options passed to the scipy integrator"""
+    supports_jac_sparsity = False
+    """whether integrate() makes use of a Jacobian sparsity pattern"""
+    supports_jac = False
+    """whether integrate() makes use of a Jacobian function"""
+
+    def __init__(self, rhs, name, **options):
+        """Instantiate a solver backend.
+
+        Parameters
+        ----------
+        rhs : callable
+            function(t, value_array) returning the array of derivatives
+        name : str
+            name of the integration method
+        options
+            options passed to the scipy integrator, those with value None
+            are left at scipy's defaults
+        """
+        self.rhs = rhs
+        self.name = name
+        self.options = {key: value for key, value in options.items()
+                        if value is not None}
+
+    def integrate(self, t0, y0, t1, output, jac_sparsity=None, jac=None,
+                  output_times=None):
+        """Integrate from t0 to t1.
+
+        Parameters
+        ----------
+        t0 : float
+            initial time
+        y0 : array
+            initial value array
+        t1 : float
+            final time
+        output : callable
+            function(t, value_array) called at t0 and after each accepted
+            step, ending at t1 (or only at t0, output_times and t1)
+        jac_sparsity : sparse matrix, optional
+            sparsity pattern of the Jacobian, used if supports_jac_sparsity
+            is True
+        jac : callable, optional
+            function(t, value_array) returning the Jacobian of the RHS as a
+            sparse matrix, used instead of finite differences if
+            supports_jac is True
+        output_times : array, optional
+            sorted times strictly between t0 and t1. If given, the solver
+            steps as its error control allows and output is only called
+            at these times (using interpolation) and at t0 and t1
+
+        Returns
+        -------
+        dict
+            statistics with keys "n_steps" (accepted steps), "nfev" (RHS
+            evaluations), "njev" (Jacobian evaluations), "nlu" (LU
+            decompositions) and "n_rejected" (rejected steps), each None if
+            not provided by the integrator, and "success" (whether t1 was
+            reached without failure)
+        """
+        raise NotImplementedError
+
+
+class ScipyODESolver(_SolverBackend):
+    """Integrators of scipy.integrate.ode."""
+
+    methods = ("dopri5", "dop853", "vode")
+    # (the ode class' "lsoda" is not offered since its one-step mode does
+    # not return after single steps, use solve_ivp's "LSODA" instead)
+
+    def __init__(self, rhs, name, **options):
+        super().__init__(rhs, name, **options)
+        self.solver = integrate.ode(rhs)
+        self.solver.set_integrator(name, **self.options)
+        self._output = None
+        self._dense_solver = None
+        if name in ("dopri5", "dop853"):
+            self.solver.set_solout(self._solout)
+
+    def _solout(self, t, y):
+        self._output(t, y)
+
+    def integrate(self, t0, y0, t1, output, jac_sparsity=None, jac=None,
+                  output_times=None):
+        if output_times is not None and self.name in ("dopri5", "dop853"):
+            # these codes have no accessible dense output, but implement
+            # the same Dormand-Prince methods as solve_ivp's RK45 and
+            # DOP853 which do, so use those with the same default tolerances:
+            if self._dense_solver is None:
+                options = {key: value for key, value in self.options.items()
+                           if key in ("rtol", "atol", "first_step",
+                                      "max_step")}
+                options.setdefault("rtol", 1e-6)
+                options.setdefault("atol", 1e-12)
+                self._dense_solver = ScipyIVPSolver(
+                    self.rhs, "RK45" if self.name == "dopri5" else "DOP853",
+                    **options)
+            return self._dense_solver.integrate(t0, y0, t1, output,
+                                                output_times=output_times)
+        solver = self.solver
+        solver.set_initial_value(y0, t0)
+        if output_times is not None:
+            # integrate to each output time in turn, vode interpolates there:
+            output(t0, y0)
+            for t in list(output_times) + [t1]:
+                y = solver.integrate(t)
+                if not solver.successful():
+                    break
+                output(t, y)
+        elif self.name in ("dopri5", "dop853"):
+            # the integrator calls solout at t0 and at each accepted step:
+            self._output = output
+            solver.integrate(t1)
+            self._output = None
+        else:
+            output(t0, y0)
+            while solver.successful() and solver.t < t1:
+                y = solver.integrate(t1, step=True)
+                if solver.t > t1:
+                    # the step went beyond t1, so interpolate back:
+                    y = solver.integrate(t1)
+                output(solver.t, y)
+        success = bool(solver.successful())
+        # statistics are contained in the integrator's work array,
+        # see the documentation of the respective Fortran codes:
+        iwork = solver._integrator.iwork
+        if self.name in ("dopri5", "dop853"):
+            return {"n_steps": int(iwork[18]), "nfev": int(iwork[16]),
+                    "njev": 0, "nlu": 0, "n_rejected": int(iwork[19]),
+                    "success": success}
+        else:
+            return {"n_steps": int(iwork[10]), "nfev": int(iwork[11]),
+                    "njev": int(iwork[12]), "nlu": int(iwork[18]),
+                    "n_rejected": int(iwork[20] + iwork[21]),
+                    "success": success}
+
+
+class ScipyIVPSolver(_SolverBackend):
+    """OdeSolver classes used by scipy.integrate.solve_ivp."""
+
+    methods = ("RK23", "RK45", "DOP853", "Radau", "BDF", "LSODA")
+
+    def __init__(self, rhs, name, **options):
+        super().__init__(rhs, name, **options)
+        # only the implicit methods estimate Jacobians by finite
+        # differences grouped according to a sparsity pattern:
+        self.supports_jac_sparsity = name in ("Radau", "BDF") \
+            and "jac" not in self.options
+        self.supports_jac = name in ("Radau", "BDF", "LSODA") \
+            and "jac" not in self.options
+
+    def integrate(self, t0, y0, t1, output, jac_sparsity=None, jac=None,
+                  output_times=None):
+        t0, t1 = float(t0), float(t1)
+        options = self.options
+        if jac is not None and self.supports_jac:
+            if self.name == "LSODA":
+                # LSODA only accepts dense Jacobians:
+                options = dict(options,
+                               jac=lambda t, y: jac(t, y).toarray())
+            else:
+                options = dict(options, jac=jac)
+        elif jac_sparsity is not None and self.supports_jac_sparsity:
+            options = dict(options, jac_sparsity=jac_sparsity)
+        # count all RHS evaluations, including those used for estimating
+        # Jacobians which the solver's nfev does not include:
+        nfev = [0]
+
+        def rhs(t, y):
+            nfev[0] += 1
+            return self.rhs(t, y)
+
+        solver = getattr(integrate, self.name)(rhs, t0, y0, t1, **options)
+        # the initial step size selection may already evaluate the rhs:
+        nfev0 = solver.nfev
+        output(t0, y0)
+        n_steps = 0
+        n_dense = 0  # rhs evaluations spent on dense output
+        pos = 0  # position of next output time
+        while solver.status == "running":
+            solver.step()
+            if solver.status == "failed":
+                break
+            n_steps += 1
+            if output_times is not None and pos < len(output_times) \
+                    and output_times[pos] <= solver.t:
+                # interpolate at the output times passed in this step:
+                # (some methods, e.g. DOP853, evaluate the rhs for this):
+                nfev_before = solver.nfev
+                interpolant = solver.dense_output()
+                n_dense += solver.nfev - nfev_before
+                while pos < len(output_times) \
+                        and output_times[pos] <= solver.t:
+                    output(output_times[pos], interpolant(output_times[pos]))
+                    pos += 1
+            if output_times is None or solver.status == "finished":
+                output(solver.t, solver.y)
+        if isinstance(solver, RungeKutta):
+            # each attempted step costs n_stages evaluations:
+            n_rejected = ((solver.nfev - nfev0 - n_dense) // solver.n_stages
+                          - n_steps)
+        else:
+            n_rejected = None
+        return {"n_steps": n_steps, "nfev": nfev[0],
+                "njev": solver.njev, "nlu": solver.nlu,
+                "n_rejected": n_rejected,
+                "success": solver.status == "finished"}
+
+
+def get_solver(rhs, name, **options):
+    """Return a solver backend for the given integration method.
+
+    Parameters
+    ----------
+    rhs : callable
+        function(t, value_array) returning the array of derivatives
+    name : str
+        one of ScipyODESolver.methods or ScipyIVPSolver.methods
+    options
+        options passed to the scipy integrator, e.g. rtol, atol,
+        first_step, max_step, nsteps (legacy integrators only)
+
+    Returns
+    -------
+    _SolverBackend
+    """
+    if name in ScipyODESolver.methods:
+        return ScipyODESolver(rhs, name, **options)
+    elif name in ScipyIVPSolver.methods:
+        return ScipyIVPSolver(rhs, name, **options)
+    raise ValueError("unknown ODE solver " + str(name) + ", choose one of "
+                     + str(ScipyODESolver.methods + ScipyIVPSolver.methods))
@@ -0,0 +1,273 @@
+"""Sweep class.
+
+Runs a model for many parameter combinations in a pool of worker processes.
+Each task builds a fresh model via a user-supplied factory function, seeds
+the random number generators with a seed derived deterministically from the
+sweep's seed and the task's index (so that results do not depend on which
+worker runs which task), runs it with a Runner, and returns selected
+trajectories as numpy arrays.
+
+Since composed model classes hold global state (their lists of instances),
+each worker resets the instances of the previously run model before
+building the next one. A task that raises an exception is reported as
+failed without affecting the other tasks. If a worker process dies (e.g.
+when killed for lack of memory), the tasks it took down with the pool are
+run again in a fresh pool, and those affected again are run one at a time
+to identify the ones that kill their worker. If a directory is given, the
+results of finished tasks are stored there, so that an interrupted sweep
+can be resumed by running it again, which only runs the missing or failed
+tasks.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+from ..util.seeding import set_seed
+from .runner import Runner
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from itertools import product
+import logging
+import os
+import traceback
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def parameter_grid(**values):
+    """Return the list of all combinations of parameter values.
+
+    Parameters
+    ----------
+    values
+        for each parameter name, a list of values
+
+    Returns
+    -------
+    list
+        list of dicts mapping parameter names to values
+
+    Example
+    -------
+    >>> parameter_grid(a=[1, 2], b=[0.5])
+    [{'a': 1, 'b': 0.5}, {'a': 2, 'b': 0.5}]
+    """
+    names = list(values.keys())
+    return [dict(zip(names, combination))
+            for combination in product(*(values[name] for name in names))]
+
+
+def task_seed(seed, index):
+    """Return the seed for the task with the given index, derived from the
+    sweep's seed via numpy's SeedSequence so that the tasks' random
+    streams are independent."""
+    return int(np.random.SeedSequence(seed, spawn_key=(index,))
+               .generate_state(1)[0])
+
+
+def trajectory_arrays(runner):
+    """Return the default output of a task: an array of time points and,
+    for each Variable with float values, an array of values (time points
+    x instances, nan where invalid), keyed by "EntityType.codename"."""
+    recorder = runner.trajectory_recorder
+    arrays = {"t": np.array(recorder.times)}
+    for var, trajectory in recorder.variables.items():
+        if trajectory.instances:
+            values = trajectory.values()
+            if values.dtype != object:
+                arrays[var.owning_class.__name__ + "." + var.codename] = \
+                    values
+    return arrays
+
+
+class Sweep(object):
+    """Parameter sweep running one task per parameter combination."""
+
+    parameters = None
+    """list of parameter combinations, one for each task"""
+    results = None
+    """list of the tasks' outputs (dicts of arrays), None for failed or
+    missing tasks"""
+    errors = None
+    """dict mapping the indices of failed tasks to their tracebacks"""
+
+    def __init__(self,
+                 build_model,
+                 parameters,
+                 *,
+                 seed=0,
+                 run_kwargs=None,
+                 outputs=trajectory_arrays,
+                 directory=None
+                 ):
+        """Instantiate a Sweep.
+
+        Parameters
+        ----------
+        build_model : callable
+            function(parameters) returning a model with all its entities
+            and process taxa instantiated. It must be picklable (e.g.
+            defined at module level) to be sent to worker processes.
+        parameters : list
+            one parameter combination (e.g. a dict, see parameter_grid)
+            for each task
+        seed : int, optional
+            seed from which the tasks' seeds are derived (default: 0)
+        run_kwargs : dict, optional
+            keyword arguments for Runner.run
+        outputs : callable, optional
+            picklable function(runner) returning a task's output as a dict
+            of numpy arrays after the run (default: trajectory_arrays)
+        directory : str, optional
+            directory to store the outputs of finished tasks in, and to
+            load them from when running the sweep again
+        """
+        self.build_model = build_model
+        self.parameters = list(parameters)
+        self.seed = seed
+        self.run_kwargs = run_kwargs or {}
+        self.outputs = outputs
+        self.directory = directory
+        self.results = [None] * len(self.parameters)
+        self.errors = {}
+
+    def _path(self, index):
+        return os.path.join(self.directory, "task_%06d.npz" % index)
+
+    def _signature(self, index):
+        """Return a string identifying the task, stored with its output."""
+        return repr((self.parameters[index], task_seed(self.seed, index)))
+
+    def _load(self, index):
+        """Return the stored output of the task, or None."""
+        try:
+            with np.load(self._path(index)) as data:
+                if str(data["__task__"]) != self._signature(index):
+                    return None
+                return {name: data[name] for name in data.files
+                        if name != "__task__"}
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _store(self, index, arrays):
+        """Store the task's output atomically."""
+        path = self._path(index)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, __task__=self._signature(index), **arrays)
+        os.replace(path + ".tmp", path)
+
+    def run(self, workers=None):
+        """Run all tasks that have no stored output yet.
+
+        Parameters
+        ----------
+        workers : int, optional
+            number of worker processes (default: number of CPUs). If 0,
+            the tasks are run in the current process one after another.
+
+        Returns
+        -------
+        list
+            the tasks' outputs, see results
+        """
+        pending = []
+        for index in range(len(self.parameters)):
+            if self.directory is not None:
+                self.results[index] = self._load(index)
+            if self.results[index] is None:
+                pending.append(index)
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+        logger.info("Sweep: running %d of %d tasks",
+                    len(pending), len(self.parameters))
+        self.errors = {}
+        args = {index: (self.build_model, self.parameters[index],
+                        task_seed(self.seed, index), self.run_kwargs,
+                        self.outputs)
+                for index in pending}
+        if workers == 0:
+            for index in pending:
+                self._finish(index, _run_task(*args[index]))
+        else:
+            broken = self._run_pool(pending, args, workers)
+            if broken:
+                logger.warning("Sweep: a worker process died, running %d "
+                               "affected tasks again", len(broken))
+                broken = self._run_pool(broken, args, workers)
+            for index in broken:
+                if self._run_pool([index], args, 1):
+                    self._finish(index, (None, "worker process died while "
+                                         "running the task (e.g. killed "
+                                         "for lack of memory)"))
+        if self.errors:
+            logger.warning("Sweep: %d tasks failed", len(self.errors))
+        return self.results
+
+    def _run_pool(self, indices, args, workers):
+        """Run the given tasks in a fresh pool of worker processes and
+        return the list of those that did not finish because the pool
+        broke."""
+        broken = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_run_task, *args[index]): index
+                       for index in indices}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    broken.append(index)
+                    continue
+                except Exception:
+                    # e.g. the output could not be sent back:
+                    result = None, traceback.format_exc()
+                self._finish(index, result)
+        return sorted(broken)
+
+    def _finish(self, index, result):
+        """Register the result of a task."""
+        arrays, error = result
+        if error is not None:
+            self.errors[index] = error
+            logger.warning("Sweep: task %d failed:\n%s", index, error)
+            return
+        self.results[index] = arrays
+        if self.directory is not None:
+            self._store(index, arrays)
+        logger.info("Sweep: task %d finished", index)
+
+
+_last_model = None
+"""model built by the previous task run in this process"""
+
+
+def _reset_instances(model):
+    """Forget all instances of the model's entity types and process taxa."""
+    for composed_class in model.entity_types + model.process_taxa:
+        composed_class.instances = []
+        composed_class.idle_entities = []
+        composed_class._instances_changed()
+
+
+def _run_task(build_model, parameters, seed, run_kwargs, outputs):
+    """Run one task and return its output and None, or None and the
+    traceback of the exception it raised."""
+    global _last_model
+    try:
+        if _last_model is not None:
+            _reset_instances(_last_model)
+        set_seed(seed)
+        model = _last_model = build_model(parameters)
+        runner = Runner(model)
+        runner.run(**run_kwargs)
+        return outputs(runner), None
+    except Exception:
+        return None, traceback.format_exc()
@@ -1,2 +1,3 @@
 from .functions import *
-from .seeding import *
\ No newline at end of file
+from .seeding import *
+from .verbosity import *
@@ -0,0 +1,86 @@
+"""Verbosity of pycopancore's console output.
+
+Model configuration and runs report their progress via the standard logging
+module, using loggers below the "pycopancore" logger:
+
+- WARNING: problems such as failing ODE solvers,
+- INFO: summaries of the model configuration and of each integration
+  interval,
+- DEBUG: details such as all Variables and processes of a model and every
+  single occurrence of an Event or Step.
+
+By default, messages of level INFO and above are printed to the current
+sys.stdout by a handler attached to the "pycopancore" logger (available as
+pycopancore.util.verbosity.logger). Messages also propagate to the root
+logger, so once the application configures logging itself (i.e., the root
+logger has handlers), they are handled by the application's handlers
+instead and no longer printed by pycopancore. Progress of the ODE solver
+within an interval is reported at level INFO at most every
+progress_interval seconds.
+"""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import logging
+import sys
+
+__all__ = ["set_verbosity"]
+
+logger = logging.getLogger("pycopancore")
+
+progress_interval = 10.0
+"""minimum wall-clock time in seconds between two progress messages of
+the ODE solver"""
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Handler printing messages to the current sys.stdout (rather than the
+    one at import time) unless the root logger has handlers."""
+
+    def __init__(self, level=logging.NOTSET):
+        logging.Handler.__init__(self, level)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    def emit(self, record):
+        if not logging.getLogger().handlers:
+            super().emit(record)
+
+
+_handler = _StdoutHandler()
+_handler.setFormatter(logging.Formatter("%(message)s"))
+logger.addHandler(_handler)
+logger.setLevel(logging.INFO)
+
+_levels = {"debug": logging.DEBUG, "info": logging.INFO,
+           "warning": logging.WARNING, "error": logging.ERROR,
+           "quiet": logging.CRITICAL + 1}
+
+
+def set_verbosity(level, interval=None):
+    """Set the level of pycopancore's console output.
+
+    Parameters
+    ----------
+    level : int or str
+        a logging level or one of "debug", "info", "warning", "error",
+        "quiet"
+    interval : float, optional
+        minimum wall-clock time in seconds between two progress messages
+        of the ODE solver (see progress_interval)
+    """
+    global progress_interval
+    if isinstance(level, str):
+        level = _levels[level.lower()]
+    logger.setLevel(level)
+    if interval is not None:
+        progress_interval = interval
@@ -37,5 +37,9 @@ setup(name="pycopancore",
           "pylama_pylint",
           "numba",
       ],
+      extras_require={
+          "hdf5": ["h5py"],  # for saving trajectories as HDF5
+          "xarray": ["xarray"],  # for exporting trajectories to xarray
+      },
       zip_safe=False # see http://stackoverflow.com/questions/15869473/what-is-the-advantage-of-setting-zip-safe-to-true-when-packaging-a-python-projec
       )
@@ -6,3 +6,22 @@
 # URL: <http://www.pik-potsdam.de/copan/software>
 # Contact: core@pik-potsdam.de
 # License: BSD 2-clause license
+
+import os
+import subprocess
+import sys
+
+
+def run_in_fresh_process(module, function, *args):
+    """Call a function of a test module with the given (literal) arguments
+    in a fresh Python process.
+
+    Since Variables are bound to the first model configured in a process,
+    tests that configure a model run this way so that they do not interfere
+    with each other.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c",
+                    "import {0}; {0}.{1}(*{2!r})".format(module, function,
+                                                         args)],
+                   cwd=root, check=True)
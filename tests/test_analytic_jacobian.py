@@ -0,0 +1,42 @@
+"""Test file for the analytic Jacobian of symbolic specifications."""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import numpy as np
+
+import pycopancore.models.coccon.carboncycle as M
+from pycopancore.runners import Runner
+
+from . import run_in_fresh_process
+from .test_jac_sparsity import (finite_difference_jacobian, make_population,
+                                value_array)
+
+
+def check_jacobian_matches_finite_differences():
+    """Check the analytic Jacobian against forward differences."""
+    model = M.Model(analytic_jacobian=True)
+    assert model.analytic_jacobian
+    make_population()
+    runner = Runner(model=model)
+    # a short run determines the layout of the value array:
+    runner.run(t_0=2000, t_1=2001, dt=1, solver="BDF")
+    y = value_array(runner)
+
+    jac = runner.get_jacobian(2001, y).toarray()
+    fd_jac = finite_difference_jacobian(runner, 2001, y)
+    scale = np.abs(fd_jac).max()
+    assert scale > 0
+    assert np.allclose(jac, fd_jac, rtol=1e-4, atol=1e-6 * scale)
+
+
+def test_jacobian_matches_finite_differences():
+    """The analytic Jacobian agrees with forward differences."""
+    run_in_fresh_process(__name__,
+                         "check_jacobian_matches_finite_differences")
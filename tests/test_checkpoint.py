@@ -0,0 +1,90 @@
+"""Test file for resuming runs from checkpoints."""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import glob
+import os
+import shutil
+
+import numpy as np
+
+import pycopancore as pcc
+import pycopancore.models.seven_dwarfs as M
+from pycopancore.runners import Runner
+
+from . import run_in_fresh_process
+
+
+def trajectory_arrays(traj):
+    """Return the time points and some Variables' values as arrays keyed by
+    Variable and entity UID (since entities differ between processes)."""
+    arrays = {"t": np.array(traj['t'])}
+    for var in (M.Individual.age, M.Individual.beard_length,
+                M.Cell.eating_stock):
+        for inst, values in traj[var].items():
+            arrays["%s_%d" % (var.codename, inst._uid)] = np.array(
+                [np.nan if v is None else v for v in values], dtype=float)
+    return arrays
+
+
+def run_uninterrupted(directory):
+    """Run the seven dwarfs model, keeping a copy of every checkpoint
+    written, and store the trajectory."""
+    pcc.set_seed(3)
+    model = M.Model()
+    culture = M.Culture()
+    world = M.World(culture=culture)
+    social_system = M.SocialSystem(world=world)
+    cell = M.Cell(social_system=social_system, eating_stock=100)
+    for i in range(7):
+        M.Individual(cell=cell, age=0, beard_length=0,
+                     beard_growth_parameter=0.5, eating_parameter=.1)
+    runner = Runner(model=model, termination_calls=[
+        [M.Culture.check_for_extinction, culture]])
+    write_checkpoint = runner.write_checkpoint
+    copies = []
+
+    def write_and_copy(path, run_kwargs, t):
+        write_checkpoint(path, run_kwargs, t)
+        copies.append(t)
+        shutil.copy(path, "%s.%03d" % (path, len(copies)))
+
+    runner.write_checkpoint = write_and_copy
+    traj = runner.run(t_1=10, dt=.1,
+                      checkpoint_file=os.path.join(directory, "checkpoint"),
+                      checkpoint_interval=0)
+    assert len(copies) > 2
+    np.savez(os.path.join(directory, "uninterrupted.npz"),
+             **trajectory_arrays(traj))
+
+
+def run_resumed(directory):
+    """Resume the run from a checkpoint in the middle and store the
+    trajectory."""
+    model = M.Model()
+    runner = Runner(model=model)
+    checkpoints = sorted(glob.glob(os.path.join(directory, "checkpoint.*")))
+    traj = runner.resume(checkpoints[len(checkpoints) // 2])
+    np.savez(os.path.join(directory, "resumed.npz"),
+             **trajectory_arrays(traj))
+
+
+def test_resume_reproduces_uninterrupted_run(tmp_path):
+    """A run resumed in a fresh process from a checkpoint written in the
+    middle of a run gives the same trajectory as the uninterrupted run."""
+    run_in_fresh_process(__name__, "run_uninterrupted", str(tmp_path))
+    run_in_fresh_process(__name__, "run_resumed", str(tmp_path))
+    with np.load(str(tmp_path / "uninterrupted.npz")) as expected, \
+            np.load(str(tmp_path / "resumed.npz")) as actual:
+        assert sorted(expected.files) == sorted(actual.files)
+        assert len(expected["t"]) > 10
+        for name in expected.files:
+            np.testing.assert_array_equal(actual[name], expected[name],
+                                          err_msg=name)
@@ -0,0 +1,91 @@
+"""Test file for the columnar storage of Variable values."""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+from types import SimpleNamespace
+
+import pycopancore.models.seven_dwarfs as M
+
+from . import run_in_fresh_process
+
+
+def check_rows_of_deleted_instances_are_reused():
+    """Check that deleting and recreating dwarfs reuses their rows without
+    leaking values."""
+    M.Model(columnar=True)
+    world = M.World(culture=M.Culture())
+    cell = M.Cell(social_system=M.SocialSystem(world=world))
+    dwarfs = [M.Individual(cell=cell, age=i, beard_length=i + .5,
+                           beard_growth_parameter=.5, eating_parameter=.1)
+              for i in range(4)]
+    store = M.Individual._columnar_store
+    rows = [d._columnar_row for d in dwarfs]
+    n_rows = store.n_rows
+    # (ints such as age are boxed, floats such as beard_length are not)
+    assert store.boxed["age"]
+
+    for d in dwarfs[1:3]:
+        d.delete()
+    freed = rows[1:3]
+    assert sorted(store.free_rows) == sorted(freed)
+    for row in freed:
+        for cn in store.codenames:
+            assert not store.is_set[cn][row]
+            assert store.values[cn][row] == 0
+            assert row not in store.boxed[cn]
+    # remaining instances keep their values:
+    assert dwarfs[0].beard_length == .5 and dwarfs[3].beard_length == 3.5
+    assert dwarfs[0].age == 0 and dwarfs[3].age == 3
+
+    new = [M.Individual(cell=cell, age=10 + i, beard_length=20. + i,
+                        beard_growth_parameter=.5, eating_parameter=.1)
+           for i in range(2)]
+    assert sorted(d._columnar_row for d in new) == sorted(freed)
+    assert store.n_rows == n_rows
+    assert not store.free_rows
+    assert [d.age for d in new] == [10, 11]
+    assert [d.beard_length for d in new] == [20., 21.]
+    # whole-column reads see the new values only:
+    values = M.Individual.beard_length.eval(M.Individual.instances)
+    assert sorted(values) == [.5, 3.5, 20., 21.]
+
+
+def check_heterogeneous_instances_fall_back():
+    """Check that instances of several classes are not read from one
+    store's columns."""
+    M.Model(columnar=True)
+    world = M.World(culture=M.Culture())
+    cell = M.Cell(social_system=M.SocialSystem(world=world),
+                  eating_stock=100.)
+    dwarf = M.Individual(cell=cell, age=1, beard_length=2.,
+                         beard_growth_parameter=.5, eating_parameter=.1)
+    store = M.Individual._columnar_store
+    assert store.rows_of([dwarf]) is not None
+    assert store.rows_of([dwarf, cell]) is None
+    # a path reaching instances of different classes is read per instance
+    # rather than from the rows of the first one's store (here the other
+    # object pretends to occupy the same row in some other store):
+    other = SimpleNamespace(cell=SimpleNamespace(eating_stock=5.,
+                                                 _columnar_row=0))
+    assert cell._columnar_row == 0
+    assert list(M.Individual.cell.eating_stock.eval([dwarf])) == [100.]
+    assert list(M.Individual.cell.eating_stock.eval([dwarf, other])) \
+        == [100., 5.]
+
+
+def test_rows_of_deleted_instances_are_reused():
+    """Rows of deleted instances are cleared and reused."""
+    run_in_fresh_process(__name__,
+                         "check_rows_of_deleted_instances_are_reused")
+
+
+def test_heterogeneous_instances_fall_back():
+    """Heterogeneous instances take the per-instance path."""
+    run_in_fresh_process(__name__, "check_heterogeneous_instances_fall_back")
@@ -0,0 +1,115 @@
+"""Test file for the compilation of symbolic specifications."""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import importlib
+
+import numpy as np
+import sympy as sp
+
+from pycopancore import ITE, set_seed
+from pycopancore.private import _expressions
+from pycopancore.runners import Runner
+
+from benchmarks import scaling
+
+from . import run_in_fresh_process
+
+
+def assert_compiled_equals_eval(expressions):
+    """Assert that each compiled expression gives the same values as the
+    tree-walking evaluation of the original expression."""
+    for expr, compiled in expressions:
+        assert compiled.instructions is not None, expr
+        expected = np.asarray(_expressions.eval(expr), dtype=float)
+        actual = np.asarray(compiled.eval(), dtype=float)
+        assert actual.shape == expected.shape, expr
+        np.testing.assert_allclose(actual, expected, rtol=1e-12,
+                                   equal_nan=True, err_msg=str(expr))
+
+
+def check_specifications(model_name):
+    """Compare the compiled and tree-walking evaluation of a bundled
+    model's specifications and of some additional expressions, before and
+    after instances are added and removed."""
+    module_name, builder = scaling.models[model_name]
+    M = importlib.import_module(module_name)
+    model = M.Model()
+    set_seed(0)
+    spec = builder(M, 20)
+    run_kwargs = dict(spec["run"])
+    run_kwargs["t_1"] = run_kwargs["t_0"] + 1
+    runner = Runner(model=model, **spec["runner"])
+    runner.run(**run_kwargs)
+
+    expressions = [(expr, compiled)
+                   for p in list(model.ODE_processes)
+                   + list(model.explicit_processes)
+                   if isinstance(p.specification, list)
+                   for expr, compiled in zip(p.specification,
+                                             p.compiled_specification)]
+    # aggregations, Piecewise, ITE and Pow with broadcasting:
+    Cell = M.Cell
+    extra = [
+        Cell.world.sum.cells.land_area / Cell.land_area,
+        sp.Piecewise(
+            (Cell.land_area, Cell.land_area
+             > Cell.social_system.mean.cells.land_area),
+            (Cell.social_system.sum.cells.land_area ** 2, True)),
+        ITE(Cell.land_area > Cell.world.mean.cells.land_area,
+            Cell.land_area ** .5, -Cell.world.sum.cells.land_area),
+        # (a boolean sympy ITE:)
+        sp.Piecewise(
+            (Cell.land_area,
+             sp.ITE(Cell.land_area > Cell.world.mean.cells.land_area,
+                    Cell.land_area > 2 * Cell.world.mean.cells.land_area,
+                    Cell.land_area
+                    < Cell.social_system.mean.cells.land_area)),
+            (-Cell.land_area, True)),
+        Cell.land_area ** 2 + Cell.land_area ** -1
+        + (Cell.land_area / Cell.world.mean.cells.land_area)
+        ** (Cell.land_area / Cell.world.sum.cells.land_area),
+    ]
+    expressions += [(expr, _expressions.compile_expression(expr))
+                    for expr in extra]
+    assert_compiled_equals_eval(expressions)
+
+    # add an instance, so that cached broadcasting indices must be renewed:
+    template = Cell.instances[0]
+    cell = Cell(social_system=template.social_system,
+                land_area=2 * template.land_area)
+    for var in Cell.variables:
+        value = getattr(template, var.codename, None)
+        if var.codename != "land_area" and isinstance(value, float):
+            setattr(cell, var.codename, value)
+    runner._current_iteration += 1
+    runner.apply_explicits(run_kwargs["t_1"])
+    assert_compiled_equals_eval(expressions)
+
+    # and remove it again:
+    cell.deactivate()
+    runner._current_iteration += 1
+    runner.apply_explicits(run_kwargs["t_1"])
+    assert_compiled_equals_eval(expressions)
+
+
+def test_example1():
+    """Compiled specifications of example1 agree with _eval."""
+    run_in_fresh_process(__name__, "check_specifications", "example1")
+
+
+def test_example2():
+    """Compiled specifications of example2 agree with _eval."""
+    run_in_fresh_process(__name__, "check_specifications", "example2")
+
+
+def test_coccon():
+    """Compiled specifications of the CoCCoN model agree with _eval."""
+    run_in_fresh_process(__name__, "check_specifications", "coccon")
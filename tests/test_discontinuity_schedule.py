@@ -0,0 +1,63 @@
+"""Test file for the schedule of Step and Event discontinuities."""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import pickle
+
+from pycopancore.private import _DiscontinuitySchedule
+
+
+def test_ordering():
+    """Occurrences come out by time, co-occurring ones in the order they
+    were scheduled."""
+    schedule = _DiscontinuitySchedule()
+    schedule.schedule(2.0, "b", 1)
+    schedule.schedule(1.0, "a", 1)
+    schedule.schedule(2.0, "a", 2)
+    schedule.schedule(3.0, "c", 1)
+    schedule.schedule(2.0, "c", 2)
+    assert len(schedule) == 5
+    assert schedule.next_time() == 1.0
+    assert schedule.pop(1.0) == [("a", 1)]
+    assert schedule.next_time() == 2.0
+    assert schedule.pop(2.0) == [("b", 1), ("a", 2), ("c", 2)]
+    assert schedule.pop(3.0) == [("c", 1)]
+    assert schedule.next_time() is None
+    assert len(schedule) == 0
+
+
+def test_cancel_and_reschedule():
+    """Cancelled occurrences are skipped, rescheduling replaces all pending
+    occurrences of a process at an instance."""
+    schedule = _DiscontinuitySchedule()
+    schedule.schedule(1.0, "a", 1)
+    schedule.schedule(1.5, "a", 1)
+    schedule.schedule(2.0, "b", 1)
+    assert schedule.cancel("a", 1)
+    assert not schedule.cancel("a", 1)
+    assert len(schedule) == 1
+    assert schedule.next_time() == 2.0
+    schedule.reschedule(4.0, "b", 1)
+    schedule.schedule(3.0, "a", 2)
+    assert len(schedule) == 2
+    assert schedule.pop(3.5) == [("a", 2)]
+    assert schedule.next_time() == 4.0
+    assert schedule.pop(4.0) == [("b", 1)]
+    assert len(schedule) == 0
+
+
+def test_pickle():
+    """A pickled schedule continues the tie breaking order."""
+    schedule = _DiscontinuitySchedule()
+    schedule.schedule(1.0, "a", 1)
+    schedule.schedule(1.0, "b", 1)
+    schedule = pickle.loads(pickle.dumps(schedule))
+    schedule.schedule(1.0, "c", 1)
+    assert schedule.pop(1.0) == [("a", 1), ("b", 1), ("c", 1)]
@@ -0,0 +1,173 @@
+"""Test file for the evaluation levels of Explicit processes."""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import logging
+
+import pytest
+
+from pycopancore import Explicit, Variable
+from pycopancore.model_components import base
+from pycopancore.model_components.base.model_logics import ConfigureError
+
+from . import run_in_fresh_process
+
+
+def make_model(make_processes):
+    """Return a Model whose Cells have the float Variables alpha, beta,
+    gamma and delta and the processes returned by
+    make_processes(CellInterface)."""
+
+    class ModelInterface(object):
+        name = "levels"
+        description = "Explicit processes on Cell"
+        requires = []
+
+    class CellInterface(object):
+        alpha = Variable("alpha", "alpha", default=1.0)
+        beta = Variable("beta", "beta", default=1.0)
+        gamma = Variable("gamma", "gamma", default=1.0)
+        delta = Variable("delta", "delta", default=1.0)
+
+    class CellMixin(CellInterface):
+        processes = make_processes(CellInterface)
+
+    class ModelMixin(ModelInterface):
+        entity_types = [CellMixin]
+        process_taxa = []
+
+    class Cell(CellMixin, base.Cell):
+        pass
+
+    class Model(ModelMixin, base.Model):
+        name = "levels"
+        description = "base component with Explicit processes on Cell"
+        entity_types = [base.World, base.SocialSystem, Cell,
+                        base.Individual]
+        process_taxa = [base.Environment, base.Metabolism, base.Culture]
+
+    return Model
+
+
+def levels_of(Model):
+    """Return a dict mapping the names of the processes on Cell (rather
+    than those of the base component) to their levels."""
+    cell_processes = set(Model.entity_types[2].processes)
+    return {p.name: i
+            for i, level in enumerate(Model.explicit_process_levels)
+            for p in level if p in cell_processes}
+
+
+def check_levels():
+    """Check the levels of symbolic and declared dependency chains."""
+    def make_processes(I):
+        def set_delta(self, unused_t):
+            pass
+        return [
+            Explicit("beta", [I.beta], [2 * I.alpha]),
+            Explicit("gamma", [I.gamma], [I.beta + 1]),
+            # (declared, so the source code is not searched for beta:)
+            Explicit("delta", [I.delta], set_delta,
+                     dependencies=[I.gamma]),
+        ]
+    Model = make_model(make_processes)
+    Model.configure()
+    assert levels_of(Model) == {"beta": 0, "gamma": 1, "delta": 2}
+    assert [p.name for p in Model.explicit_processes
+            if p.name in ("beta", "gamma", "delta")] == [
+        "beta", "gamma", "delta"]
+    assert Model.explicit_processes_ordered
+    assert not Model.guessed_dependencies
+
+
+def check_independent_processes_share_a_level():
+    """Check that processes without mutual dependencies share a level."""
+    def make_processes(I):
+        return [
+            Explicit("gamma", [I.gamma], [I.beta * I.delta]),
+            Explicit("beta", [I.beta], [I.alpha ** 2]),
+            Explicit("delta", [I.delta], [-I.alpha]),
+        ]
+    Model = make_model(make_processes)
+    Model.configure()
+    assert levels_of(Model) == {"beta": 0, "delta": 0, "gamma": 1}
+
+
+def check_declared_cycle_raises():
+    """Check that a cycle of declared dependencies is an error."""
+    def make_processes(I):
+        def set_beta(self, unused_t):
+            pass
+
+        def set_gamma(self, unused_t):
+            pass
+        return [
+            Explicit("beta", [I.beta], set_beta, dependencies=[I.gamma]),
+            Explicit("gamma", [I.gamma], set_gamma, dependencies=[I.delta]),
+            Explicit("delta", [I.delta], [I.beta + I.alpha]),
+        ]
+    Model = make_model(make_processes)
+    with pytest.raises(ConfigureError, match="cyclic dependencies"):
+        Model.configure()
+
+
+def check_guessed_cycle_warns():
+    """Check that a cycle closed by a guessed dependency is resolved with
+    a warning."""
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger("pycopancore.model_components.base."
+                               "model_logics")
+    logger.addHandler(handler)
+
+    def make_processes(I):
+        def set_beta(self, unused_t):
+            # (the guessed dependency on gamma closes the cycle)
+            self.beta = self.gamma
+
+        return [
+            Explicit("beta", [I.beta], set_beta),
+            Explicit("gamma", [I.gamma], [I.beta + I.alpha]),
+        ]
+    Model = make_model(make_processes)
+    Model.configure()
+    warnings = [r.getMessage() for r in records
+                if r.levelno == logging.WARNING
+                and "to resolve the cycle" in r.getMessage()]
+    assert len(warnings) == 1
+    assert "Ignoring the guessed dependency of beta" in warnings[0]
+    assert not Model.explicit_processes_ordered
+    # (the guesses may include Variables of the base component, so only
+    # the order is certain:)
+    levels = levels_of(Model)
+    assert levels["beta"] < levels["gamma"]
+
+
+def test_levels():
+    """Dependency chains give one level per link."""
+    run_in_fresh_process(__name__, "check_levels")
+
+
+def test_independent_processes_share_a_level():
+    """Processes without mutual dependencies share a level."""
+    run_in_fresh_process(__name__,
+                         "check_independent_processes_share_a_level")
+
+
+def test_declared_cycle_raises():
+    """A cycle of declared dependencies raises a ConfigureError."""
+    run_in_fresh_process(__name__, "check_declared_cycle_raises")
+
+
+def test_guessed_cycle_warns():
+    """A cycle closed by a guessed dependency configures with a
+    warning."""
+    run_in_fresh_process(__name__, "check_guessed_cycle_warns")
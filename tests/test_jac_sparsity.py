@@ -0,0 +1,78 @@
+"""Test file for the Jacobian sparsity pattern derived by the runner."""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import numpy as np
+
+import pycopancore.models.coccon.carboncycle as M
+from pycopancore import master_data_model as D
+from pycopancore.runners import Runner
+
+from . import run_in_fresh_process
+
+
+def finite_difference_jacobian(runner, t, y):
+    """Return the Jacobian of the runner's RHS by forward differences."""
+    f0 = runner.get_rhs_array(t, y)
+    jac = np.zeros((y.size, y.size))
+    for j in range(y.size):
+        h = 1e-6 * max(1, abs(y[j]))
+        y2 = y.copy()
+        y2[j] += h
+        jac[:, j] = (runner.get_rhs_array(t, y2) - f0) / h
+    return jac
+
+
+def make_population(n_cells=5):
+    """Create a World with some SocialSystems and Cells."""
+    world = M.World(environment=M.Environment(), metabolism=M.Metabolism(),
+                    culture=M.Culture(),
+                    atmospheric_carbon=830 * D.gigatonnes_carbon,
+                    upper_ocean_carbon=1065 * D.gigatonnes_carbon)
+    social_systems = [M.SocialSystem(world=world) for s in range(2)]
+    cells = [M.Cell(social_system=social_systems[c % 2])
+             for c in range(n_cells)]
+    r = np.random.uniform(.5, 1, size=len(cells))
+    M.Cell.land_area.set_values(cells, 3e7 * D.square_kilometers * r)
+    M.Cell.terrestrial_carbon.set_values(cells, 500 * D.gigatonnes_carbon * r)
+    M.Cell.fossil_carbon.set_values(cells, 200 * D.gigatonnes_carbon * r)
+
+
+def value_array(runner):
+    """Return the current value array of the runner's last interval."""
+    target_variables = runner._target_variables
+    y = np.zeros(sum(var._to - var._from for var in target_variables))
+    for var in target_variables:
+        y[var._from:var._to] = var.eval(instances=var.owning_class.instances)
+    return y
+
+
+def check_sparsity_covers_finite_differences():
+    """Check that every nonzero finite-difference derivative lies in the
+    pattern."""
+    model = M.Model()
+    make_population()
+    runner = Runner(model=model)
+    # a short run determines the layout of the value array:
+    runner.run(t_0=2000, t_1=2001, dt=1, solver="BDF")
+    y = value_array(runner)
+
+    sparsity = runner.get_jac_sparsity(runner._target_variables).toarray()
+    jac = finite_difference_jacobian(runner, 2001, y)
+    nonzero = np.abs(jac) > 1e-12 * np.abs(jac).max()
+    assert nonzero.any()
+    assert not (nonzero & (sparsity == 0)).any()
+    # the pattern is actually sparse:
+    assert sparsity.sum() < sparsity.size
+
+
+def test_sparsity_covers_finite_differences():
+    """Every nonzero finite-difference derivative lies in the pattern."""
+    run_in_fresh_process(__name__, "check_sparsity_covers_finite_differences")
@@ -0,0 +1,187 @@
+"""Test file for the runner's cache of the ODE value array layout."""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import logging
+import os
+import pickle
+from types import SimpleNamespace
+
+import numpy as np
+
+from pycopancore import ODE, Event, Variable
+from pycopancore.model_components import base
+from pycopancore.model_components.base import interface as B
+from pycopancore.private import _StructureVersion
+from pycopancore.runners import Runner
+
+from . import run_in_fresh_process
+
+
+def make_model():
+    """Return a namespace of a Model and its entity types and process taxa.
+
+    Cells have a stock growing with their share of the World's land area,
+    and the World replaces its oldest Cell by two new ones every two time
+    units and halves all stocks every time unit."""
+
+    class ModelInterface(object):
+        name = "restructuring"
+        description = "Cells replaced by an Event"
+        requires = []
+
+    class WorldInterface(object):
+        pass
+
+    class CellInterface(object):
+        stock = Variable("stock", "stock", default=0.0)
+
+    class WorldMixin(WorldInterface):
+
+        def next_restructuring(self, t):
+            return t + 2
+
+        def restructure(self, unused_t):
+            cells = sorted((cell for cell in self.cells if cell.is_active),
+                           key=lambda cell: cell._uid)
+            oldest = cells[0]
+            for i in range(2):
+                type(oldest)(social_system=oldest.social_system,
+                             land_area=(len(cells) + i) * oldest.land_area,
+                             stock=oldest.stock)
+            oldest.deactivate()
+
+        def next_harvest(self, t):
+            return t + 1
+
+        def harvest(self, unused_t):
+            for cell in self.cells:
+                cell.stock = cell.stock / 2
+
+        processes = [
+            Event("restructure", [B.World.cells],
+                  ["time", next_restructuring, restructure]),
+            Event("harvest", [B.World.cells],
+                  ["time", next_harvest, harvest]),
+        ]
+
+    class CellMixin(CellInterface):
+        processes = [
+            ODE("growth", [CellInterface.stock],
+                [B.Cell.land_area / B.Cell.world.sum.cells.land_area
+                 - CellInterface.stock / 2]),
+        ]
+
+    class ModelMixin(ModelInterface):
+        entity_types = [WorldMixin, CellMixin]
+        process_taxa = []
+
+    class World(WorldMixin, base.World):
+        pass
+
+    class SocialSystem(base.SocialSystem):
+        pass
+
+    class Cell(CellMixin, base.Cell):
+        pass
+
+    class Individual(base.Individual):
+        pass
+
+    class Environment(base.Environment):
+        pass
+
+    class Metabolism(base.Metabolism):
+        pass
+
+    class Culture(base.Culture):
+        pass
+
+    class Model(ModelMixin, base.Model):
+        name = "restructuring"
+        description = "base component with Cells replaced by an Event"
+        entity_types = [World, SocialSystem, Cell, Individual]
+        process_taxa = [Environment, Metabolism, Culture]
+
+    return SimpleNamespace(Model=Model, World=World,
+                           SocialSystem=SocialSystem, Cell=Cell,
+                           Environment=Environment, Metabolism=Metabolism,
+                           Culture=Culture)
+
+
+def run_and_save(filename, cached):
+    """Run the model with or without caching layouts and pickle the
+    arguments and results of all RHS evaluations, the recorded stocks and
+    the number of layouts determined."""
+    if not cached:
+        # (nan differs from every version, so that all layouts derived
+        # from the structure are determined anew each time:)
+        _StructureVersion.value = float("nan")
+    M = make_model()
+    model = M.Model()
+    world = M.World(environment=M.Environment(), metabolism=M.Metabolism(),
+                    culture=M.Culture())
+    social_system = M.SocialSystem(world=world)
+    for i in range(3):
+        M.Cell(social_system=social_system, land_area=i + 1., stock=1.)
+
+    messages = []
+    handler = logging.Handler()
+    handler.emit = lambda record: messages.append(record.getMessage())
+    logger = logging.getLogger("pycopancore.runners.runner")
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+
+    runner = Runner(model=model)
+    rhs = []
+    get_rhs_array = runner.get_rhs_array
+
+    def recording_get_rhs_array(t, value_array):
+        result = get_rhs_array(t, value_array)
+        rhs.append((t, np.array(value_array), np.array(result)))
+        return result
+    runner.get_rhs_array = recording_get_rhs_array
+    traj = runner.run(t_0=0, t_1=7, dt=.5)
+
+    stocks = {cell._uid: values
+              for cell, values in traj[M.Cell.stock].items()}
+    with open(filename, "wb") as f:
+        pickle.dump(dict(rhs=rhs, stocks=stocks, times=list(traj["t"]),
+                         n_layouts=messages.count(
+                             "    Determining array layout...")), f)
+
+
+def test_structure_change_in_event(tmp_path):
+    """After an Event changed the instance structure, RHS evaluations and
+    recorded values equal those of a run without cached layouts."""
+    results = {}
+    for cached in (True, False):
+        filename = os.path.join(str(tmp_path), "{}.pickle".format(cached))
+        run_in_fresh_process(__name__, "run_and_save", filename, cached)
+        with open(filename, "rb") as f:
+            results[cached] = pickle.load(f)
+    cached, uncached = results[True], results[False]
+
+    # the layout changed, but was not determined anew in every interval:
+    sizes = set(len(y) for t, y, dydt in cached["rhs"])
+    assert len(sizes) > 1
+    assert 1 < cached["n_layouts"] < uncached["n_layouts"]
+
+    assert len(cached["rhs"]) == len(uncached["rhs"])
+    for (t, y, dydt), (t2, y2, dydt2) in zip(cached["rhs"], uncached["rhs"]):
+        assert t == t2
+        np.testing.assert_array_equal(y, y2)
+        np.testing.assert_array_equal(dydt, dydt2)
+    assert cached["times"] == uncached["times"]
+    assert cached["stocks"].keys() == uncached["stocks"].keys()
+    for uid, values in cached["stocks"].items():
+        np.testing.assert_array_equal(np.array(values, dtype=float),
+                                      np.array(uncached["stocks"][uid],
+                                               dtype=float))
@@ -0,0 +1,95 @@
+"""Test file for the delta encoding of network trajectories."""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import json
+import pickle
+
+import networkx as nx
+import numpy as np
+
+from pycopancore.private import _TrajectoryRecorder
+from pycopancore.private._network_trajectory import _graphs, graph_at
+
+
+def change(graph, rng):
+    """Change graph randomly (or not at all), adding nodes and edges
+    (including self-loops) among the nodes 0 to 7 or removing some."""
+    action = rng.integers(6)
+    if action == 1:
+        graph.add_node(int(rng.integers(8)))
+    elif action == 2 and graph.number_of_nodes():
+        graph.remove_node(rng.choice(list(graph.nodes())))
+    elif action == 3:
+        graph.add_edge(*(int(node) for node in rng.integers(8, size=2)))
+    elif action == 4:
+        node = int(rng.integers(8))
+        graph.add_edge(node, node)
+    elif action == 5 and graph.number_of_edges():
+        edges = list(graph.edges())
+        graph.remove_edge(*edges[rng.integers(len(edges))])
+
+
+def structure(graph):
+    """Return whether graph is directed and its sets of nodes and edges,
+    with nodes as strings (as in a saved network log)."""
+    if graph is None:
+        return None
+    edges = set((str(u), str(v)) for u, v in graph.edges())
+    if not graph.is_directed():
+        edges = set(frozenset(edge) for edge in edges)
+    return (graph.is_directed(), set(str(node) for node in graph.nodes()),
+            edges)
+
+
+def test_round_trip():
+    """Graphs rebuilt from the recorded states and from a saved and loaded
+    network log equal the recorded ones, also after gaps and with
+    self-loops."""
+    rng = np.random.default_rng(0)
+    recorder = _TrajectoryRecorder(capacity=4, keyframe_interval=3)
+    trajectory = recorder["network"]
+    graphs = {"undirected": nx.Graph([(0, 1), (1, 1)]),
+              "directed": nx.DiGraph([(0, 1), (1, 0), (2, 2)])}
+    expected = {name: [] for name in graphs}
+    for index in range(80):
+        recorder.append_time(float(index))
+        for name, graph in graphs.items():
+            change(graph, rng)
+            if 10 <= index < 13 or rng.random() < .1:
+                # a gap, e.g. while the owner is inactive:
+                trajectory.pad([name])
+                expected[name].append(None)
+            else:
+                trajectory.record([name], [graph])
+                expected[name].append(graph.copy())
+
+    for name in graphs:
+        states = [structure(graph) for graph in expected[name]]
+        assert None in states
+        # (some states have self-loops:)
+        assert any(len(set(edge)) == 1 for state in states
+                   if state is not None for edge in state[2])
+        assert [structure(graph)
+                for graph in _graphs(trajectory._states(name))] == states
+        assert [structure(graph) for graph in trajectory[name]] == states
+        assert [structure(trajectory.graph(name, index))
+                for index in range(len(states))] == states
+
+        # (as pickled in a checkpoint:)
+        copy = pickle.loads(pickle.dumps(recorder))["network"]
+        assert [structure(graph) for graph in copy[name]] == states
+
+        # (as saved by _TrajectoryDictionary.save() and loaded again:)
+        log = json.loads(json.dumps(trajectory.network_log(name)))
+        assert log["directed"] == (name == "directed")
+        assert len(log["keyframes"]) > 1 and log["changes"]
+        assert [structure(graph_at(log, index))
+                for index in range(len(states))] == states
@@ -0,0 +1,107 @@
+"""Test file for parameter sweeps."""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import os
+
+import numpy as np
+
+import pycopancore.models.seven_dwarfs as M
+from pycopancore.runners.sweep import Sweep, parameter_grid
+
+from . import run_in_fresh_process
+
+built = []
+"""parameter combinations of the models built in this process"""
+
+
+def build_dwarfs(parameters):
+    """Build the seven dwarfs model with dwarfs of the given age, raising
+    a ValueError for a negative age."""
+    built.append(parameters)
+    if parameters["age"] < 0:
+        raise ValueError("negative age")
+    model = M.Model()
+    culture = M.Culture()
+    world = M.World(culture=culture)
+    social_system = M.SocialSystem(world=world)
+    cell = M.Cell(social_system=social_system,
+                  eating_stock=parameters["eating_stock"])
+    for i in range(7):
+        M.Individual(cell=cell, age=parameters["age"], beard_length=0,
+                     beard_growth_parameter=0.5, eating_parameter=.1)
+    return model
+
+
+def make_sweep(directory=None):
+    """Return a sweep over ages and eating stocks whose third task
+    fails."""
+    parameters = parameter_grid(age=[20, 40], eating_stock=[10, 100])
+    parameters.insert(2, dict(age=-1, eating_stock=100))
+    return Sweep(build_dwarfs, parameters, seed=5,
+                 run_kwargs=dict(t_1=5, dt=.1), directory=directory)
+
+
+def assert_same_results(results, expected):
+    """Assert that two lists of task outputs are equal."""
+    assert len(results) == len(expected)
+    for arrays, expected_arrays in zip(results, expected):
+        if expected_arrays is None:
+            assert arrays is None
+            continue
+        assert arrays.keys() == expected_arrays.keys()
+        for name in arrays:
+            np.testing.assert_array_equal(arrays[name],
+                                          expected_arrays[name],
+                                          err_msg=name)
+
+
+def check_workers_and_errors():
+    """Check that the outputs do not depend on the number of workers and
+    that only the failing tasks are reported as failed."""
+    sweep = make_sweep()
+    serial = sweep.run(workers=0)
+    assert list(sweep.errors) == [2]
+    assert "negative age" in sweep.errors[2]
+    assert [arrays is None for arrays in serial] == [
+        False, False, True, False, False]
+
+    sweep = make_sweep()
+    parallel = sweep.run(workers=2)
+    assert list(sweep.errors) == [2]
+    assert_same_results(parallel, serial)
+
+
+def check_resume(directory):
+    """Check that running a sweep again only runs its missing and failed
+    tasks."""
+    sweep = make_sweep(directory)
+    first = sweep.run(workers=0)
+    assert list(sweep.errors) == [2]
+    # remove one task's output as if the sweep had been interrupted:
+    os.remove(os.path.join(directory, "task_%06d.npz" % 4))
+
+    del built[:]
+    sweep = make_sweep(directory)
+    second = sweep.run(workers=0)
+    assert built == [sweep.parameters[2], sweep.parameters[4]]
+    assert list(sweep.errors) == [2]
+    assert_same_results(second, first)
+
+
+def test_workers_and_errors():
+    """Outputs do not depend on the number of workers, and only failing
+    tasks are reported as failed."""
+    run_in_fresh_process(__name__, "check_workers_and_errors")
+
+
+def test_resume(tmp_path):
+    """Running a sweep again only runs its missing and failed tasks."""
+    run_in_fresh_process(__name__, "check_resume", str(tmp_path / "sweep"))
@@ -0,0 +1,88 @@
+"""Test file for saving and loading trajectories in different formats."""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import pycopancore as pcc
+import pycopancore.models.seven_dwarfs as M
+from pycopancore.private import _TrajectoryDictionary
+from pycopancore.runners import Runner
+
+from . import run_in_fresh_process
+
+
+def save_trajectory(directory, data_types):
+    """Run the seven dwarfs model and save its trajectory in all given
+    formats."""
+    pcc.set_seed(3)
+    model = M.Model()
+    culture = M.Culture()
+    world = M.World(culture=culture)
+    social_system = M.SocialSystem(world=world)
+    cell = M.Cell(social_system=social_system, eating_stock=100)
+    for i in range(7):
+        # (old dwarfs, some of which die, so that values are missing)
+        M.Individual(cell=cell, age=40, beard_length=0,
+                     beard_growth_parameter=0.5, eating_parameter=.1)
+    runner = Runner(model=model, termination_calls=[
+        [M.Culture.check_for_extinction, culture]])
+    traj = runner.run(t_1=10, dt=.1)
+    for data_type in data_types:
+        traj.save(filename="traj", path=directory, data_type=data_type)
+
+
+def number(value):
+    """Return a value as a float, or None if it is missing (the pickle file
+    stores values of Variables with non-float values as strings)."""
+    return None if value is None or value == 'None' else float(value)
+
+
+def assert_same_trajectory(expected, actual):
+    """Assert that a loaded trajectory has the same values as the one
+    loaded from the pickle file."""
+    assert actual['t'] == expected['t']
+    for name, values in expected.items():
+        if name in ('t', 'file-version'):
+            continue
+        if not values:
+            # Variables without any instance may be left out:
+            assert not actual.get(name), name
+            continue
+        assert set(actual[name]) == set(values), name
+        for inst, trajectory in values.items():
+            assert [number(v) for v in actual[name][inst]] \
+                == [number(v) for v in trajectory], (name, inst)
+
+
+def check_round_trip(directory, data_type):
+    """Save a trajectory as pickle and in the given format and compare
+    them after loading."""
+    run_in_fresh_process(__name__, "save_trajectory", directory,
+                         ["pickle", data_type])
+    expected = _TrajectoryDictionary.load(filename="traj", path=directory)
+    actual = _TrajectoryDictionary.load(filename="traj", path=directory,
+                                        data_type=data_type)
+    assert len(expected['t']) > 10
+    assert_same_trajectory(expected, actual)
+
+
+def test_hdf5_round_trip(tmp_path):
+    """A trajectory loaded from HDF5 equals the one loaded from pickle."""
+    check_round_trip(str(tmp_path), "hdf5")
+
+
+def test_npz_round_trip(tmp_path):
+    """A trajectory loaded from npz equals the one loaded from pickle."""
+    check_round_trip(str(tmp_path), "npz")
+
+
+def test_npy_round_trip(tmp_path):
+    """A trajectory loaded from npy files equals the one loaded from
+    pickle."""
+    check_round_trip(str(tmp_path), "npy")
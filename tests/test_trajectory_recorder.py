@@ -0,0 +1,77 @@
+"""Test file for the recording of trajectories in preallocated arrays."""
+
+# This file is part of pycopancore.
+#
+# Copyright (C) 2016-2017 by COPAN team at Potsdam Institute for Climate
+# Impact Research
+#
+# URL: <http://www.pik-potsdam.de/copan/software>
+# Contact: core@pik-potsdam.de
+# License: BSD 2-clause license
+
+import numpy as np
+
+import pycopancore as pcc
+import pycopancore.models.seven_dwarfs as M
+from pycopancore.private import _TrajectoryRecorder
+from pycopancore.runners import Runner
+
+from . import run_in_fresh_process
+
+
+def test_storage_allocated_on_first_record():
+    """Variables take no space until their first value is recorded."""
+    recorder = _TrajectoryRecorder(capacity=4)
+    recorded, unrecorded = recorder["recorded"], recorder["unrecorded"]
+    a, b = object(), object()
+    for t in range(10):
+        recorder.append_time(t)
+        recorded.record([a, b], np.array([t, 2. * t]))
+    recorder.discard(2)
+    assert unrecorded._values.nbytes == unrecorded._valid.nbytes == 0
+    assert len(unrecorded) == 0
+    assert unrecorded.values().shape == unrecorded.mask().shape == (8, 0)
+    assert recorded._values.shape == (16, 16)
+    np.testing.assert_array_equal(recorded.values()[:, 1],
+                                  2. * np.arange(2, 10))
+
+    # a Variable first recorded late gets rows for all time points:
+    late = recorder["late"]
+    late.record([b], [1.5])
+    assert late._values.shape == (16, 16)
+    np.testing.assert_array_equal(late.mask()[:, 0], [False] * 7 + [True])
+    assert late[b] == [None] * 7 + [1.5]
+
+
+def check_unrecorded_variables_take_no_space():
+    """Check that a run allocates storage only for the recorded
+    Variables."""
+    pcc.set_seed(1)
+    model = M.Model()
+    culture = M.Culture()
+    world = M.World(culture=culture)
+    social_system = M.SocialSystem(world=world)
+    cell = M.Cell(social_system=social_system, eating_stock=100)
+    for i in range(7):
+        M.Individual(cell=cell, age=0, beard_length=0,
+                     beard_growth_parameter=0.5, eating_parameter=.1)
+    runner = Runner(model=model, termination_calls=[
+        [M.Culture.check_for_extinction, culture]])
+    runner.run(t_1=10, dt=.1)
+
+    recorder = runner.trajectory_recorder
+    recorded = set(model.process_targets)
+    assert set(recorder.variables) == set(model.variables)
+    assert set(model.variables) - recorded
+    for var, trajectory in recorder.variables.items():
+        if var in recorded:
+            assert trajectory._values.shape[0] == recorder.capacity
+        else:
+            assert len(trajectory) == 0
+            assert trajectory._values.nbytes == 0
+            assert trajectory._valid.nbytes == 0
+
+
+def test_unrecorded_variables_take_no_space():
+    """A run allocates storage only for the recorded Variables."""
+    run_in_fresh_process(__name__, "check_unrecorded_variables_take_no_space")